@@ -0,0 +1,149 @@
+"""
+Multi-step action plans.
+
+The model may answer with an ordered PLAN of buttons, each with an optional
+repeat count and hold duration. The emulator runs the plan from a
+frame-accurate input queue and reports back after every step, and the
+PlanTracker checks each reported frame to stop the plan early once it has
+gone off track.
+"""
+import re
+import itertools
+import PIL.Image
+import PIL.ImageChops
+import PIL.ImageStat
+
+MOVEMENT_BUTTONS = {4, 5, 6, 7}  # RIGHT, LEFT, UP, DOWN
+
+# "UP", "UP x3", "RIGHT hold 20", "DOWN x2 hold 16 frames"
+STEP_PATTERN = re.compile(r"^([A-Z]+)(?:\s*[X*]\s*(\d+))?(?:\s*(?:HOLD|FOR)\s*(\d+)(?:\s*FRAMES?)?)?$")
+
+
+def parse_plan(text, button_map, max_steps=8, default_hold=30, max_repeat=9, max_hold=120):
+    """Parse a PLAN line into a list of (button, hold_frames, repeat) steps
+
+    Returns (steps, invalid) where invalid lists the items that couldn't be
+    parsed. Repeat counts and hold durations are clamped to sane ranges and
+    the plan is cut to max_steps steps.
+    """
+    steps = []
+    invalid = []
+    for item in re.split(r"[,;\n]|->", text.upper()):
+        item = item.strip(" .-*[]\"'")
+        if not item:
+            continue
+        match = STEP_PATTERN.match(item)
+        if not match or match.group(1) not in button_map:
+            invalid.append(item)
+            continue
+        repeat = min(max(int(match.group(2) or 1), 1), max_repeat)
+        hold = min(max(int(match.group(3) or default_hold), 1), max_hold)
+        steps.append((button_map[match.group(1)], hold, repeat))
+    return steps[:max_steps], invalid
+
+
+def describe_plan(steps, button_names, default_hold=30):
+    """Describe a plan the way the model writes it, e.g. 'UP x3, A'"""
+    parts = []
+    for button, hold, repeat in steps:
+        part = button_names.get(button, "UNKNOWN")
+        if repeat > 1:
+            part += f" x{repeat}"
+        if hold != default_hold:
+            part += f" hold {hold}"
+        parts.append(part)
+    return ", ".join(parts)
+
+
+class PlanTracker:
+    """Follows the plan a session's emulator is executing and checks it stays on track
+
+    After each step the emulator sends a frame. A movement step that left the
+    screen unchanged walked into an obstacle, and a frame that is almost a
+    single flat color is a fade (warp, battle start); either way the rest of
+    the plan was made for a situation that no longer holds, so it is aborted.
+    """
+
+    def __init__(self, thumbnail_size=(60, 40), pixel_tolerance=8, moved_ratio=0.01, transition_stddev=6.0):
+        self.thumbnail_size = tuple(thumbnail_size)
+        self.pixel_tolerance = pixel_tolerance
+        self.moved_ratio = moved_ratio
+        self.transition_stddev = transition_stddev
+
+        self.plan_ids = itertools.count(1)
+        self.plan_id = None
+        self.steps = None
+        self.reference = None
+
+        # Counters
+        self.plans_started = 0
+        self.plans_completed = 0
+        self.plans_aborted = 0
+        self.steps_checked = 0
+
+    def thumbnail(self, image):
+        """Downsample a frame to the grayscale thumbnail used for checks"""
+        return image.convert('L').resize(self.thumbnail_size, PIL.Image.BOX)
+
+    def start(self, steps, image):
+        """Track a new plan decided on this frame; returns its ID (1-65535)"""
+        self.plan_id = (next(self.plan_ids) - 1) % 0xFFFF + 1
+        self.steps = steps
+        self.reference = self.thumbnail(image)
+        self.plans_started += 1
+        return self.plan_id
+
+    def clear(self):
+        """Stop tracking; the emulator was sent something that replaces the plan"""
+        self.plan_id = None
+        self.steps = None
+        self.reference = None
+
+    def abort(self):
+        """Stop tracking a plan that was found off track elsewhere"""
+        self.plans_aborted += 1
+        self.clear()
+
+    def check(self, plan_id, steps_done, image):
+        """Check the frame reported after a step; returns (status, reason)
+
+        status is 'continue' while the plan is on track, 'done' after its last
+        step, 'abort' when it went off track and 'stale' for frames from a
+        plan that is no longer tracked.
+        """
+        if self.steps is None or plan_id != self.plan_id or not 1 <= steps_done <= len(self.steps):
+            return 'stale', None
+
+        self.steps_checked += 1
+        thumbnail = self.thumbnail(image)
+        button = self.steps[steps_done - 1][0]
+
+        reason = None
+        if PIL.ImageStat.Stat(thumbnail).stddev[0] < self.transition_stddev:
+            reason = "screen transition"
+        elif button in MOVEMENT_BUTTONS:
+            diff = PIL.ImageChops.difference(thumbnail, self.reference)
+            changed = sum(diff.histogram()[self.pixel_tolerance + 1:])
+            if changed / float(self.thumbnail_size[0] * self.thumbnail_size[1]) <= self.moved_ratio:
+                reason = "no movement"
+
+        if reason and steps_done < len(self.steps):
+            self.abort()
+            return 'abort', reason
+
+        if steps_done == len(self.steps):
+            self.plans_completed += 1
+            self.clear()
+            return 'done', reason
+
+        self.reference = thumbnail
+        return 'continue', None
+
+    def stats(self):
+        """Return plan counters as a dict"""
+        return {
+            'plans_started': self.plans_started,
+            'plans_completed': self.plans_completed,
+            'plans_aborted': self.plans_aborted,
+            'steps_checked': self.steps_checked,
+        }
@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+"""
+Offline replay benchmark for the controller
+
+Replays recorded frames (a directory of PNGs, such as one written with the
+trace_dir setting) or synthetic frames into a real PokemonGameController over
+the socket protocol, with MockGenerativeModel standing in for Gemini. Reports
+decision latency percentiles, decisions per second and file I/O per decision,
+and can compare a run against a saved baseline to catch regressions.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import random
+import shutil
+import argparse
+import builtins
+import logging
+import tempfile
+import difflib
+import threading
+import numpy as np
+import PIL.Image
+import PIL.ImageDraw
+import PIL.ImageFont
+from protocol import (MessageDecoder, MESSAGE_NAMES, MSG_BUTTON, MSG_HELLO, MSG_PLAN, MSG_FRAME_REQUEST,
+                      encode_frame, encode_message)
+from mock_model import MockGenerativeModel, FAST_SCRIPT
+from model_client import percentile
+
+# Replies that end the wait for a frame's outcome
+DECISION_MESSAGES = (MSG_BUTTON, MSG_PLAN)
+
+
+class FileIOCounter:
+    """Counts file opens, bytes written and renames made by this process while installed"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reads = 0
+        self.writes = 0
+        self.bytes_written = 0
+        self.renames = 0
+        self.original_open = builtins.open
+        self.original_replace = os.replace
+
+    def install(self):
+        counter = self
+
+        class CountingFile:
+            """Proxy that counts bytes written through a file object"""
+
+            def __init__(self, f):
+                self._f = f
+
+            def write(self, data):
+                with counter.lock:
+                    counter.bytes_written += len(data)
+                return self._f.write(data)
+
+            def __enter__(self):
+                self._f.__enter__()
+                return self
+
+            def __exit__(self, *exc):
+                return self._f.__exit__(*exc)
+
+            def __iter__(self):
+                return iter(self._f)
+
+            def __getattr__(self, name):
+                return getattr(self._f, name)
+
+        def counting_open(file, mode='r', *args, **kwargs):
+            f = counter.original_open(file, mode, *args, **kwargs)
+            if isinstance(file, int):
+                return f
+            with counter.lock:
+                if any(flag in mode for flag in 'wax+'):
+                    counter.writes += 1
+                else:
+                    counter.reads += 1
+            return CountingFile(f) if any(flag in mode for flag in 'wax+') else f
+
+        def counting_replace(src, dst, *args, **kwargs):
+            with counter.lock:
+                counter.renames += 1
+            return counter.original_replace(src, dst, *args, **kwargs)
+
+        builtins.open = counting_open
+        os.replace = counting_replace
+
+    def uninstall(self):
+        builtins.open = self.original_open
+        os.replace = self.original_replace
+
+
+def load_trace(path):
+    """Load a trace: PNGs in a directory, or one subdirectory of PNGs per session"""
+    def load_dir(directory):
+        frames = []
+        for name in sorted(os.listdir(directory)):
+            if name.lower().endswith('.png'):
+                image = PIL.Image.open(os.path.join(directory, name))
+                frames.append(image.convert('RGBX'))
+        return frames
+
+    subdirs = sorted(name for name in os.listdir(path) if os.path.isdir(os.path.join(path, name)))
+    if subdirs:
+        return [load_dir(os.path.join(path, name)) for name in subdirs]
+    return [load_dir(path)]
+
+
+def draw_dialogue(frame, rng):
+    """Draw a Fire Red style text box with two lines of scribbled text at the bottom of a frame"""
+    draw = PIL.ImageDraw.Draw(frame)
+    draw.rectangle((2, 112, 237, 157), fill=(255, 255, 255), outline=(96, 96, 112), width=3)
+    for line_y in (122, 138):
+        x = 14
+        while x < rng.randrange(120, 220):
+            draw.rectangle((x, line_y, x + rng.randrange(2, 6), line_y + 10), fill=(72, 72, 72))
+            x += rng.randrange(6, 10)
+
+
+def synthetic_trace(count, seed, dialogue_every=0):
+    """Generate a deterministic random walk over a tiled map, GBA-sized, with some repeated screens
+
+    With dialogue_every, every dialogue_every-th frame shows a text box.
+    """
+    rng = random.Random(seed)
+    colors = [(rng.randrange(0, 256, 8), rng.randrange(0, 256, 8), rng.randrange(0, 256, 8)) for _ in range(12)]
+    tiles = []
+    for color in colors:
+        tile = PIL.Image.new('RGB', (16, 16), color)
+        draw = PIL.ImageDraw.Draw(tile)
+        draw.rectangle((4, 4, 11, 11), outline=tuple(255 - c for c in color))
+        tiles.append(tile)
+    world = [[rng.randrange(len(tiles)) for _ in range(48)] for _ in range(48)]
+
+    frames = []
+    x, y = 24, 24
+    for _ in range(count):
+        dx, dy = rng.choice([(0, 0), (1, 0), (-1, 0), (0, 1), (0, -1)])
+        x = min(max(x + dx, 8), 39)
+        y = min(max(y + dy, 5), 42)
+        frame = PIL.Image.new('RGB', (240, 160))
+        for row in range(10):
+            for col in range(15):
+                frame.paste(tiles[world[y - 5 + row][x - 7 + col]], (col * 16, row * 16))
+        PIL.ImageDraw.Draw(frame).ellipse((112, 72, 127, 87), fill=(240, 40, 40))
+        if dialogue_every and len(frames) % dialogue_every == dialogue_every - 1:
+            draw_dialogue(frame, rng)
+        frames.append(frame.convert('RGBX'))
+    return frames
+
+
+FIXTURE_WORDS = ("hello there welcome to the world of POKeMON my name is OAK people call me the professor "
+                 "this world is inhabited by creatures called for some people are used as pets others use "
+                 "them fights myself study a profession RED your very own legend about unfold dreams "
+                 "adventures with await let's go! Wait, what's that? 151 PokeDex 3x BAG SAVE OPTION").split()
+FIXTURE_CHARSET = ("ABCDEFGHIJKLM", "NOPQRSTUVWXYZ", "abcdefghijklm", "nopqrstuvwxyz", "0123456789",
+                   ".,!?'-:;()/&#")
+
+
+def render_text(frame, lines, font):
+    """Draw a text box with lines of text the way Fire Red does: proportional glyphs one pixel apart"""
+    draw = PIL.ImageDraw.Draw(frame)
+    draw.rectangle((2, 112, 237, 157), fill=(255, 255, 255), outline=(96, 96, 112), width=3)
+    for number, line in enumerate(lines):
+        x, y = 14, 119 + number * 16
+        for char in line:
+            mask = font.getmask(char)
+            columns = np.flatnonzero((np.array(mask).reshape(mask.size[1], mask.size[0]) > 0).any(axis=0))
+            if char == ' ' or not len(columns):
+                x += 4
+                continue
+            draw.text((x - columns[0] + 1, y + 1), char, font=font, fill=(208, 208, 200))  # Drop shadow
+            draw.text((x - columns[0], y), char, font=font, fill=(96, 96, 96))
+            x += columns[-1] - columns[0] + 2
+
+
+def evaluate_ocr(count, seed):
+    """Learn a glyph table from charset frames, then read text boxes with random text
+
+    The fixture frames use Pillow's built-in bitmap font drawn like Fire Red
+    draws its own, over synthetic overworld frames.
+    """
+    from ocr import GlyphTable, TextReader
+
+    font = PIL.ImageFont.load_default_imagefont()
+    rng = random.Random(seed)
+    backgrounds = [frame.convert('RGB') for frame in synthetic_trace(count, seed)]
+    reader = TextReader(GlyphTable(line_height=12, baseline=9))
+    for first, second in zip(FIXTURE_CHARSET[::2], FIXTURE_CHARSET[1::2]):
+        frame = backgrounds[0].copy()
+        render_text(frame, (first, second), font)
+        reader.learn(frame, f"{first}|{second}")
+
+    exact = 0
+    similarity = 0.0
+    for background in backgrounds:
+        lines = []
+        for _ in range(2):
+            words = []
+            while len(" ".join(words)) < 26:
+                words.append(rng.choice(FIXTURE_WORDS))
+            lines.append(" ".join(words))
+        frame = background.copy()
+        render_text(frame, lines, font)
+        text = reader.read(frame.convert('RGBX'))
+        expected = "\n".join(lines)
+        exact += text == expected
+        similarity += difflib.SequenceMatcher(None, expected, text).ratio()
+
+    stats = reader.stats()
+    return {
+        'frames': count,
+        'glyphs_learned': len(reader.table),
+        'exact_frames': exact / count,
+        'char_accuracy': similarity / count,
+        'unknown_glyphs': stats['unknown'],
+        'avg_ms': stats['avg_ms'],
+    }
+
+
+def replay_session(name, frames, port, timeout, results):
+    """Play one emulator: send each frame and wait for the controller's reply"""
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.settimeout(timeout)
+    decoder = MessageDecoder()
+    sock.sendall(encode_message(MSG_HELLO, name))
+
+    for frame in frames:
+        start = time.perf_counter()
+        sock.sendall(encode_frame(frame.width, frame.height, frame.tobytes()))
+        outcome = 'timeout'
+        try:
+            while outcome == 'timeout':
+                data = sock.recv(65536)
+                if not data:
+                    outcome = 'closed'
+                    break
+                for message_type, _ in decoder.feed(data):
+                    if message_type in DECISION_MESSAGES:
+                        outcome = MESSAGE_NAMES[message_type]
+                    elif message_type == MSG_FRAME_REQUEST and outcome == 'timeout':
+                        outcome = 'no input'
+        except socket.timeout:
+            pass
+        results.append((outcome, time.perf_counter() - start))
+        if outcome == 'closed':
+            break
+
+    sock.close()
+
+
+def run_benchmark(args):
+    """Run the controller against the replayed sessions and return the report as a dict"""
+    if args.trace:
+        traces = load_trace(os.path.abspath(args.trace))
+    else:
+        traces = [synthetic_trace(args.frames, args.seed + i, args.dialogue_every) for i in range(args.sessions)]
+    if args.frames:
+        traces = [trace[:args.frames] for trace in traces]
+    # Re-use recorded sessions round-robin when more sessions are requested
+    traces = [traces[i % len(traces)] for i in range(max(args.sessions, len(traces)))]
+
+    responses = MockGenerativeModel.load_script(args.responses) if args.responses else None
+    model = MockGenerativeModel(responses, latency=args.latency, jitter=args.jitter, seed=args.seed,
+                                failure_rate=args.failure_rate, slow_rate=args.slow_rate,
+                                slow_latency=args.slow_latency)
+    fast_model = None
+    if args.cascade:
+        fast_model = MockGenerativeModel(FAST_SCRIPT, latency=args.latency * args.fast_speedup,
+                                         jitter=args.jitter * args.fast_speedup, seed=args.seed + 100000)
+
+    work_dir = tempfile.mkdtemp(prefix="pokemon-bench-")
+    config = {
+        'api_key': 'offline',
+        'model_name': 'mock',
+        'host': '127.0.0.1',
+        'port': args.port,
+        'notepad_path': os.path.join(work_dir, 'notepad.txt'),
+        'screenshot_path': os.path.join(work_dir, 'data', 'screenshots', 'screenshot.png'),
+        'decision_cooldown': 0,
+        'debug_mode': False,
+        'prompt_cache_mode': 'local',
+        'decision_cache_path': os.path.join(work_dir, 'data', 'decision_cache.json'),
+        'sessions_dir': os.path.join(work_dir, 'data', 'sessions'),
+    }
+    if args.cascade:
+        config['cascade_model_name'] = 'mock-fast'
+    for setting in args.set:
+        key, _, value = setting.partition('=')
+        try:
+            config[key] = json.loads(value)
+        except ValueError:
+            config[key] = value
+    config_path = os.path.join(work_dir, 'config.json')
+    with open(config_path, 'w') as f:
+        json.dump(config, f)
+
+    # Import late so the controller's logger and model client are only set up for a real run
+    from controller import PokemonGameController
+
+    # Run inside the work directory so the controller's log file lands there too
+    original_cwd = os.getcwd()
+    os.chdir(work_dir)
+    io_counter = FileIOCounter()
+    io_counter.install()
+    try:
+        controller = PokemonGameController(config_path, model=model, fast_model=fast_model)
+        if args.quiet:
+            logging.getLogger("Pokemon_AI").setLevel(logging.WARNING)
+        server_thread = threading.Thread(target=controller.start, name="controller", daemon=True)
+        server_thread.start()
+        while controller.server is None and server_thread.is_alive():
+            time.sleep(0.01)
+
+        results = []
+        start = time.perf_counter()
+        clients = [
+            threading.Thread(target=replay_session, args=(f"bench{i}", frames, args.port, args.timeout, results))
+            for i, frames in enumerate(traces)
+        ]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - start
+
+        component_stats = {
+            'prompt_cache': controller.prompt_cache.stats(),
+            'token_budget': controller.token_budget.stats(),
+            'image_pipeline': controller.image_pipeline.stats(),
+            'decision_cache': controller.decision_cache.stats() if controller.decision_cache else None,
+            'state_writer': controller.state_writer.stats(),
+            'movement': controller.movement.stats(),
+            'navigation': controller.map_memory.stats() if controller.map_memory else None,
+            'screen_classifier': controller.screen_classifier.stats() if controller.screen_classifier else None,
+            'model': model.stats(),
+            'model_client': controller.model_client.stats(),
+            'cascade': controller.cascade.stats() if controller.cascade else None,
+            'fast_model': fast_model.stats() if fast_model else None,
+            'metrics': controller.metrics.stats() if controller.metrics.enabled else None,
+        }
+
+        # Stopping flushes pending state writes, which count towards file I/O
+        controller.stop()
+        server_thread.join(timeout=30)
+    finally:
+        io_counter.uninstall()
+        os.chdir(original_cwd)
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    latencies = [latency for outcome, latency in results if outcome in ('button', 'plan')]
+    decisions = len(latencies)
+    per_decision = decisions or 1
+    return {
+        'sessions': len(traces),
+        'frames': len(results),
+        'decisions': decisions,
+        'no_input': sum(1 for outcome, _ in results if outcome == 'no input'),
+        'timeouts': sum(1 for outcome, _ in results if outcome in ('timeout', 'closed')),
+        'elapsed': elapsed,
+        'decisions_per_sec': decisions / elapsed if elapsed else 0.0,
+        'latency': {
+            'p50': percentile(latencies, 0.50),
+            'p90': percentile(latencies, 0.90),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'max': max(latencies) if latencies else 0.0,
+        },
+        'file_io_per_decision': {
+            'reads': io_counter.reads / per_decision,
+            'writes': io_counter.writes / per_decision,
+            'renames': io_counter.renames / per_decision,
+            'bytes_written': io_counter.bytes_written / per_decision,
+        },
+        'components': component_stats,
+    }
+
+
+def print_report(report):
+    latency = report['latency']
+    io = report['file_io_per_decision']
+    print()
+    print("Benchmark results")
+    print("-----------------")
+    print(f"Sessions: {report['sessions']}, frames: {report['frames']}, decisions: {report['decisions']}, "
+          f"no input: {report['no_input']}, timeouts: {report['timeouts']}")
+    print(f"Decision latency: p50 {latency['p50'] * 1000:.0f}ms, p90 {latency['p90'] * 1000:.0f}ms, "
+          f"p95 {latency['p95'] * 1000:.0f}ms, p99 {latency['p99'] * 1000:.0f}ms, max {latency['max'] * 1000:.0f}ms")
+    print(f"Throughput: {report['decisions_per_sec']:.2f} decisions/sec over {report['elapsed']:.1f}s")
+    print(f"File I/O per decision: {io['reads']:.2f} reads, {io['writes']:.2f} writes, "
+          f"{io['renames']:.2f} renames, {io['bytes_written'] / 1024:.1f} KB written")
+    for name, stats in report['components'].items():
+        if stats:
+            print(f"{name}: {json.dumps(stats, default=str)}")
+
+
+def compare(report, baseline, tolerance):
+    """Return the metrics that regressed by more than tolerance against the baseline"""
+    checks = [
+        ('latency p50', report['latency']['p50'], baseline['latency']['p50'], True),
+        ('latency p95', report['latency']['p95'], baseline['latency']['p95'], True),
+        ('decisions/sec', report['decisions_per_sec'], baseline['decisions_per_sec'], False),
+        ('file writes/decision', report['file_io_per_decision']['writes'],
+         baseline['file_io_per_decision']['writes'], True),
+        ('bytes written/decision', report['file_io_per_decision']['bytes_written'],
+         baseline['file_io_per_decision']['bytes_written'], True),
+    ]
+    regressions = []
+    for name, value, base, lower_is_better in checks:
+        if not base:
+            continue
+        change = (value - base) / base
+        if (change if lower_is_better else -change) > tolerance:
+            regressions.append(f"{name}: {base:.4g} -> {value:.4g} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay frames into the controller with a mock Gemini model")
+    parser.add_argument("--trace", help="Directory of recorded PNG frames (or one subdirectory per session)")
+    parser.add_argument("--frames", type=int, default=50, help="Frames per session (synthetic length or trace cut-off)")
+    parser.add_argument("--sessions", type=int, default=1, help="Number of emulators to replay concurrently")
+    parser.add_argument("--latency", type=float, default=0.5, help="Mock model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Mock model latency jitter in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of mock model calls that fail")
+    parser.add_argument("--slow-rate", type=float, default=0.0,
+                        help="Fraction of mock model calls that take --slow-latency (a long latency tail)")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="Latency of slow mock model calls in seconds")
+    parser.add_argument("--cascade", action="store_true",
+                        help="Add a fast mock model tier (scripted with confidences) in front of the main one")
+    parser.add_argument("--fast-speedup", type=float, default=0.3,
+                        help="Latency of the fast tier as a fraction of --latency")
+    parser.add_argument("--responses", help="Response script: JSON list or text with replies separated by ---")
+    parser.add_argument("--dialogue-every", type=int, default=0,
+                        help="Show a text box on every Nth synthetic frame (exercises the screen fast path)")
+    parser.add_argument("--ocr", action="store_true",
+                        help="Instead of a replay, measure dialogue OCR accuracy and cost on fixture frames")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for synthetic frames and mock latency")
+    parser.add_argument("--port", type=int, default=18888, help="Port for the controller under test")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for a reply to a frame")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="Override a controller setting (JSON value), e.g. --set prompt_cache_mode='\"off\"'")
+    parser.add_argument("--json", help="Write the report as JSON to this file")
+    parser.add_argument("--baseline", help="Compare against a report saved with --json")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression against the baseline")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary state directory")
+    parser.add_argument("--quiet", action="store_true", help="Only show controller warnings and errors")
+    args = parser.parse_args()
+
+    if args.ocr:
+        report = evaluate_ocr(args.frames, args.seed)
+        print(f"OCR on {report['frames']} fixture frames ({report['glyphs_learned']} glyphs learned): "
+              f"{report['exact_frames']:.1%} read exactly, {report['char_accuracy']:.1%} character accuracy, "
+              f"{report['unknown_glyphs']} unknown glyphs, {report['avg_ms']:.2f}ms per text box")
+        return 0
+
+    report = run_benchmark(args)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\nNo regressions against baseline")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import os
 import socket
+import asyncio
 import time
 import threading
 import json
@@ -8,12 +9,109 @@ import re
 import PIL.Image
 import google.generativeai as genai
 import signal
-import sys
 import atexit
+from concurrent.futures import ThreadPoolExecutor
 from pokemon_logger import PokemonLogger
+from frame_diff import perceptual_hash
+from decision_cache import DecisionCache, notepad_digest, frame_digest
+from protocol import (MessageDecoder, ProtocolError, MESSAGE_NAMES, MSG_FRAME, MSG_HELLO, MSG_SCREENSHOT,
+                      MSG_PLAN_PROGRESS, MSG_GAME_STATE, decode_frame, decode_plan_progress, encode_button,
+                      encode_frame_request, encode_plan, encode_plan_abort)
+from session import GameSession, BUTTON_NAMES, DEFAULT_SESSION_ID, encode_png
+from notepad_summarizer import NotepadSummarizer
+from write_behind import WriteBehindWriter
+from prompts import PromptCache, build_dynamic_prompt
+from token_budget import TokenBudget
+from image_pipeline import ImagePipeline
+from action_plan import parse_plan, describe_plan
+from metrics import Metrics, NULL_TIMER
+from game_state import GameState
+from movement import MovementDetector
+from navigation import MapMemory, NavigationTask, parse_goal, describe_goal
+from screen_classifier import ScreenClassifier
+from ocr import GlyphTable, TextReader, new_lines
+from model_client import ModelClient
+from model_cascade import ModelCascade
+
+# Optional settings and their defaults, applied on top of config.json
+DEFAULT_SETTINGS = {
+    'thinking_history_max_chars': 20000,   # Maximum characters in thinking history before trimming
+    'thinking_history_keep_entries': 5,    # Number of recent thinking entries to keep when trimming
+    'thinking_history_log_max_chars': 100000,  # Compact the thinking history log above this size
+    'frame_diff_enabled': True,            # Skip LLM calls when the screen hasn't changed
+    'frame_diff_mode': 'skip',             # 'skip' sends nothing, 'reuse' re-sends the previous button
+    'frame_diff_pixel_tolerance': 8,       # Per-pixel grayscale difference (0-255) ignored as noise
+    'frame_diff_changed_ratio': 0.01,      # Max fraction of changed pixels for a frame to count as unchanged
+    'frame_diff_max_skips': 3,             # Force a decision after this many consecutive skipped frames
+    'decision_cache_enabled': True,        # Re-use decisions for screens we've already seen in the same context
+    'decision_cache_path': 'data/decision_cache.json',
+    'decision_cache_max_entries': 1000,    # LRU capacity
+    'decision_cache_ttl': 86400,           # Seconds before a cached decision expires
+    'decision_cache_notepad_chars': 500,   # Trailing notepad characters included in the cache key
+    'model_workers': 16,                   # Threads for blocking model calls and file I/O
+    'max_concurrent_llm_requests': 8,      # In-flight LLM requests shared by all sessions
+    'model_rate_limit': 10.0,              # Model requests per second across all sessions (token bucket), 0 for no limit
+    'model_rate_burst': 10,                # Requests that may go out at once before the rate limit applies
+    'model_timeout': 30.0,                 # Deadline of a model call, retries included (seconds)
+    'model_retries': 2,                    # Retries of a failed call, with jittered exponential backoff
+    'model_backoff_base': 0.5,             # First retry waits 0.25-0.5s, doubling every retry...
+    'model_backoff_max': 8.0,              # ...up to this many seconds
+    'model_breaker_failures': 5,           # Pause model calls after this many failures in a row, 0 to never pause
+    'model_breaker_reset': 30.0,           # Seconds before a paused model gets a trial call
+    'model_hedge_enabled': False,          # Send a duplicate request when a call is slower than usual (costs tokens)
+    'model_hedge_percentile': 0.95,        # ...after this percentile of recent call latencies
+    'model_hedge_min_delay': 1.0,          # ...but never sooner than this (seconds)
+    'cascade_model_name': None,            # Cheap model asked first (e.g. 'gemini-2.0-flash-lite'); null asks model_name only
+    'cascade_min_confidence': 60,          # Ask model_name again when the fast model reports a lower CONFIDENCE (0-100)
+    'cascade_stuck_repeats': 2,            # Ask model_name directly after this many actions in a row without moving
+    'cascade_escalate_battles': True,      # Ask model_name directly during battles
+    'sessions_dir': 'data/sessions',       # State directory for sessions other than the default one
+    'notepad_max_tokens': 2500,            # Summarize the notepad in the background above this many tokens
+    'state_flush_delay': 1.0,              # Write state files once they've been unchanged this long (seconds)
+    'state_flush_max_delay': 5.0,          # ...but never later than this after the first change
+    'prompt_cache_mode': 'system',         # 'system' instruction, 'remote' context caching, 'local' stand-in or 'off'
+    'prompt_cache_min_tokens': 4096,       # Smallest prefix 'remote' tries to cache; shorter ones are sent as 'system'
+    'prompt_cache_ttl': 3600,              # Lifetime of the cached static prompt prefix (seconds)
+    'token_budget_rules': 1000,            # Token budgets per prompt component (estimated, ~4 chars per token)
+    'token_budget_notepad': 2000,
+    'token_budget_thinking_history': 1500,
+    'token_budget_images': 516,            # 258 tokens per image: current and (with send_previous_frame) previous frame
+    'image_crop': None,                    # [left, top, right, bottom] game area to keep, or null for the full frame
+    'image_scale': 1.0,                    # Resize factor applied before encoding (nearest neighbour)
+    'image_quantize_colors': 256,          # Palette size for quantization (GBA screens use few colors), 0 to disable
+    'image_formats': ['PNG', 'WEBP'],      # Candidate encodings; the smallest is sent
+    'image_measure_baseline': 10,          # Also encode the unprocessed frame of 1 in N requests to report bytes saved
+    'image_workers': 2,                    # Preprocessing pool size
+    'image_use_processes': False,          # Use a process pool instead of threads
+    'plan_enabled': True,                  # Accept multi-step PLANs from the model
+    'plan_max_steps': 8,                   # Longest plan sent to the emulator
+    'plan_hold_frames': 30,                # Frames a planned button is held unless the plan says otherwise
+    'frame_request_delay': 1.0,            # Seconds before asking for a new frame when one produced no input
+    'trace_dir': None,                     # Record every received frame here for benchmark.py replays
+    'metrics_enabled': False,              # Time each stage and serve Prometheus metrics over HTTP
+    'metrics_host': '127.0.0.1',
+    'metrics_port': 9108,                  # GET http://<host>:<port>/metrics
+    'decision_log_path': 'data/decisions.jsonl',  # One JSON record per decision step, or null to disable
+    'game_state_enabled': True,            # Add the RAM game state sent by script.lua to the prompt
+    'movement_detection_enabled': True,    # Tell the model what its last action did (moved, blocked...), measured locally
+    'send_previous_frame': False,          # Also send the previous screenshot (doubles image tokens and upload size)
+    'navigation_enabled': True,            # Let the model set a GOAL that is walked to with A* over the explored map
+    'navigation_map_path': 'data/navigation_map.json',  # Explored tiles, walls and exits of every map
+    'navigation_chunk_tiles': 8,           # Tiles sent to the emulator per navigation plan
+    'navigation_hold_frames': 20,          # Frames each navigation step holds its direction
+    'navigation_max_tiles': 80,            # Hand control back to the model after walking this far towards a goal
+    'navigation_max_replans': 12,          # ...or after this many replans around newly found walls
+    'screen_classifier_enabled': True,     # Recognize dialogue, menus, battle menus and fades locally
+    'screen_policies': {'dialogue': 'A', 'transition': 'wait'},  # Fixed answer per screen: a button, 'wait' or null
+    'screen_min_confidence': 0.9,          # Only give a fixed answer when the classifier is at least this sure
+    'screen_fast_path_max_repeats': 20,    # Ask Gemini anyway after this many fixed answers in a row
+    'ocr_enabled': True,                   # Read dialogue and menu text with the glyph table (if there is one)
+    'ocr_glyphs_path': 'data/glyphs.json', # Glyph table learned with ocr.py
+    'ocr_to_notepad': True,                # Append new dialogue lines to the notepad
+}
 
 class PokemonGameController:
-    def __init__(self, config_path='config.json'):
+    def __init__(self, config_path='config.json', model=None, fast_model=None):
         # Cleanup control
         self._cleanup_done = False
         self._cleanup_lock = threading.Lock()
@@ -21,95 +119,212 @@ class PokemonGameController:
         # Load configuration
         self.config = self.load_config(config_path)
         
-        # Set up Gemini API client
-        genai.configure(api_key=self.config['api_key'])
-        self.model = genai.GenerativeModel(self.config['model_name'])
+        # Set up Gemini API client, unless a stand-in model (e.g. MockGenerativeModel) is given
+        if model is None:
+            genai.configure(api_key=self.config['api_key'])
+            model = genai.GenerativeModel(self.config['model_name'])
+        self.model = model
+        
+        # Optional cheaper model for routine decisions; model_name is then the strong tier of the cascade
+        if fast_model is None and self.config['cascade_model_name']:
+            genai.configure(api_key=self.config['api_key'])
+            fast_model = genai.GenerativeModel(self.config['cascade_model_name'])
+        self.fast_model = fast_model
         
-        # Initialize socket server
-        self.server_socket = None
+        # Server state, created by serve() inside the event loop
+        self.server = None
+        self.loop = None
+        self.stop_event = None
+        self.client_tasks = set()
+        
+        # Blocking work (model calls, file I/O) runs in this pool so the event loop stays responsive
+        self.executor = ThreadPoolExecutor(max_workers=self.config['model_workers'],
+                                           thread_name_prefix="decision")
         
         # Game state variables
         self.notepad_path = self.config['notepad_path']
         self.screenshot_path = self.config['screenshot_path']
-        self.thinking_history_path = os.path.join(os.path.dirname(self.notepad_path), 'thinking_history.txt')
-        self.current_client = None
         self.running = True
-        self.last_decision_time = 0
         self.decision_cooldown = self.config['decision_cooldown']
-        self.client_threads = []
         self.debug_mode = self.config.get('debug_mode', False)
+        self.frame_diff_enabled = self.config['frame_diff_enabled']
+        
+        # Debounced, atomic persistence of session state off the hot path
+        self.state_writer = WriteBehindWriter(flush_delay=self.config['state_flush_delay'],
+                                              max_delay=self.config['state_flush_max_delay'])
+        
+        # One session per emulator connection, keyed by session ID
+        self.sessions = {}
+        self.sessions_lock = threading.RLock()
+        
+        # Decision cache keyed by screen fingerprint and context, shared by all sessions
+        self.decision_cache = None
+        if self.config['decision_cache_enabled']:
+            self.decision_cache = DecisionCache(
+                self.config['decision_cache_path'],
+                max_entries=self.config['decision_cache_max_entries'],
+                ttl=self.config['decision_cache_ttl'],
+                writer=self.state_writer
+            )
         
         # Create directories if they don't exist
         os.makedirs(os.path.dirname(self.notepad_path), exist_ok=True)
         os.makedirs(os.path.dirname(self.screenshot_path), exist_ok=True)
+        if self.config['decision_log_path']:
+            os.makedirs(os.path.dirname(self.config['decision_log_path']), exist_ok=True)
         
-        # Initialize the logger
-        self.logger = PokemonLogger(debug_mode=self.debug_mode)
+        # Initialize the logger; records are written by a background thread
+        self.logger = PokemonLogger(debug_mode=self.debug_mode, decision_log_path=self.config['decision_log_path'])
         
-        # Initialize notepad and thinking history if they don't exist
-        self.initialize_notepad()
-        self.initialize_thinking_history()
+        # Per-stage latency histograms and counters; timers are no-ops when disabled
+        self.metrics = Metrics(enabled=self.config['metrics_enabled'])
         
-        self.logger.info("Controller initialized")
-        self.logger.debug(f"API Key: {self.config['api_key'][:5]}...{self.config['api_key'][-3:]}")
-        self.logger.debug(f"Model: {self.config['model_name']}")
-        self.logger.debug(f"Notepad path: {self.notepad_path}")
-        self.logger.debug(f"Thinking history path: {self.thinking_history_path}")
-        self.logger.debug(f"Screenshot path: {self.screenshot_path}")
+        # Every model call goes through the client: global limit on in-flight requests, rate limit,
+        # deadline, retries, and a circuit breaker and hedging per model (so per cascade tier)
+        self.model_client = ModelClient(
+            max_concurrent=self.config['max_concurrent_llm_requests'],
+            rate=self.config['model_rate_limit'],
+            burst=self.config['model_rate_burst'],
+            timeout=self.config['model_timeout'],
+            retries=self.config['model_retries'],
+            backoff_base=self.config['model_backoff_base'],
+            backoff_max=self.config['model_backoff_max'],
+            breaker_failures=self.config['model_breaker_failures'],
+            breaker_reset=self.config['model_breaker_reset'],
+            hedge_enabled=self.config['model_hedge_enabled'],
+            hedge_percentile=self.config['model_hedge_percentile'],
+            hedge_min_delay=self.config['model_hedge_min_delay'],
+            logger=self.logger,
+            metrics=self.metrics
+        )
+        self.metrics_server = None
+        self.metrics.gauge('sessions_connected', "Emulator connections attached to a session",
+                           lambda: sum(1 for session in list(self.sessions.values()) if session.connected))
+        
+        # Decisions go to a model bound to the cached static prompt prefix;
+        # other calls (e.g. summaries) use the plain model
+        self.prompt_cache = PromptCache(self.config['model_name'], mode=self.config['prompt_cache_mode'],
+                                        ttl=self.config['prompt_cache_ttl'],
+                                        min_cached_tokens=self.config['prompt_cache_min_tokens'], logger=self.logger)
+        self.decision_model = self.prompt_cache.build_model(self.model)
+        
+        # The fast tier gets its own cached prefix, since context caches are per model
+        self.cascade = None
+        if self.fast_model is not None:
+            self.cascade = ModelCascade(
+                min_confidence=self.config['cascade_min_confidence'],
+                stuck_repeats=self.config['cascade_stuck_repeats'],
+                escalate_battles=self.config['cascade_escalate_battles']
+            )
+            self.fast_prompt_cache = PromptCache(self.config['cascade_model_name'] or 'fast',
+                                                 mode=self.config['prompt_cache_mode'],
+                                                 ttl=self.config['prompt_cache_ttl'],
+                                                 min_cached_tokens=self.config['prompt_cache_min_tokens'],
+                                                 logger=self.logger)
+            self.fast_decision_model = self.fast_prompt_cache.build_model(self.fast_model)
+        
+        # Frame preprocessing before the model call, in its own worker pool
+        self.image_pipeline = ImagePipeline(
+            crop=self.config['image_crop'],
+            scale=self.config['image_scale'],
+            quantize_colors=self.config['image_quantize_colors'],
+            formats=self.config['image_formats'],
+            measure_baseline=self.config['image_measure_baseline'],
+            workers=self.config['image_workers'],
+            use_processes=self.config['image_use_processes'],
+            logger=self.logger
+        )
+        
+        # Works out locally whether the last action moved the player
+        self.movement = MovementDetector()
+        
+        # Local screen-type classifier for the fixed-answer fast path
+        self.screen_classifier = ScreenClassifier() if self.config['screen_classifier_enabled'] else None
+        
+        # Dialogue and menu text read from the frame, so the model doesn't have to read it from the image
+        self.text_reader = None
+        if self.config['ocr_enabled']:
+            try:
+                self.text_reader = TextReader(GlyphTable.load(self.config['ocr_glyphs_path']))
+            except FileNotFoundError:
+                self.logger.info("No glyph table at %s, dialogue OCR is off (learn one with ocr.py)",
+                                 self.config['ocr_glyphs_path'])
+            except (ValueError, KeyError, OSError) as e:
+                self.logger.warning("Could not load the glyph table: %s", e)
+        
+        # Explored map of every area the player walked on, for GOAL navigation; shared by all sessions
+        self.map_memory = None
+        if self.config['navigation_enabled']:
+            self.map_memory = MapMemory(self.config['navigation_map_path'], writer=self.state_writer,
+                                        logger=self.logger)
         
-        # Set up the socket after logger is initialized
-        self.setup_socket()
+        # Per-component token budgets for the decision prompt
+        self.token_budget = TokenBudget({
+            component: self.config[f'token_budget_{component}'] for component in TokenBudget.COMPONENTS
+        }, logger=self.logger)
         
-        # Set up signal handlers for proper shutdown
-        signal.signal(signal.SIGINT, self.signal_handler)
-        signal.signal(signal.SIGTERM, self.signal_handler)
+        # Background notepad summarization
+        self.summarizer = NotepadSummarizer(self.generate_content, self.executor, self.logger,
+                                            max_tokens=self.config['notepad_max_tokens'])
+        
+        # The default session owns the configured notepad and thinking history
+        default_session = self.get_session(DEFAULT_SESSION_ID)
+        
+        self.logger.info("Controller initialized")
+        self.logger.debug("API Key: %s...%s", self.config['api_key'][:5], self.config['api_key'][-3:])
+        self.logger.debug("Model: %s", self.config['model_name'])
+        self.logger.debug("Notepad path: %s", self.notepad_path)
+        self.logger.debug("Thinking history path: %s", default_session.thinking_history_path)
+        self.logger.debug("Screenshot path: %s", self.screenshot_path)
         
         # Register cleanup function
         atexit.register(self.cleanup)
 
-    def setup_socket(self):
-        """Set up the socket server with improved error handling and stability"""
+    def configure_keepalive(self, sock):
+        """Enable TCP keep-alive on a socket to prevent disconnections"""
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        
+        # Try to set TCP keepalive options if available
+        # These options might not be available on all platforms
         try:
-            # Initialize socket server
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            
-            # Add keep-alive options to prevent disconnections
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-            
-            # Try to set TCP keepalive options if available
-            # These options might not be available on all platforms
-            try:
-                # TCP Keepalive options: time, interval, retries
-                self.server_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60)
-                self.server_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)
-                self.server_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 6)
-            except (AttributeError, OSError):
-                self.logger.debug("TCP keepalive options not fully supported on this platform")
-            
-            # Try to bind to the port
-            try:
-                self.server_socket.bind((self.config['host'], self.config['port']))
-            except socket.error:
-                self.logger.warning(f"Port {self.config['port']} is already in use. Trying to release it...")
-                os.system(f"lsof -ti:{self.config['port']} | xargs kill -9")
-                time.sleep(1)  # Wait for port to be released
-                self.server_socket.bind((self.config['host'], self.config['port']))
-            
-            self.server_socket.listen(1)
-            self.server_socket.settimeout(1)  # Non-blocking socket with timeout
-            self.logger.success(f"Socket server set up on {self.config['host']}:{self.config['port']}")
-            
-        except socket.error as e:
-            self.logger.error(f"Socket setup error: {e}")
-            sys.exit(1)
+            # TCP Keepalive options: time, interval, retries
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 6)
+        except (AttributeError, OSError):
+            self.logger.debug("TCP keepalive options not fully supported on this platform")
+
+    async def start_server(self):
+        """Start the asyncio socket server, releasing the port if it's already in use"""
+        host, port = self.config['host'], self.config['port']
+        try:
+            server = await asyncio.start_server(self.handle_client, host, port, reuse_address=True)
+        except OSError:
+            self.logger.warning("Port %s is already in use. Trying to release it...", port)
+            os.system(f"lsof -ti:{port} | xargs kill -9")
+            await asyncio.sleep(1)  # Wait for port to be released
+            server = await asyncio.start_server(self.handle_client, host, port, reuse_address=True)
+        
+        for sock in server.sockets:
+            self.configure_keepalive(sock)
+        
+        self.logger.success("Socket server set up on %s:%s", host, port)
+        return server
+
+    async def start_metrics_server(self):
+        """Serve Prometheus metrics over HTTP; a busy port only disables the endpoint"""
+        host, port = self.config['metrics_host'], self.config['metrics_port']
+        try:
+            self.metrics_server = await asyncio.start_server(self.metrics.handle_http, host, port, reuse_address=True)
+            self.logger.success("Metrics served on http://%s:%s/metrics", host, port)
+        except OSError as e:
+            self.logger.warning("Could not serve metrics on %s:%s: %s", host, port, e)
 
-    def signal_handler(self, sig, frame):
-        """Handle termination signals"""
-        print(f"\nReceived signal {sig}. Shutting down server...")
+    def stop(self):
+        """Ask the server to shut down; safe to call from any thread or a signal handler"""
         self.running = False
-        self.cleanup()
-        sys.exit(0)
+        if self.loop and self.stop_event:
+            self.loop.call_soon_threadsafe(self.stop_event.set)
         
     def cleanup(self):
         """Clean up resources properly - runs only once"""
@@ -120,26 +335,20 @@ class PokemonGameController:
             
             self.logger.section("Cleaning up resources...")
             
-            # Close client connections
-            if self.current_client:
-                try:
-                    self.current_client.close()
-                    self.current_client = None
-                except:
-                    pass
+            # Don't wait for in-flight model calls; their results are no longer needed
+            self.executor.shutdown(wait=False)
+            self.model_client.shutdown()
+            self.image_pipeline.shutdown()
             
-            # Close server socket
-            if self.server_socket:
-                try:
-                    self.server_socket.close()
-                    self.server_socket = None
-                except:
-                    pass
+            # Persist the decision cache and flush pending state writes
+            if self.decision_cache:
+                self.decision_cache.save()
+            self.state_writer.close()
+            self.prompt_cache.release()
+            if self.cascade:
+                self.fast_prompt_cache.release()
                 
             self.logger.success("Cleanup complete")
-            
-            # Give GRPC time to shut down (fixes the timeout warning)
-            time.sleep(0.5)
 
     def load_config(self, config_path):
         """Load configuration from JSON file"""
@@ -154,18 +363,10 @@ class PokemonGameController:
             if 'screenshot_path' in config and not os.path.isabs(config['screenshot_path']):
                 config['screenshot_path'] = os.path.abspath(config['screenshot_path'])
                 
-            # Set default values for thinking history parameters if not provided
-            if 'thinking_history_max_chars' not in config:
-                config['thinking_history_max_chars'] = 20000
-                
-            if 'thinking_history_keep_entries' not in config:
-                config['thinking_history_keep_entries'] = 5
-                
-            return config
         except Exception as e:
             print(f"Error loading config: {e}")
-            # Return default configuration
-            return {
+            # Use default configuration
+            config = {
                 'api_key': 'YOUR_GEMINI_API_KEY',
                 'model_name': 'gemini-2.0-flash',
                 'host': '127.0.0.1',
@@ -173,296 +374,610 @@ class PokemonGameController:
                 'notepad_path': os.path.abspath('notepad.txt'),
                 'screenshot_path': os.path.abspath('data/screenshots/screenshot.png'),
                 'decision_cooldown': 3,  # 3 seconds between LLM decisions
-                'thinking_history_max_chars': 20000,  # Maximum characters in thinking history before trimming
-                'thinking_history_keep_entries': 5,    # Number of recent thinking entries to keep when trimming
                 'debug_mode': True
             }
+        
+        # Set default values for optional parameters if not provided
+        for key, value in DEFAULT_SETTINGS.items():
+            config.setdefault(key, value)
+        config['decision_cache_path'] = os.path.abspath(config['decision_cache_path'])
+        config['sessions_dir'] = os.path.abspath(config['sessions_dir'])
+        if config['trace_dir']:
+            config['trace_dir'] = os.path.abspath(config['trace_dir'])
+        if config['decision_log_path']:
+            config['decision_log_path'] = os.path.abspath(config['decision_log_path'])
+        config['navigation_map_path'] = os.path.abspath(config['navigation_map_path'])
+        config['ocr_glyphs_path'] = os.path.abspath(config['ocr_glyphs_path'])
+            
+        return config
 
-    def initialize_notepad(self):
-        """Initialize the notepad file with a clearer structure"""
-        if not os.path.exists(self.notepad_path):
-            os.makedirs(os.path.dirname(self.notepad_path), exist_ok=True)
-            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-            with open(self.notepad_path, 'w') as f:
-                f.write("# Pokémon Game AI Notepad\n\n")
-                f.write(f"Game started: {timestamp}\n\n")
-                f.write("## Current Status\n")
-                f.write("- Game just started\n\n")
-                f.write("## Game Progress\n")
-                f.write("- Beginning journey\n\n")
-
-    def initialize_thinking_history(self):
-        """Initialize the thinking history file if it doesn't exist"""
-        if not os.path.exists(self.thinking_history_path):
-            os.makedirs(os.path.dirname(self.thinking_history_path), exist_ok=True)
-            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-            with open(self.thinking_history_path, 'w') as f:
-                f.write(f"# Pokémon Game AI Thinking History\n\n")
-                f.write(f"Started: {timestamp}\n\n")
+    def get_session(self, session_id):
+        """Return the session with this ID, creating (and loading) it on first use; blocks on file reads"""
+        with self.sessions_lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = GameSession(session_id, self.config, self.logger, self.state_writer)
+                self.sessions[session_id] = session
+            return session
 
-    def read_notepad(self):
-        """Read the current notepad content"""
-        try:
-            with open(self.notepad_path, 'r') as f:
-                return f.read()
-        except Exception as e:
-            print(f"Error reading notepad: {e}")
-            return "Error reading notepad"
-
-    def read_thinking_history(self):
-        """Read the current thinking history content"""
-        try:
-            with open(self.thinking_history_path, 'r') as f:
-                return f.read()
-        except Exception as e:
-            print(f"Error reading thinking history: {e}")
-            return "Error reading thinking history"
+    def claim_session(self, requested_id):
+        """Attach a new connection to a session, picking a unique ID if the requested one is in use
+        
+        Loading a new session reads its files, so this runs in the executor (see
+        handle_client); the lock keeps two connections from claiming the same one.
+        """
+        session_id = re.sub(r"[^A-Za-z0-9_.-]", "_", requested_id)[:64].strip(".") or DEFAULT_SESSION_ID
+        
+        candidate = session_id
+        suffix = 2
+        with self.sessions_lock:
+            while True:
+                session = self.get_session(candidate)
+                if not session.connected:
+                    session.connected = True
+                    return session
+                candidate = f"{session_id}-{suffix}"
+                suffix += 1
 
-    def update_notepad(self, new_content):
-        """Update the notepad with new content"""
-        try:
-            with open(self.notepad_path, 'w') as f:
-                f.write(new_content)
-            print("Notepad updated")
-        except Exception as e:
-            print(f"Error updating notepad: {e}")
+    def generate_content(self, contents, model=None):
+        """Call a model (the plain one by default) through the model client's limits, deadline and retries"""
+        return self.model_client.generate_content(model or self.model, contents)
 
-    def update_thinking_history(self, new_thinking):
-        """Update the thinking history with new content"""
-        try:
-            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-            
-            # Get existing history, but limit to recent entries if too large
-            history_content = self.read_thinking_history()
-            
-            # If history gets too long, keep only the most recent entries
-            max_chars = self.config['thinking_history_max_chars']
-            keep_entries = self.config['thinking_history_keep_entries']
-            
-            if len(history_content) > max_chars:
-                # Split by timestamps and keep only the most recent ones
-                entries = history_content.split("## Thinking")
-                # Keep header and last N entries based on config
-                if len(entries) > keep_entries + 1:  # +1 for the header
-                    history_content = entries[0] + "".join(entries[-(keep_entries):])
-                    self.logger.debug(f"Trimmed thinking history to {keep_entries} entries")
-            
-            # Add new thinking with timestamp
-            with open(self.thinking_history_path, 'w') as f:
-                f.write(history_content)
-                f.write(f"\n## Thinking {timestamp}\n{new_thinking}\n")
-            
-            self.logger.debug("Thinking history updated")
-        except Exception as e:
-            print(f"Error updating thinking history: {e}")
-
-    def summarize_notepad_if_needed(self):
-        """Summarize notepad if it gets too long, keeping the structure intact"""
-        notepad_content = self.read_notepad()
+    def process_screenshot(self, session, screenshot_path=None, image=None, game_state=None):
+        """Process the latest screenshot for a session with Gemini Vision, also sending previous screenshot
         
-        # If notepad is over 10KB, ask LLM to summarize it
-        if len(notepad_content) > 10000:
-            print("Notepad is getting too long, summarizing...")
-            
-            try:
-                summarize_prompt = """
-                Please summarize the following game notes into a more concise format.
-                
-                Maintain these exact sections:
-                - Long-term Goals
-                - Current Objectives 
-                - Team Status
-                - Inventory
-                - Game Progress
-                
-                Condense repetitive information but preserve all important game state details:
-                - Current location and next destination
-                - All Pokémon on the team with their levels, types and moves
-                - Important items in the inventory
-                - Badges collected and significant events
-                - Current strategy and immediate plans
-                
-                Format the response as a well-structured markdown document with clear headings and bullet points.
-                
-                Here are the notes to summarize:
-                
-                """
-                
-                response = self.model.generate_content(
-                    summarize_prompt + notepad_content
-                )
-                
-                if response:
-                    summarized_content = response.text
-                    
-                    # Add a note about summarization
-                    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-                    summarized_content += f"\n\n## Note\nNotepad was summarized at {timestamp} to reduce size while preserving important information."
-                    
-                    self.update_notepad(summarized_content)
-                    print("Notepad summarized successfully")
-            except Exception as e:
-                print(f"Error summarizing notepad: {e}")
-
-    def process_screenshot(self, screenshot_path=None):
-        """Process the latest screenshot with Gemini Vision, also sending previous screenshot"""
+        The frame is either an in-memory image received over the socket or a
+        screenshot file written by the emulator. game_state is the GameState
+        the emulator read from RAM for this frame, if it sent one.
+        """
         current_time = time.time()
+        metrics = self.metrics
+        if game_state is not None:
+            session.game_state = game_state
+        if self.map_memory:
+            last_decision = session.last_decision
+            self.observe_position(session, last_decision['button'] if last_decision and not last_decision['plan']
+                                  else None)
         
-        # Check if we should make a new decision based on cooldown
-        if current_time - self.last_decision_time < self.decision_cooldown:
-            return None  # Skip decision making during cooldown
-            
         try:
-            # Read the notepad and thinking history
-            notepad_content = self.read_notepad()
-            thinking_history = self.read_thinking_history()
-            
-            # Use provided path or default
-            path_to_use = screenshot_path if screenshot_path else self.screenshot_path
+            # Use the in-memory frame, or load the screenshot file
+            if image is not None:
+                current_image = image
+            else:
+                path_to_use = screenshot_path if screenshot_path else self.screenshot_path
+                
+                if not os.path.exists(path_to_use):
+                    self.logger.error("Screenshot not found at %s", path_to_use)
+                    return None
+                
+                with metrics.stage('image_load'):
+                    current_image = PIL.Image.open(path_to_use)
+                    current_image.load()
             
-            if not os.path.exists(path_to_use):
-                self.logger.error(f"Screenshot not found at {path_to_use}")
-                return None
+            # Classify the screen and read its text before deciding anything
+            screen, confidence = None, 0.0
+            if self.screen_classifier:
+                with metrics.stage('screen_classifier'):
+                    screen, confidence = self.screen_classifier.classify(current_image, session.game_state)
+                session.screen = screen
+            if self.text_reader:
+                self.read_screen_text(session, current_image, screen)
             
-            # Setup previous screenshot path
-            comparison_folder = os.path.join(os.path.dirname(self.screenshot_path), 'comparison')
-            os.makedirs(comparison_folder, exist_ok=True)
-            prev_screenshot_path = os.path.join(comparison_folder, 'previous_screenshot.png')
-            last_action_path = os.path.join(comparison_folder, 'last_action.txt')
+            # Screens with a fixed answer (text waiting for A, fades) don't need Gemini or the cooldown
+            if self.screen_classifier:
+                handled, decision = self.fast_path(session, current_image, current_time, screen, confidence)
+                if handled:
+                    return decision
             
-            # Get the last action (button pressed)
-            last_action = "NONE (First action)"
-            if os.path.exists(last_action_path):
-                try:
-                    with open(last_action_path, 'r') as f:
-                        last_action = f.read().strip()
-                except:
-                    pass
+            # Check if we should make a new decision based on cooldown
+            if current_time - session.last_decision_time < self.decision_cooldown:
+                metrics.inc('cooldown_rejects')
+                return None  # Skip decision making during cooldown
             
-            # Load current screenshot
-            current_image = PIL.Image.open(path_to_use)
+            # Read the notepad and thinking history
+            with metrics.stage('state_read'):
+                notepad_content = session.read_notepad()
+                thinking_history = session.read_thinking_history()
+                
+                # Get the last action (button pressed)
+                last_action = session.read_last_action()
             
             # Check if we have a previous screenshot
-            has_previous = os.path.exists(prev_screenshot_path)
-            previous_image = None
+            previous_image = session.previous_image
+            has_previous = previous_image is not None
             
-            if has_previous:
-                previous_image = PIL.Image.open(prev_screenshot_path)
+            if has_previous and session.last_frame_hash is None:
+                session.last_frame_hash = perceptual_hash(previous_image)
             
-            # Craft the prompt with guidance for comparing screenshots
-            prompt = f"""
-                You are Gemini, an AI playing Pokémon Fire Red. Look at the screenshots and make decisions to progress in the game.
-                
-                ## Game Context
-                - You are playing Pokémon Fire Red for Game Boy Advance
-                - You are at the beginning of the game in Pallet Town
-                - The game has buildings, routes, and towns to navigate through
-                
-                ## Screenshots Information
-                - You are receiving TWO screenshots: current and previous state
-                - The first image is your CURRENT view
-                - The second image is the PREVIOUS view (before your last action)
-                - Your last action was: {last_action}
-                - IMPORTANT: Compare these images to see if your last action had any effect
-                - If the character position is the same in both images, it means you hit a WALL or OBSTACLE
-                
-                ## Pokémon Game Navigation Rules:
-                - Indoor spaces: Rooms have walls and you CAN'T walk through them
-                - In your bedroom, the STAIRS are the YELLOW LADDER in the TOP LEFT corner
-                - Carpets/Rugs indicate walkable areas in rooms
-                - To use stairs or doors, stand DIRECTLY IN FRONT of them and press A
-                
-                ## Your notepad (your memory):
-                {notepad_content}
+            # Skip the LLM call if the screen hasn't changed since the last decision
+            if self.frame_diff_enabled:
+                if session.frame_gate.reference is None and previous_image is not None:
+                    session.frame_gate.remember(previous_image)
                 
-                ## Your recent thinking:
-                {thinking_history}
-                
-                ## Controls Available:
-                - A: Confirm/Select/Interact
-                - B: Cancel/Back
-                - START: Open menu
-                - UP, DOWN, LEFT, RIGHT: Move/Navigate
-                
-                ## Your task:
-                1. FIRST: Compare the current and previous screenshots to see if your last action ({last_action}) caused movement
-                2. If you didn't move, conclude there's a wall in that direction and try a DIFFERENT direction
-                3. If you're in the bedroom, locate the yellow ladder (stairs) in the top left corner
-                4. Choose ONE button to press that will make progress
-                5. Update your notepad if needed
-                
-                Respond in this exact format:
-                THINK: [First analyze if your last action caused movement, then analyze the current situation]
-                BUTTON: [single button name (A, B, START, UP, DOWN, LEFT, RIGHT). YOU MUST include the button you want to press.]
-                NOTEPAD: [one of: "no change" OR specific information to add]
+                with metrics.stage('frame_gate'):
+                    skip, changed = session.frame_gate.should_skip(current_image)
+                if skip:
+                    metrics.inc('frames_skipped')
+                    stats = session.frame_gate.stats()
+                    self.logger.info("Frame unchanged (%.1f%% of pixels changed), skipping Gemini call "
+                                     "(%d calls avoided)", changed * 100, stats['calls_avoided'])
+                    if session.frame_gate.mode == 'reuse' and session.last_decision:
+                        session.last_decision_time = current_time
+                        session.plan_tracker.clear()
+                        self.log_decision(session, 'reuse', current_time, button=session.last_decision['button'],
+                                          changed=round(changed, 4))
+                        return {'button': session.last_decision['button'], 'notepad_update': None, 'plan': None}
+                    self.log_decision(session, 'skip', current_time, changed=round(changed, 4))
+                    return None
+            
+            # Re-use a cached decision for a screen we've already seen in this context,
+            # unless the last action had no visible effect (the cached answer would repeat it)
+            with metrics.stage('frame_hash'):
+                frame_hash = perceptual_hash(current_image)
+            cache_key = None
+            if self.decision_cache:
+                # Keyed on an exact digest, not the perceptual hash: similar screens must not share a decision
+                with metrics.stage('frame_hash'):
+                    digest = frame_digest(current_image)
+                cache_key = self.decision_cache.make_key(
+                    digest, last_action,
+                    notepad_digest(notepad_content, self.config['decision_cache_notepad_chars']),
+                    session.screen_text, session.game_state
+                )
+                if frame_hash != session.last_frame_hash:
+                    with metrics.stage('decision_cache'):
+                        cached = self.decision_cache.get(cache_key)
+                    stats = self.decision_cache.stats()
+                    self.logger.info("Decision cache %s (hits: %d, misses: %d, hit rate: %.1f%%)",
+                                     'hit' if cached else 'miss', stats['hits'], stats['misses'],
+                                     stats['hit_rate'] * 100)
+                    if cached:
+                        metrics.inc('cache_hits')
+                        session.set_previous_frame(current_image)
+                        session.frame_gate.remember(current_image)
+                        session.last_frame_hash = frame_hash
+                        session.last_decision_time = current_time
+                        self.logger.success("Using cached decision, skipping Gemini call")
+                        self.logger.ai_action(BUTTON_NAMES.get(cached['button'], "UNKNOWN"), cached['button'])
+                        plan = self.start_plan(session, cached['button'], cached.get('plan'), current_image)
+                        session.last_decision = {'button': cached['button'], 'notepad_update': None, 'plan': plan,
+                                                 'plan_id': session.plan_tracker.plan_id}
+                        self.log_decision(session, 'cache', current_time, frame_hash, cached['button'], plan=plan)
+                        return session.last_decision
+            
+            # Work out what the last action did from the two frames, instead of asking the model to compare them
+            movement = None
+            movement_kind = None
+            if self.config['movement_detection_enabled']:
+                last_button = session.last_decision['button'] if session.last_decision else None
+                with metrics.stage('movement'):
+                    result = self.movement.assess(last_button, previous_image, current_image,
+                                                  session.previous_game_state, session.game_state)
+                if result:
+                    movement_kind, movement = result
+            if self.cascade:
+                self.cascade.observe(session, movement_kind)
+            
+            # Trim the notepad, thinking history and images to their token budgets
+            with metrics.stage('prompt_build'):
+                if has_previous and self.config['send_previous_frame']:
+                    images = [current_image, previous_image]
+                else:
+                    images = [current_image]
+                notepad_prompt, thinking_prompt, images, prompt_usage = self.token_budget.fit(
+                    notepad_content, thinking_history, images
+                )
                 
-                Buttons must be EXACTLY one of: A, B, START, UP, DOWN, LEFT, RIGHT
-                """
+                # Only the dynamic part is built per decision; the static prefix is cached with the model
+                game_state_text = None
+                if session.game_state and self.config['game_state_enabled']:
+                    game_state_text = session.game_state.describe()
+                    if self.map_memory:
+                        game_state_text += "\n" + self.map_memory.describe(session.game_state)
+                prompt = self.prompt_cache.prompt(build_dynamic_prompt(
+                    last_action, notepad_prompt, thinking_prompt, has_previous=len(images) > 1,
+                    game_state=game_state_text, movement=movement, screen_text=session.screen_text
+                ))
             
             self.logger.section("Sending Screenshots to Gemini")
             
-            # Save current screenshot as previous for next time
-            try:
-                current_image.save(prev_screenshot_path)
-            except Exception as e:
-                self.logger.error(f"Error saving previous screenshot: {e}")
-            
-            # Generate response from Gemini - send both current and previous screenshots if available
-            if has_previous and previous_image:
+            # Generate response from Gemini - send both current and previous screenshots if they fit
+            if movement:
+                self.logger.info("Last action result: %s", movement)
+            if len(images) > 1:
                 self.logger.info("Sending both current and previous screenshots for comparison")
-                response = self.model.generate_content([prompt, current_image, previous_image])
-            else:
+            elif has_previous and self.config['send_previous_frame']:
+                self.logger.info("Sending only the current screenshot (image token budget)")
+            elif not has_previous:
                 self.logger.info("First screenshot - no previous for comparison")
-                response = self.model.generate_content([prompt, current_image])
+            
+            # Crop, quantize and re-encode the frames; the previous frame was already processed last time
+            processed = session.processed_frame
+            with metrics.stage('image_pipeline'):
+                if len(images) > 1 and processed and processed[0] is images[1]:
+                    blobs = self.image_pipeline.process(images[:1]) + [processed[1]]
+                else:
+                    blobs = self.image_pipeline.process(images)
+            session.processed_frame = (current_image, blobs[0])
+            parts = [prompt] + blobs
+            
+            call_start = time.time()
+            metrics.inc('model_calls')
+            with metrics.stage('model_call'):
+                response, input_tokens, cached_tokens, routing = self.ask_model(session, parts)
             
             if response:
+                latency = time.time() - call_start
+                
+                # Keep current screenshot as previous for next time; after a failed call the
+                # frame gate still compares against the last answered frame, so it is retried
+                session.set_previous_frame(current_image)
+                session.frame_gate.remember(current_image)
+                session.last_frame_hash = frame_hash
+                
                 self.logger.success("Received response from Gemini")
                 
                 # Parse response for button press and notepad update
-                button_press, notepad_update, thinking = self.parse_llm_response(response.text)
-                self.last_decision_time = current_time
+                with metrics.stage('parse'):
+                    button_press, notepad_update, thinking, plan, goal = self.parse_llm_response(session,
+                                                                                                 response.text)
+                session.last_decision_time = current_time
                 
                 # Log the AI's thinking and actions
                 self.logger.ai_thinking(thinking)
                 
                 if button_press is not None:
                     # Map button index back to name for better logging
-                    button_names = {0: "A", 1: "B", 2: "SELECT", 3: "START", 
-                                4: "RIGHT", 5: "LEFT", 6: "UP", 7: "DOWN",
-                                8: "R", 9: "L"}
-                    button_name = button_names.get(button_press, "UNKNOWN")
-                    
-                    # Save the button name for next comparison
-                    try:
-                        with open(last_action_path, 'w') as f:
-                            f.write(button_name)
-                    except Exception as e:
-                        self.logger.error(f"Error saving last action: {e}")
+                    button_name = BUTTON_NAMES.get(button_press, "UNKNOWN")
                     
                     self.logger.ai_action(button_name, button_press)
+                    
+                    # Walk to the goal locally if one was set and can be planned; otherwise press the button
+                    navigation_plan, navigation_outcome = (self.start_navigation(session, goal, current_image)
+                                                           if goal else (None, None))
+                    if navigation_plan:
+                        button_press, plan = navigation_plan[0][0], navigation_plan
+                    else:
+                        # Save the button name (or plan) for next comparison
+                        plan = self.start_plan(session, button_press, plan, current_image)
+                        
+                        # Remember the decision for this screen and context
+                        if cache_key:
+                            self.decision_cache.put(cache_key, {'button': button_press, 'plan': plan})
+                        if goal:
+                            session.save_last_action(button_press, f"{session.read_last_action()} "
+                                                                   f"(GOAL {describe_goal(goal)}: {navigation_outcome})")
                 
                 if notepad_update:
                     new_content = notepad_update.split("## Update")[-1] if "## Update" in notepad_update else notepad_update
                     self.logger.notepad(new_content)
                 
-                return {
+                session.last_decision = {
                     'button': button_press,
-                    'notepad_update': notepad_update
+                    'notepad_update': notepad_update,
+                    'plan': plan if button_press is not None else None,
+                    'plan_id': session.plan_tracker.plan_id
                 }
+                self.log_decision(session, 'model', current_time, frame_hash, button_press,
+                                  plan=session.last_decision['plan'], prompt_tokens=prompt_usage,
+                                  input_tokens=input_tokens, cached_tokens=cached_tokens, latency=round(latency, 4),
+                                  image_bytes=sum(len(blob['data']) for blob in blobs),
+                                  game_state=session.game_state.to_dict() if session.game_state else None,
+                                  movement=movement, goal=describe_goal(goal) if goal else None, screen=session.screen,
+                                  screen_text=session.screen_text, **(routing or {}),
+                                  notepad_update=notepad_update, thinking=thinking)
+                return session.last_decision
             
         except Exception as e:
-            self.logger.error(f"Error processing screenshot: {e}")
+            metrics.inc('errors')
+            self.logger.error("Error processing screenshot: %s", e)
+            self.log_decision(session, 'error', current_time, error=str(e))
             if self.debug_mode:
                 import traceback
                 self.logger.debug(traceback.format_exc())
         
         return None
 
-    def parse_llm_response(self, response_text):
-        """Parse the LLM response to extract button press, notepad update and thinking"""
+    def ask_model(self, session, parts):
+        """Send a decision prompt to the model, through the cascade if there is a fast tier
+        
+        Returns (response, input_tokens, cached_tokens, routing); routing holds the
+        tier that answered, why, and each tier's latency for the decision log
+        (None without a cascade). A fast answer that is unusable or unsure is
+        escalated to the strong model; if that call fails, an unsure fast answer
+        is still used.
+        """
+        if not self.cascade:
+            return self.call_tier(self.prompt_cache, self.decision_model, parts) + (None,)
+        
+        tier, reason = self.cascade.route(session)
+        routing = {'tier': tier, 'route_reason': reason, 'escalation': None, 'fast_confidence': None,
+                   'latency_fast': None, 'latency_strong': None}
+        fast_answer = None
+        fast_tokens = (0, 0)
+        if tier == 'fast':
+            start = time.time()
+            try:
+                response, input_tokens, cached_tokens = self.call_tier(self.fast_prompt_cache, self.fast_decision_model,
+                                                                       parts, 'model_call_fast')
+                fast_tokens = (input_tokens, cached_tokens)
+                escalation, routing['fast_confidence'] = self.cascade.review(response.text)
+            except Exception as e:
+                self.logger.warning("Fast model call failed: %s", e)
+                response, input_tokens, cached_tokens, escalation = None, 0, 0, 'fast_error'
+            latency = time.time() - start
+            self.cascade.record('fast', latency)
+            self.metrics.inc('cascade_fast_calls')
+            routing['latency_fast'] = round(latency, 4)
+            if escalation is None:
+                self.logger.info("Fast model answered in %.2fs (confidence: %s)", latency,
+                                 routing['fast_confidence'])
+                return response, input_tokens, cached_tokens, routing
+            
+            self.cascade.escalated(escalation)
+            self.metrics.inc('cascade_escalations')
+            routing['escalation'] = escalation
+            if escalation == 'low_confidence':
+                fast_answer = (response, input_tokens, cached_tokens)
+            self.logger.info("Escalating to %s (%s)", self.config['model_name'], escalation.replace('_', ' '))
+        else:
+            self.metrics.inc('cascade_routed_strong')
+            self.logger.info("Asking %s directly (%s)", self.config['model_name'], reason)
+        
+        start = time.time()
+        try:
+            response, input_tokens, cached_tokens = self.call_tier(self.prompt_cache, self.decision_model, parts,
+                                                                   'model_call_strong')
+        except Exception as e:
+            if fast_answer is None:
+                raise
+            self.logger.warning("Strong model call failed (%s), using the fast model's answer", e)
+            routing['tier'] = 'fast'
+            return fast_answer + (routing,)
+        finally:
+            latency = time.time() - start
+            self.cascade.record('strong', latency)
+            self.metrics.inc('cascade_strong_calls')
+            routing['latency_strong'] = round(latency, 4)
+        
+        # Tokens of an escalated fast call were spent too
+        routing['tier'] = 'strong'
+        return response, input_tokens + fast_tokens[0], cached_tokens + fast_tokens[1], routing
+    
+    def call_tier(self, prompt_cache, model, parts, stage=None):
+        """Call one tier's decision model, timed as stage if given; returns (response, input_tokens, cached_tokens)"""
+        prompt_cache.keep_alive()
+        start = time.time()
+        with self.metrics.stage(stage) if stage else NULL_TIMER:
+            response = self.generate_content(parts, model=model)
+        input_tokens, cached_tokens = prompt_cache.record(model, parts, response, time.time() - start)
+        return response, input_tokens, cached_tokens
+    
+    def read_screen_text(self, session, image, screen):
+        """Read the text boxes of the frame into session.screen_text; new dialogue lines also go to the notepad"""
+        previous = session.screen_text
+        with self.metrics.stage('ocr'):
+            text = self.text_reader.read_screen(image, screen or 'dialogue')
+        session.screen_text = text
+        if not text:
+            return
+        
+        # Text scrolls up a line at a time: skip lines that were already on screen
+        lines = new_lines(previous, text)
+        if lines:
+            self.logger.game_state("On-screen text: %s", " / ".join(lines))
+        if lines and screen in (None, 'dialogue') and self.config['ocr_to_notepad']:
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+            session.append_notepad(f"\n## Update {timestamp}\nDialogue: {' '.join(lines)}\n")
+    
+    def fast_path(self, session, image, started, screen, confidence):
+        """Answer screens the classifier is sure about with their configured policy
+        
+        Returns (handled, decision); decision is None for the 'wait' policy.
+        After screen_fast_path_max_repeats fixed answers in a row the frame
+        goes to Gemini, in case the fixed answer isn't getting anywhere.
+        """
+        policy = self.config['screen_policies'].get(screen)
+        if (policy is None or confidence < self.config['screen_min_confidence']
+                or session.fast_path_streak >= self.config['screen_fast_path_max_repeats']):
+            session.fast_path_streak = 0
+            return False, None
+        
+        session.fast_path_streak += 1
+        self.metrics.inc('fast_path_decisions')
+        if policy == 'wait':
+            self.logger.debug("Screen is a %s (%.2f), waiting for the next frame", screen, confidence)
+            self.log_decision(session, 'fast_path', started, screen=screen, confidence=round(confidence, 3))
+            return True, None
+        
+        button = {name: index for index, name in BUTTON_NAMES.items()}[policy]
+        self.logger.info("Screen is a %s (%.2f), pressing %s without asking Gemini", screen, confidence, policy)
+        self.logger.ai_action(policy, button)
+        
+        # The frame stands in for the one the next decision compares against
+        session.plan_tracker.clear()
+        session.save_last_action(button)
+        session.set_previous_frame(image)
+        session.frame_gate.remember(image)
+        session.last_decision = {'button': button, 'notepad_update': None, 'plan': None, 'plan_id': None}
+        self.log_decision(session, 'fast_path', started, button=button, screen=screen,
+                          confidence=round(confidence, 3), screen_text=session.screen_text)
+        return True, session.last_decision
+    
+    def log_decision(self, session, source, started, frame_hash=None, button=None, plan=None, **fields):
+        """Queue a structured record of one decision step for the JSONL decision log
+        
+        source is 'model', 'cache', 'fast_path', 'navigation', 'reuse', 'skip' or 'error'. Records are
+        serialized and written by the logger's background thread.
+        """
+        if not self.config['decision_log_path']:
+            return
+        record = {
+            'time': round(started, 3),
+            'session': session.session_id,
+            'source': source,
+            'frame_hash': frame_hash,
+            'button': BUTTON_NAMES.get(button, "UNKNOWN") if button is not None else None,
+            'plan': describe_plan(plan, BUTTON_NAMES, self.config['plan_hold_frames']) if plan else None,
+            'duration': round(time.time() - started, 4),
+        }
+        record.update(fields)
+        self.logger.decision(record)
+
+    def start_plan(self, session, button_press, plan, image):
+        """Record the action about to be sent; returns the plan to send, or None for a single press"""
+        hold = self.config['plan_hold_frames']
+        if not plan or plan == [(button_press, hold, 1)]:
+            session.plan_tracker.clear()
+            session.save_last_action(button_press)
+            return None
+        
+        plan_id = session.plan_tracker.start(plan, image)
+        description = describe_plan(plan, BUTTON_NAMES, hold)
+        session.save_last_action(button_press, description)
+        self.logger.info("Plan %d: %s", plan_id, description)
+        return plan
+
+    def follow_plan(self, session, progress, screenshot_path=None, image=None, game_state=None):
+        """Check the frame the emulator sent after a plan step; returns (status, reason)"""
+        plan_id, steps_done, step_count = progress
+        if image is None:
+            image = PIL.Image.open(screenshot_path)
+            image.load()
+        
+        tracker = session.plan_tracker
+        button = None
+        if tracker.steps is not None and plan_id == tracker.plan_id and 1 <= steps_done <= len(tracker.steps):
+            button = tracker.steps[steps_done - 1][0]
+        if game_state is not None:
+            session.game_state = game_state
+            if self.map_memory and button is not None:
+                self.observe_position(session, button)
+        
+        status, reason = tracker.check(plan_id, steps_done, image)
+        
+        # Navigation plans also know which tile every step should end on
+        navigation = session.navigation
+        if (status == 'continue' and navigation and game_state is not None
+                and not navigation.on_path(steps_done, game_state)):
+            tracker.abort()
+            status, reason = 'abort', "off the planned path"
+        
+        if status == 'abort':
+            # Tell the model where the plan stopped and why
+            session.save_last_action(None, f"{session.read_last_action()} "
+                                           f"(stopped after step {steps_done} of {step_count}: {reason})")
+        return status, reason
+
+    def observe_position(self, session, button):
+        """Feed the position change since the last observed game state into the map memory"""
+        state = session.game_state
+        if state is not None and state is not session.observed_game_state:
+            self.map_memory.observe(session.observed_game_state, button, state)
+            session.observed_game_state = state
+    
+    def start_navigation(self, session, goal, image):
+        """Start walking towards a goal the model set
+        
+        Returns (plan, None) with the first plan, or (None, outcome) saying why
+        the goal could not be planned, in which case BUTTON is pressed instead.
+        """
+        state = session.game_state
+        if not self.map_memory:
+            return None, "not planned, navigation is off"
+        if state is None:
+            return None, "not planned, no game state"
+        if state.in_battle or state.controls_locked:
+            return None, "not planned, the player can't walk right now"
+        
+        task = session.navigation = NavigationTask(goal, state)
+        self.metrics.inc('navigation_goals')
+        self.logger.info("Navigating to %s", task.description)
+        plan = self.navigation_plan(session, image)
+        if plan is None:
+            session.navigation = None
+            return None, task.outcome
+        return plan, None
+    
+    def navigation_plan(self, session, image):
+        """Plan the next stretch towards the session's goal from the current position
+        
+        Returns the plan sent to the emulator, or None once the goal was
+        reached or given up on; the outcome is then left in the last action
+        for the model.
+        """
+        task = session.navigation
+        state = session.game_state
+        if state is not None:
+            walked = task.steps_walked(state)
+            task.tiles_walked += walked
+            self.metrics.inc('navigation_tiles', walked)
+        
+        outcome = None
+        if state is None:
+            outcome = "stopped, no game state"
+        elif task.arrived(state):
+            outcome = f"arrived ({state.map_name}, tile ({state.x}, {state.y}))"
+        elif (state.map_group, state.map_num) != task.start_map:
+            outcome = f"stopped, entered {state.map_name}"
+        elif state.in_battle:
+            outcome = "stopped, a battle started"
+        elif state.controls_locked:
+            outcome = "stopped, a dialogue or menu opened"
+        elif task.tiles_walked >= self.config['navigation_max_tiles']:
+            outcome = f"gave up after walking {task.tiles_walked} tiles"
+        elif task.replans > self.config['navigation_max_replans']:
+            outcome = f"gave up after {task.replans - 1} detours"
+        else:
+            path = self.map_memory.plan(state, task.goal)
+            if path is None:
+                outcome = "no path known, walk there yourself"
+        
+        if outcome:
+            task.outcome = outcome
+            session.navigation = None
+            session.plan_tracker.clear()
+            session.save_last_action(None, f"GOAL {task.description}: {outcome}")
+            self.logger.info("Navigation to %s %s", task.description, outcome)
+            return None
+        
+        buttons, expected = path
+        chunk = self.config['navigation_chunk_tiles']
+        if task.expected and state.position != task.expected[-1]:
+            task.replans += 1
+            self.metrics.inc('navigation_replans')
+        task.expected = expected[:chunk]
+        
+        hold = self.config['navigation_hold_frames']
+        plan = [(button, hold, 1) for button in buttons[:chunk]]
+        plan_id = session.plan_tracker.start(plan, image)
+        session.save_last_action(plan[0][0], f"GOAL {task.description} "
+                                             f"({describe_plan(plan, BUTTON_NAMES, hold)})")
+        self.logger.info("Plan %d: %d of %d tiles towards %s", plan_id, len(plan), len(buttons), task.description)
+        return plan
+    
+    def continue_navigation(self, session, screenshot_path=None, image=None):
+        """Send the next navigation plan after the last one finished or stopped; None hands over to the model"""
+        if image is None:
+            image = PIL.Image.open(screenshot_path)
+            image.load()
+        plan = self.navigation_plan(session, image)
+        if plan is None:
+            return None
+        session.last_decision = {'button': plan[0][0], 'notepad_update': None, 'plan': plan,
+                                 'plan_id': session.plan_tracker.plan_id}
+        self.log_decision(session, 'navigation', time.time(), button=plan[0][0], plan=plan,
+                          goal=session.navigation.description,
+                          game_state=session.game_state.to_dict() if session.game_state else None)
+        return session.last_decision
+    
+    def parse_llm_response(self, session, response_text):
+        """Parse the LLM response to extract button press, notepad update, thinking, plan and goal"""
         button_press = None
         notepad_update = None
         thinking = None
+        plan = None
+        goal = None
         
         # Button mapping
         button_map = {
@@ -473,14 +988,17 @@ class PokemonGameController:
         
         # Find each section
         think_match = re.search(r"THINK:\s*(.*?)(?=BUTTON:|$)", response_text, re.DOTALL)
-        button_match = re.search(r"BUTTON:\s*(.*?)(?=NOTEPAD:|$)", response_text, re.DOTALL)
+        button_match = re.search(r"BUTTON:\s*(.*?)(?=PLAN:|GOAL:|CONFIDENCE:|NOTEPAD:|$)", response_text, re.DOTALL)
+        plan_match = re.search(r"PLAN:\s*(.*?)(?=GOAL:|CONFIDENCE:|NOTEPAD:|$)", response_text, re.DOTALL)
+        goal_match = re.search(r"GOAL:\s*(.*?)(?=CONFIDENCE:|NOTEPAD:|$)", response_text, re.DOTALL)
         notepad_match = re.search(r"NOTEPAD:\s*(.*?)$", response_text, re.DOTALL)
         
         # Extract thinking
         if think_match:
             thinking = think_match.group(1).strip()
             # Save thinking to history
-            self.update_thinking_history(thinking)
+            with self.metrics.stage('thinking_history'):
+                session.update_thinking_history(thinking)
             
         # Extract button press
         if button_match:
@@ -490,7 +1008,22 @@ class PokemonGameController:
             else:
                 # Default to A if invalid button
                 button_press = 0
-                self.logger.warning(f"Invalid button '{button_value}', defaulting to A (0)")
+                self.metrics.inc('invalid_buttons')
+                self.logger.warning("Invalid button '%s', defaulting to A (0)", button_value)
+        
+        # Extract the optional multi-step plan; its first step is the button to press now
+        if plan_match and self.config['plan_enabled']:
+            plan, invalid = parse_plan(plan_match.group(1), button_map,
+                                       max_steps=self.config['plan_max_steps'],
+                                       default_hold=self.config['plan_hold_frames'])
+            if invalid:
+                self.logger.warning("Ignoring invalid plan steps: %s", ', '.join(invalid))
+            if plan:
+                button_press = plan[0][0]
+        
+        # Extract the optional navigation goal, walked to locally instead of one decision per tile
+        if goal_match and self.map_memory:
+            goal = parse_goal(goal_match.group(1))
         
         # Extract notepad update
         if notepad_match:
@@ -506,96 +1039,246 @@ class PokemonGameController:
                     # Add timestamp to notepad entries
                     timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
                     
-                    # Add to existing notepad with timestamp
-                    current_notepad = self.read_notepad()
-                    notepad_update = current_notepad + f"\n## Update {timestamp}\n{filtered_content}\n"
+                    # Appended to the notepad with a timestamp
+                    notepad_update = f"\n## Update {timestamp}\n{filtered_content}\n"
         
-        return button_press, notepad_update, thinking
+        return button_press, notepad_update, thinking, plan, goal
 
-    def handle_client(self, client_socket, client_address):
-        """Handle communication with the emulator client"""
-        self.logger.section(f"Connected to emulator at {client_address}")
-        self.current_client = client_socket
+    async def handle_client(self, reader, writer):
+        """Handle communication with an emulator client connection"""
+        client_address = writer.get_extra_info('peername')
+        self.logger.section("Connected to emulator at %s", client_address)
+        
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            self.configure_keepalive(sock)
+        
+        task = asyncio.current_task()
+        self.client_tasks.add(task)
         
         self.logger.game_state("Waiting for game data...")
         
-        while self.running:
-            try:
-                data = client_socket.recv(1024)
+        decoder = MessageDecoder()
+        session = None
+        worker = None
+        plan_progress = None  # Progress report for the plan step whose frame comes next
+        game_state = None     # RAM game state for the frame that comes next
+        
+        try:
+            while self.running:
+                data = await reader.read(65536)
                 if not data:
                     break
                 
-                # Parse the message from the emulator
-                message = data.decode('utf-8').strip()
-                
-                parts = message.split("||")
-                
-                if len(parts) >= 2:
-                    message_type = parts[0]
-                    content = parts[1]
+                # Handle every complete message; partial messages stay in the decoder
+                for message_type, payload in decoder.feed(data):
+                    if message_type == MSG_HELLO:
+                        # The emulator names its session; state is kept separate per name
+                        if session:
+                            session.connected = False
+                        session = await self.run_blocking(self.claim_session, payload.decode('utf-8'))
+                        self.logger.section("Emulator at %s joined session '%s'", client_address, session.session_id)
+                        continue
                     
-                    # Handle different message types
-                    if message_type == "screenshot":
-                        self.logger.game_state("Received new screenshot from emulator")
-                        
-                        # Verify the file exists
-                        if os.path.exists(content):
-                            decision = self.process_screenshot(content)
-                            
-                            if decision:
-                                # Send button press to emulator
-                                if decision['button'] is not None and self.running:
-                                    try:
-                                        client_socket.send(str(decision['button']).encode('utf-8') + b'\n')
-                                        self.logger.success("Button command sent to emulator")
-                                    except:
-                                        self.logger.error("Failed to send button command")
-                                        break
-                                
-                                # Update notepad if needed
-                                if decision['notepad_update']:
-                                    self.update_notepad(decision['notepad_update'])
-                                    self.summarize_notepad_if_needed()
-                        else:
-                            self.logger.error(f"Screenshot file not found at {content}")
+                    if session is None:
+                        session = await self.run_blocking(self.claim_session, DEFAULT_SESSION_ID)
+                        self.logger.info("Emulator at %s using session '%s'", client_address, session.session_id)
+                    
+                    if message_type == MSG_PLAN_PROGRESS:
+                        plan_progress = decode_plan_progress(payload)
+                    elif message_type == MSG_GAME_STATE:
+                        game_state = GameState.from_payload(payload)
+                    elif message_type in (MSG_FRAME, MSG_SCREENSHOT):
+                        self.metrics.inc('frames_received')
+                        if message_type == MSG_FRAME and self.config['trace_dir']:
+                            self.record_frame(session, payload)
+                        # Hand the frame to the decision worker; a newer frame replaces one still waiting
+                        if worker is None:
+                            session.frame_mailbox().clear()
+                            worker = asyncio.ensure_future(self.decision_worker(session, writer))
+                        session.frame_mailbox().put((message_type, payload, plan_progress, game_state))
+                        plan_progress = None
+                        game_state = None
+                    else:
+                        self.logger.warning("Ignoring unexpected %s message from emulator", MESSAGE_NAMES[message_type])
                 
-            except socket.error as e:
-                if e.args[0] != socket.EWOULDBLOCK and str(e) != 'Resource temporarily unavailable':
-                    self.logger.error(f"Socket error: {e}")
-                    break
+        except asyncio.CancelledError:
+            pass  # Server is shutting down
+        except ProtocolError as e:
+            self.logger.error("Protocol error, closing connection: %s", e)
+        except (ConnectionError, OSError) as e:
+            self.logger.error("Socket error: %s", e)
+        except Exception as e:
+            self.logger.error("Error handling client: %s", e)
+            if self.debug_mode:
+                import traceback
+                self.logger.debug(traceback.format_exc())
+        finally:
+            if worker:
+                worker.cancel()
+                await asyncio.gather(worker, return_exceptions=True)
+            if session:
+                session.connected = False
+                stats = session.frame_mailbox().stats()
+                self.logger.info("Session '%s' frames: %s decided, %s dropped as stale",
+                                 session.session_id, stats['frames_decided'], stats['frames_dropped'])
+            self.client_tasks.discard(task)
+            writer.close()
+            self.logger.section("Disconnected from emulator at %s", client_address)
+
+    def record_frame(self, session, payload):
+        """Save a received frame as a PNG under trace_dir/<session>/ for offline replay"""
+        session.trace_frames += 1
+        path = os.path.join(self.config['trace_dir'], session.session_id, f"{session.trace_frames:06d}.png")
+        
+        def encode():
+            width, height, pixels = decode_frame(payload)
+            return encode_png(PIL.Image.frombuffer('RGBX', (width, height), pixels, 'raw', 'RGBX', 0, 1))
+        
+        # Encoding and writing happen on the write-behind thread
+        self.state_writer.write(path, encode)
+
+    async def run_blocking(self, func, *args):
+        """Run a blocking call in the worker pool"""
+        return await self.loop.run_in_executor(self.executor, func, *args)
+
+    async def decision_worker(self, session, writer):
+        """Decide on the freshest frame in the session's mailbox until the connection closes"""
+        mailbox = session.frame_mailbox()
+        while self.running:
+            (message_type, payload, plan_progress, game_state), age = await mailbox.get()
+            self.metrics.observe('queue_wait', age)
+            stats = mailbox.stats()
+            self.logger.debug("Deciding on frame aged %.0fms (%d decided, %d dropped, p95 age %.0fms)",
+                              age * 1000, stats['frames_decided'], stats['frames_dropped'],
+                              stats['staleness_p95'] * 1000)
+            
+            try:
+                with self.metrics.stage('total'):
+                    connected = await self.handle_message(session, writer, message_type, payload, plan_progress,
+                                                          game_state)
             except Exception as e:
-                self.logger.error(f"Error handling client: {e}")
+                self.metrics.inc('errors')
+                self.logger.error("Error handling frame: %s", e)
                 if self.debug_mode:
                     import traceback
                     self.logger.debug(traceback.format_exc())
-                if not self.running:
-                    break
                 continue
+            
+            if not connected:
+                # Closing the writer ends the connection's reader loop too
+                writer.close()
+                return
+
+    async def handle_message(self, session, writer, message_type, payload, plan_progress=None, game_state=None):
+        """Handle one frame or screenshot message from the emulator
         
-        self.logger.section(f"Disconnected from emulator at {client_address}")
-        self.current_client = None
-        try:
-            client_socket.close()
-        except:
-            pass
+        Frames sent after a plan step are checked against the plan first; a
+        new decision is only made once the plan finished or went off track.
+        Returns False if the connection failed and should be closed.
+        """
+        if message_type == MSG_FRAME:
+            with self.metrics.stage('decode'):
+                width, height, pixels = decode_frame(payload)
+                image = PIL.Image.frombuffer('RGBX', (width, height), pixels, 'raw', 'RGBX', 0, 1)
+            self.logger.game_state("Received new frame from emulator")
+            screenshot_path = None
+            
+        elif message_type == MSG_SCREENSHOT:
+            screenshot_path = payload.decode('utf-8')
+            image = None
+            self.logger.game_state("Received new screenshot from emulator")
+            
+            # Verify the file exists
+            if not os.path.exists(screenshot_path):
+                self.logger.error("Screenshot file not found at %s", screenshot_path)
+                return True
+            
+        else:
+            return True
+        
+        # Decide one frame at a time per session; sessions run concurrently
+        async with session.decision_lock():
+            if plan_progress:
+                with self.metrics.stage('plan_check'):
+                    status, reason = await self.run_blocking(self.follow_plan, session, plan_progress,
+                                                             screenshot_path, image, game_state)
+                plan_id, steps_done, step_count = plan_progress
+                if status == 'continue':
+                    self.logger.debug("Plan %d on track after step %d of %d", plan_id, steps_done, step_count)
+                    return True
+                if status == 'abort':
+                    self.metrics.inc('plans_aborted')
+                    self.logger.warning("Plan %d went off track after step %d of %d (%s), stopping it",
+                                        plan_id, steps_done, step_count, reason)
+                    if not await self.send(writer, encode_plan_abort(plan_id)):
+                        return False
+                elif status == 'done':
+                    self.logger.info("Plan %d finished", plan_id)
+            
+            # Keep walking towards a navigation goal without asking the model
+            if session.navigation:
+                with self.metrics.stage('navigation'):
+                    decision = await self.run_blocking(self.continue_navigation, session, screenshot_path, image)
+                if decision:
+                    return await self.send_decision(session, writer, decision)
+            
+            with self.metrics.stage('decision'):
+                decision = await self.run_blocking(self.process_screenshot, session, screenshot_path, image,
+                                                   game_state)
+        
+        # The emulator only sends frames after an input (or on its slow fallback timer), so ask for one
+        if not decision or decision['button'] is None:
+            self.request_frame(session, writer)
+        
+        return await self.send_decision(session, writer, decision)
 
-    def handle_client_connection(self, client_socket, client_address):
-        """Wrapper around handle_client to properly handle connection errors"""
-        try:
-            self.handle_client(client_socket, client_address)
-        except Exception as e:
-            self.logger.error(f"Client connection error: {e}")
-        finally:
-            # Ensure we close the connection properly
-            if client_socket:
-                try:
-                    client_socket.close()
-                except:
-                    pass
+    def request_frame(self, session, writer):
+        """Ask the emulator for a new frame once the decision cooldown allows acting on it"""
+        cooldown_left = session.last_decision_time + self.decision_cooldown - time.time()
+        delay = max(self.config['frame_request_delay'], cooldown_left)
+        
+        def send_request():
+            if self.running and not writer.is_closing():
+                writer.write(encode_frame_request())
+        
+        self.loop.call_later(delay, send_request)
+
+    async def send_decision(self, session, writer, decision):
+        """Send a decision's button press to the emulator and apply its notepad update
+        
+        Returns False if the connection failed and should be closed.
+        """
+        if decision:
+            # Send the plan or button press to emulator
+            if decision['button'] is not None and self.running:
+                if decision.get('plan'):
+                    message = encode_plan(decision['plan_id'], decision['plan'])
+                else:
+                    message = encode_button(decision['button'])
+                with self.metrics.stage('send'):
+                    sent = await self.send(writer, message)
+                if not sent:
+                    self.logger.error("Failed to send button command")
+                    return False
+                self.metrics.inc('decisions')
+                self.logger.success("Button command sent to emulator")
             
-            # Remove client from our tracking
-            if self.current_client == client_socket:
-                self.current_client = None
+            # Update notepad if needed; summarizing runs in the background
+            if decision['notepad_update']:
+                with self.metrics.stage('notepad_update'):
+                    await self.run_blocking(session.append_notepad, decision['notepad_update'])
+                self.summarizer.summarize_if_needed(session)
+        return True
+
+    async def send(self, writer, message):
+        """Write a message to the emulator; returns False if the connection failed"""
+        try:
+            writer.write(message)
+            await writer.drain()
+            return True
+        except (ConnectionError, OSError):
+            return False
 
     def log_debug(self, message):
         """Log debug messages if debug mode is enabled"""
@@ -603,92 +1286,60 @@ class PokemonGameController:
             timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
             print(f"[DEBUG {timestamp}] {message}")
     
-    def extract_game_info(self, screenshot_path):
-        """
-        Extract useful game information from screenshots
-        This could be expanded with OCR or more advanced CV techniques
-        """
-        try:
-            # This is a placeholder for future OCR/CV improvements
-            # We could use OCR to extract text from the game screen
-            # For now, we'll just return the basic file info
-            if os.path.exists(screenshot_path):
-                file_size = os.path.getsize(screenshot_path)
-                timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-                return {
-                    "timestamp": timestamp,
-                    "file_size": file_size,
-                    "path": screenshot_path
-                }
-            return None
-        except Exception as e:
-            print(f"Error extracting game info: {e}")
-            return None
+    def extract_game_info(self, session):
+        """Return the session's RAM game state, screen type and screen text as a dict (or None)"""
+        info = session.game_state.to_dict() if session.game_state else {}
+        if session.screen:
+            info['screen'] = session.screen
+        if session.screen_text:
+            info['screen_text'] = session.screen_text
+        return info or None
 
-    def start(self):
-        """Start the controller server with improved connection handling"""
-        self.logger.header(f"Starting Pokémon Game Controller")
+    async def serve(self):
+        """Run the server until stop() is called or a termination signal arrives"""
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        
+        # Set up signal handlers for proper shutdown (only possible on the main thread)
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError, ValueError):
+                pass
+        
+        self.server = await self.start_server()
+        if self.metrics.enabled:
+            await self.start_metrics_server()
+        self.logger.section("Waiting for emulator connection...")
         
         try:
-            while self.running:
-                try:
-                    self.logger.section("Waiting for emulator connection...")
-                    client_socket, client_address = self.server_socket.accept()
-                    
-                    # Set SO_KEEPALIVE on the client socket
-                    client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-                    
-                    # Try to set TCP keepalive options if available
-                    try:
-                        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60)
-                        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)
-                        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 6)
-                    except (AttributeError, OSError):
-                        pass
-                    
-                    client_socket.setblocking(0)
-                    
-                    # Start client handler in a separate thread
-                    client_thread = threading.Thread(
-                        target=self.handle_client_connection,
-                        args=(client_socket, client_address)
-                    )
-                    client_thread.daemon = True
-                    client_thread.start()
-                    self.client_threads.append(client_thread)
-                
-                except socket.timeout:
-                    # Just a timeout, continue the loop
-                    continue
-                except KeyboardInterrupt:
-                    self.logger.section("Keyboard interrupt detected. Shutting down...")
-                    break
-                except Exception as e:
-                    if self.running:  # Only log if we're still supposed to be running
-                        self.logger.error(f"Error in main loop: {e}")
-                        if self.debug_mode:
-                            import traceback
-                            self.logger.debug(traceback.format_exc())
-                        # Short delay to prevent tight error loops
-                        time.sleep(1)
+            await self.stop_event.wait()
         finally:
-            # Ensure we clean up properly
             self.running = False
             self.logger.section("Closing all client connections...")
-            for t in self.client_threads:
-                try:
-                    t.join(timeout=1)
-                except:
-                    pass
+            self.server.close()
+            if self.metrics_server:
+                self.metrics_server.close()
             
+            # Cancel connection handlers and wait for them to finish closing their sockets
+            tasks = list(self.client_tasks)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.server.wait_closed()
+
+    def start(self):
+        """Start the controller server"""
+        self.logger.header("Starting Pokémon Game Controller")
+        
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            self.logger.section("Keyboard interrupt detected. Shutting down...")
+        finally:
             self.cleanup()
             self.logger.success("Server shut down cleanly")
 
 if __name__ == "__main__":
     controller = PokemonGameController()
-    try:
-        controller.start()
-    except KeyboardInterrupt:
-        pass  # Already handled in signal_handler
-    finally:
-        controller.cleanup()
\ No newline at end of file
+    controller.start()
\ No newline at end of file
@@ -0,0 +1,144 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import PIL.Image
+
+
+def notepad_digest(notepad_content, tail_chars=500):
+    """Digest the relevant (most recent) part of the notepad, ignoring update timestamps"""
+    content = re.sub(r"## Update [0-9:\- ]+", "## Update", notepad_content)
+    return hashlib.sha1(content[-tail_chars:].encode('utf-8')).hexdigest()[:16]
+
+
+def frame_digest(image, scale=2, shift=2):
+    """Exact digest of a frame downsampled by scale, with the low shift bits of each gray level dropped
+
+    Unlike the perceptual hash used by the frame-diff gate, any change that
+    survives the downsampling (another page of dialogue, the next corridor
+    tile) gives a different digest.
+    """
+    small = image.convert('L').resize((max(1, image.width // scale), max(1, image.height // scale)), PIL.Image.BOX)
+    return hashlib.sha1(small.point(lambda value: value >> shift << shift).tobytes()).hexdigest()[:20]
+
+
+class DecisionCache:
+    """LRU/TTL cache of LLM decisions with an on-disk JSON backing store"""
+
+    def __init__(self, path, max_entries=1000, ttl=86400, save_interval=30, writer=None):
+        self.path = path
+        self.writer = writer  # Optional write-behind writer; saves are synchronous without one
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.save_interval = save_interval
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.last_save_time = time.time()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.load()
+
+    @staticmethod
+    def make_key(frame_digest, last_action, notepad_hash, screen_text=None, game_state=None):
+        """Build a cache key from the frame digest and decision context
+
+        The map, position and facing from the RAM game state and the text read
+        from the screen are part of the key when there are any.
+        """
+        key = f"{frame_digest}|{last_action}|{notepad_hash}"
+        if game_state is not None:
+            key += f"|{game_state.map_group}.{game_state.map_num}:{game_state.x},{game_state.y}:{game_state.facing}"
+        if screen_text:
+            key += "|" + hashlib.sha1(screen_text.encode('utf-8')).hexdigest()[:16]
+        return key
+
+    def get(self, key):
+        """Return the cached decision for key, or None on a miss"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry['time'] > self.ttl:
+                del self.entries[key]
+                self.evictions += 1
+                self.dirty = True
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry['decision']
+
+    def put(self, key, decision):
+        """Store a decision, evicting the least recently used entries if full"""
+        with self.lock:
+            self.entries[key] = {'decision': decision, 'time': time.time()}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            self.dirty = True
+
+        if time.time() - self.last_save_time >= self.save_interval:
+            self.save()
+
+    def load(self):
+        """Load unexpired entries from the backing store"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                stored = json.load(f)
+        except Exception as e:
+            print(f"Error loading decision cache: {e}")
+            return
+
+        now = time.time()
+        for key, entry in stored.items():
+            if now - entry['time'] <= self.ttl:
+                self.entries[key] = entry
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def save(self):
+        """Write the cache to the backing store if it changed"""
+        with self.lock:
+            if not self.dirty:
+                return
+            snapshot = dict(self.entries)
+            self.dirty = False
+            self.last_save_time = time.time()
+
+        if self.writer:
+            # Serialize on the writer thread, off the decision path
+            self.writer.write(self.path, lambda: json.dumps(snapshot))
+            return
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Error saving decision cache: {e}")
+
+    def stats(self):
+        """Return the cache counters as a dict"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
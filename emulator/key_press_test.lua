@@ -35,31 +35,47 @@ function frameCounter()
     end
 end
 
+-- Framed protocol: 1 byte message type, 4 byte big-endian payload length, payload
+MSG_BUTTON = 3
+incomingBuffer = ""
+
 -- Socket management functions
+function pressKey(keyIndex)
+    if keyIndex >= 0 and keyIndex <= 9 then
+        local keyNames = { "A", "B", "SELECT", "START", "RIGHT", "LEFT", "UP", "DOWN", "R", "L" }
+        
+        -- Clear any existing key press
+        emu:clearKeys(0x3FF)
+        currentKeyIndex = keyIndex
+        keyPressStartFrame = emu:currentFrame()
+        
+        -- Press the key (will be held by frame counter)
+        emu:addKey(keyIndex)
+        debugBuffer:print("Pressing key: " .. keyNames[keyIndex + 1] .. "\n")
+    else
+        debugBuffer:print("Invalid key index: " .. keyIndex .. "\n")
+    end
+end
+
 function socketReceived()
     local data, err = statusSocket:receive(1024)
     
     if data then
-        -- Trim whitespace
-        data = data:gsub("^%s*(.-)%s*$", "%1")
-        debugBuffer:print("Received: '" .. data .. "'\n")
-        
-        -- Convert to key index
-        local keyIndex = tonumber(data)
+        incomingBuffer = incomingBuffer .. data
         
-        if keyIndex and keyIndex >= 0 and keyIndex <= 9 then
-            local keyNames = { "A", "B", "SELECT", "START", "RIGHT", "LEFT", "UP", "DOWN", "R", "L" }
+        -- Parse every complete message
+        while #incomingBuffer >= 5 do
+            local messageType, length = string.unpack(">BI4", incomingBuffer)
+            if #incomingBuffer < 5 + length then break end
             
-            -- Clear any existing key press
-            emu:clearKeys(0x3FF)
-            currentKeyIndex = keyIndex
-            keyPressStartFrame = emu:currentFrame()
+            local payload = incomingBuffer:sub(6, 5 + length)
+            incomingBuffer = incomingBuffer:sub(6 + length)
             
-            -- Press the key (will be held by frame counter)
-            emu:addKey(keyIndex)
-            debugBuffer:print("Pressing key: " .. keyNames[keyIndex + 1] .. "\n")
-        else
-            debugBuffer:print("Invalid key index: '" .. data .. "'\n")
+            if messageType == MSG_BUTTON and #payload == 1 then
+                pressKey(string.byte(payload))
+            else
+                debugBuffer:print("Ignoring message type " .. messageType .. "\n")
+            end
         end
     elseif err ~= socket.ERRORS.AGAIN then
         debugBuffer:print("Socket error: " .. err .. "\n")
@@ -13,6 +13,11 @@ statusSocket = nil
 lastScreenshotTime = 0
 screenshotInterval = 3  -- seconds
 
+-- Framed protocol: 1 byte message type, 4 byte big-endian payload length, payload
+MSG_SCREENSHOT = 1
+MSG_BUTTON = 3
+incomingBuffer = ""
+
 -- Function to take screenshots and send to the controller
 function captureAndSendScreenshot()
     local currentTime = os.time()
@@ -28,7 +33,7 @@ function captureAndSendScreenshot()
         
         -- Send message to controller if socket is connected
         if statusSocket then
-            statusSocket:send("screenshot||" .. screenshotPath .. "\n")
+            statusSocket:send(string.pack(">BI4", MSG_SCREENSHOT, #screenshotPath) .. screenshotPath)
             debugBuffer:print("Sent screenshot notification\n")
         else
             debugBuffer:print("Socket not connected\n")
@@ -67,15 +72,24 @@ function socketReceived()
     while true do
         local data, err = statusSocket:receive(1024)
         if data then
-            debugBuffer:print("Received: " .. data .. "\n")
+            incomingBuffer = incomingBuffer .. data
             
-            -- Convert to key press if it's a number
-            local keyIndex = tonumber(data)
-            if keyIndex and keyIndex >= 0 and keyIndex <= 9 then
-                local keyNames = { "A", "B", "SELECT", "START", "RIGHT", "LEFT", "UP", "DOWN", "R", "L" }
-                debugBuffer:print("Pressing key: " .. keyNames[keyIndex + 1] .. "\n")
-                emu:clearKeys(0x3FF)  -- Clear all keys
-                emu:addKey(keyIndex)  -- Press the received key
+            -- Parse every complete message
+            while #incomingBuffer >= 5 do
+                local messageType, length = string.unpack(">BI4", incomingBuffer)
+                if #incomingBuffer < 5 + length then break end
+                
+                local payload = incomingBuffer:sub(6, 5 + length)
+                incomingBuffer = incomingBuffer:sub(6 + length)
+                
+                -- Convert to key press if it's a button message
+                local keyIndex = string.byte(payload)
+                if messageType == MSG_BUTTON and keyIndex and keyIndex <= 9 then
+                    local keyNames = { "A", "B", "SELECT", "START", "RIGHT", "LEFT", "UP", "DOWN", "R", "L" }
+                    debugBuffer:print("Pressing key: " .. keyNames[keyIndex + 1] .. "\n")
+                    emu:clearKeys(0x3FF)  -- Clear all keys
+                    emu:addKey(keyIndex)  -- Press the received key
+                end
             end
         else
             if err ~= socket.ERRORS.AGAIN then
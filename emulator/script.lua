@@ -2,13 +2,54 @@
 
 -- Socket setup for communication with Python controller
 statusSocket     = nil
-lastScreenshotTime = 0
-screenshotInterval = 3  -- Capture screenshots every 3 seconds
+fallbackIntervalFrames = 600  -- Send a frame at least this often (about 10 seconds) when nothing else triggers one
+settleFrames = 6        -- Frames the screen must stay still after an input is released before its frame is sent
+sendRawFrames = true    -- Send the framebuffer over the socket instead of a PNG path
+outgoingBuffer = ""     -- Data waiting to be written to the socket
+sessionName = "default" -- Give each emulator a unique name when running several against one controller
+sendGameState = true    -- Read the game state from RAM (Fire Red US 1.0) and send it with every frame
 
 -- Global variables for key press tracking
 local currentKeyIndex = nil
 local keyPressStartFrame = 0
 local keyPressFrames = 30  -- Hold keys for 30 frames (about 0.5 seconds)
+local currentHoldFrames = keyPressFrames
+
+-- Input queue for multi-step plans: one {key, hold, step} entry per press
+local inputQueue = {}
+local currentPress = nil       -- Queue entry being pressed right now
+local planId = 0
+local planSteps = 0            -- Steps in the running plan, 0 when no plan is running
+local nextPressFrame = 0       -- First frame on which the next queued press may start
+local pressGapFrames = 8       -- Released frames between presses so repeated presses register
+local progressStep = nil       -- Finished step waiting to be reported with its frame
+
+-- Event-driven frame triggers
+local lastFrameSentFrame = nil -- Frame number of the last frame sent to the controller
+local frameRequested = false   -- The controller asked for a frame
+local awaitingSettle = false   -- An input was released; send a frame once the screen settles
+local settleStartFrame = 0
+local stillFrames = 0          -- Consecutive frames the screen has been still
+local lastSample = nil
+local lastSampleFrame = nil    -- Frame number of lastSample
+local settleSampleInterval = 3 -- Compare the screen every this many frames; each comparison copies the whole frame
+local settleMaxFrames = 90     -- Send anyway after this long if the screen keeps moving (animated tiles, NPCs)
+local settleChangedPixels = 3  -- Sampled pixels allowed to change between frames of a still screen
+
+-- Fire Red (US 1.0) RAM addresses read for the game state
+local RAM = {
+    saveBlock1Ptr = 0x03005008,  -- Pointer to SaveBlock1; the map group and number are at +4 and +5
+    playerAvatar = 0x02037078,   -- gPlayerAvatar; the player's object event index is at +5
+    objectEvents = 0x02036E38,   -- gObjectEvents, 0x24 bytes each
+    main = 0x030030F0,           -- gMain; bit 1 of the byte at +0x439 is set in battle
+    partyCount = 0x02024029,
+    party = 0x02024284,          -- gPlayerParty, 100 bytes per Pokemon
+}
+local OBJECT_EVENT_SIZE = 0x24
+local PARTY_MON_SIZE = 100
+local MAP_OFFSET = 7             -- Object coordinates include a 7 tile border
+-- Position of the Growth substructure (which holds the species) for each personality % 24 order
+local GROWTH_POSITION = { 0, 0, 0, 0, 0, 0, 1, 1, 2, 3, 2, 3, 1, 1, 2, 3, 2, 3, 1, 1, 2, 3, 2, 3 }
 
 -- Debug buffer setup
 function setupBuffer()
@@ -18,30 +59,170 @@ function setupBuffer()
     debugBuffer:print("Debug buffer initialized\n")
 end
 
--- Screenshot capture function
+-- Screenshot capture function: sends a frame once the last input has settled or the
+-- controller asks for one; the fixed interval is only a fallback
 function captureAndSendScreenshot()
-    local currentTime = os.time()
+    if currentKeyIndex ~= nil then return end  -- Never capture while a key is held
+    local currentFrame = emu:currentFrame()
+    
+    local reason = nil
+    if awaitingSettle then
+        if screenSettled(currentFrame) then reason = "settled" end
+    elseif frameRequested then
+        reason = "requested"
+    elseif planSteps == 0 and (lastFrameSentFrame == nil or currentFrame - lastFrameSentFrame >= fallbackIntervalFrames) then
+        reason = "fallback"
+    end
+    if not reason then return end
+    
+    -- A finished plan step is reported right before its frame
+    if progressStep then
+        sendMessage(MSG_PLAN_PROGRESS, string.pack(">I2BB", planId, progressStep, planSteps))
+        if progressStep == planSteps then
+            debugBuffer:print("Plan " .. planId .. " finished\n")
+            planSteps = 0
+        end
+        progressStep = nil
+    end
+    
+    sendScreen()
+    debugBuffer:print("Frame trigger: " .. reason .. "\n")
+    awaitingSettle = false
+    frameRequested = false
+    lastFrameSentFrame = currentFrame
+end
+
+-- Start waiting for the screen to settle after an input was released
+function waitForSettle(currentFrame)
+    awaitingSettle = true
+    settleStartFrame = currentFrame
+    stillFrames = 0
+    lastSample = nil
+    lastSampleFrame = nil
+end
+
+-- Compare a sparse grid of pixels with the previous sample, taken settleSampleInterval frames
+-- earlier; true once the screen has been still for settleFrames frames (or settleMaxFrames have passed)
+function screenSettled(currentFrame)
+    if currentFrame - settleStartFrame >= settleMaxFrames then return true end
+    if lastSampleFrame and currentFrame - lastSampleFrame < settleSampleInterval then return false end
+    
+    local image = emu:screenshotToImage()
+    local sample = {}
+    local changed = 0
+    local i = 0
+    for y = 4, image.height - 1, 16 do
+        for x = 4, image.width - 1, 16 do
+            i = i + 1
+            sample[i] = image:getPixel(x, y)
+            if lastSample and lastSample[i] ~= sample[i] then changed = changed + 1 end
+        end
+    end
+    
+    if lastSample and changed <= settleChangedPixels then
+        stillFrames = stillFrames + currentFrame - lastSampleFrame
+    else
+        stillFrames = 0
+    end
+    lastSample = sample
+    lastSampleFrame = currentFrame
+    
+    return stillFrames >= settleFrames
+end
+
+-- Send the current screen to the controller as a raw frame or a screenshot path,
+-- preceded by the game state read from RAM
+function sendScreen()
+    if sendGameState then
+        local ok, payload = pcall(readGameState)
+        if ok then
+            sendMessage(MSG_GAME_STATE, payload)
+        else
+            debugBuffer:print("Game state read failed, disabling it: " .. tostring(payload) .. "\n")
+            sendGameState = false
+        end
+    end
     
-    -- Only capture screenshots every 3 seconds
-    if currentTime - lastScreenshotTime >= screenshotInterval then
+    if sendRawFrames then
+        local width, height, pixels = captureFrame()
+        sendFrame(width, height, pixels) -- Send the framebuffer to Python controller
+        debugBuffer:print("Frame captured and sent: " .. width .. "x" .. height .. "\n")
+    else
         local screenshotPath = "/Users/alex/Documents/gemini-plays-pokemon/data/screenshots/screenshot.png"
         emu:screenshot(screenshotPath) -- Take the screenshot
-        sendMessage("screenshot", screenshotPath) -- Send path to Python controller
+        sendMessage(MSG_SCREENSHOT, screenshotPath) -- Send path to Python controller
         debugBuffer:print("Screenshot captured and sent: " .. screenshotPath .. "\n")
-        
-        -- Update the last screenshot time
-        lastScreenshotTime = currentTime
     end
 end
 
--- Frame counter to manage key press duration
+-- Read a signed 16-bit value
+function readS16(address)
+    local value = emu:read16(address)
+    if value >= 0x8000 then value = value - 0x10000 end
+    return value
+end
+
+-- Species of a party Pokemon, from the Growth substructure of its encrypted data
+function readSpecies(base)
+    local personality = emu:read32(base)
+    local key = personality ~ emu:read32(base + 4)
+    local growth = base + 32 + GROWTH_POSITION[personality % 24 + 1] * 12
+    return (emu:read32(growth) ~ key) & 0xFFFF
+end
+
+-- Pack the game state: >BBhhBBB map group, map number, x, y, facing, flags, party size,
+-- then >HBHH species, level, HP, max HP per party member
+function readGameState()
+    local saveBlock1 = emu:read32(RAM.saveBlock1Ptr)
+    local mapGroup = emu:read8(saveBlock1 + 4)
+    local mapNum = emu:read8(saveBlock1 + 5)
+    
+    local player = RAM.objectEvents + emu:read8(RAM.playerAvatar + 5) * OBJECT_EVENT_SIZE
+    local x = readS16(player + 0x10) - MAP_OFFSET
+    local y = readS16(player + 0x12) - MAP_OFFSET
+    local facing = emu:read8(player + 0x18) & 0x0F
+    
+    local flags = 0
+    if emu:read8(RAM.main + 0x439) & 0x02 ~= 0 then flags = flags | 0x01 end  -- In battle
+    if emu:read32(player) & 0x100 ~= 0 then flags = flags | 0x02 end        -- Player frozen: dialogue, menu or script
+    
+    local count = math.min(emu:read8(RAM.partyCount), 6)
+    local parts = { string.pack(">BBi2i2BBB", mapGroup, mapNum, x, y, facing, flags, count) }
+    for i = 0, count - 1 do
+        local base = RAM.party + i * PARTY_MON_SIZE
+        parts[#parts + 1] = string.pack(">I2BI2I2", readSpecies(base), emu:read8(base + 0x54),
+                                        emu:read16(base + 0x56), emu:read16(base + 0x58))
+    end
+    return table.concat(parts)
+end
+
+-- Read the framebuffer as raw RGBX bytes (4 bytes per pixel, row-major)
+function captureFrame()
+    local image = emu:screenshotToImage()
+    local pack = string.pack
+    local rows = {}
+    
+    for y = 0, image.height - 1 do
+        local row = {}
+        for x = 0, image.width - 1 do
+            -- getPixel returns 0xRRGGBB; shift it into R, G, B, X byte order
+            row[x + 1] = pack(">I4", (image:getPixel(x, y) & 0xFFFFFF) << 8)
+        end
+        rows[y + 1] = table.concat(row)
+    end
+    
+    return image.width, image.height, table.concat(rows)
+end
+
+-- Frame counter to manage key press duration and the plan input queue
 function handleKeyPress()
+    local currentFrame = emu:currentFrame()
+    
     -- If we're currently pressing a key
     if currentKeyIndex ~= nil then
-        local currentFrame = emu:currentFrame()
         local framesPassed = currentFrame - keyPressStartFrame
         
-        if framesPassed < keyPressFrames then
+        if framesPassed < currentHoldFrames then
             -- Keep pressing the key
             emu:addKey(currentKeyIndex)
         else
@@ -50,14 +231,160 @@ function handleKeyPress()
             local keyNames = { "A", "B", "SELECT", "START", "RIGHT", "LEFT", "UP", "DOWN", "R", "L" }
             debugBuffer:print("Released " .. keyNames[currentKeyIndex + 1] .. " after " .. framesPassed .. " frames\n")
             currentKeyIndex = nil
+            nextPressFrame = currentFrame + pressGapFrames
+            
+            -- A single press, or the last press of a plan step, is followed by a frame once the screen settles
+            if currentPress == nil then
+                waitForSettle(currentFrame)
+            elseif currentPress.step and (#inputQueue == 0 or inputQueue[1].step ~= currentPress.step) then
+                progressStep = currentPress.step
+                waitForSettle(currentFrame)
+            end
+            currentPress = nil
         end
+        return
     end
+    
+    -- Start the next queued press once the previous step has been reported
+    if progressStep == nil and #inputQueue > 0 and currentFrame >= nextPressFrame then
+        currentPress = table.remove(inputQueue, 1)
+        startPress(currentPress.key, currentPress.hold)
+    end
+end
+
+-- Press and hold a key; the frame callback releases it after holdFrames frames
+function startPress(keyIndex, holdFrames)
+    emu:clearKeys(0x3FF)
+    currentKeyIndex = keyIndex
+    currentHoldFrames = holdFrames
+    keyPressStartFrame = emu:currentFrame()
+    emu:addKey(keyIndex)
+end
+
+-- Drop the running plan and any queued presses
+function clearPlan()
+    inputQueue = {}
+    currentPress = nil
+    planSteps = 0
+    progressStep = nil
+    awaitingSettle = false
 end
 
+-- Framed protocol: 1 byte message type, 4 byte big-endian payload length, payload
+-- (keep the message type IDs in sync with protocol.py)
+MSG_SCREENSHOT = 1
+MSG_FRAME = 2
+MSG_BUTTON = 3
+MSG_HELLO = 4
+MSG_PLAN = 5
+MSG_PLAN_PROGRESS = 6
+MSG_PLAN_ABORT = 7
+MSG_FRAME_REQUEST = 8
+MSG_GAME_STATE = 9
+incomingBuffer = ""     -- Received data waiting to be parsed into messages
+
 -- Socket management functions
-function sendMessage(messageType, content)
+function sendMessage(messageType, payload)
+    queueData(string.pack(">BI4", messageType, #payload) .. payload)
+end
+
+-- Send a frame as its width and height followed by the raw pixel payload
+function sendFrame(width, height, pixels)
+    sendMessage(MSG_FRAME, string.pack(">I2I2", width, height) .. pixels)
+end
+
+-- Queue data for the socket; large frames may need several frames to write out
+function queueData(data)
     if statusSocket then
-        statusSocket:send(messageType .. "||" .. content .. "\n")
+        outgoingBuffer = outgoingBuffer .. data
+        flushOutgoing()
+    end
+end
+
+function flushOutgoing()
+    if not statusSocket or #outgoingBuffer == 0 then return end
+    
+    local sent, err = statusSocket:send(outgoingBuffer)
+    if sent then
+        outgoingBuffer = outgoingBuffer:sub(sent + 1)
+    elseif err ~= socket.ERRORS.AGAIN then
+        debugBuffer:print("Socket send error: " .. err .. "\n")
+        stopSocket()
+    end
+end
+
+-- Press a button received from the controller
+function pressButton(keyIndex)
+    if keyIndex >= 0 and keyIndex <= 9 then
+        local keyNames = { "A", "B", "SELECT", "START", "RIGHT", "LEFT", "UP", "DOWN", "R", "L" }
+        
+        -- A single button replaces any running plan
+        clearPlan()
+        
+        -- Press the key (it will be held by frame callback)
+        startPress(keyIndex, keyPressFrames)
+        debugBuffer:print("AI pressing: " .. keyNames[keyIndex + 1] .. " (will hold for " .. keyPressFrames .. " frames)\n")
+    else
+        debugBuffer:print("Invalid key index received: " .. keyIndex .. "\n")
+    end
+end
+
+-- Queue a plan: >I2 plan ID, >B step count, then >BBB key, hold frames, repeat count per step
+function startPlan(payload)
+    local id, count = string.unpack(">I2B", payload)
+    if #payload ~= 3 + count * 3 or count == 0 then
+        debugBuffer:print("Invalid plan payload\n")
+        return
+    end
+    
+    clearPlan()
+    emu:clearKeys(0x3FF)
+    currentKeyIndex = nil
+    nextPressFrame = emu:currentFrame()
+    
+    local keyNames = { "A", "B", "SELECT", "START", "RIGHT", "LEFT", "UP", "DOWN", "R", "L" }
+    local description = {}
+    for step = 1, count do
+        local key, hold, repeatCount = string.unpack(">BBB", payload, 4 + (step - 1) * 3)
+        if key > 9 then
+            debugBuffer:print("Invalid key index in plan: " .. key .. "\n")
+            clearPlan()
+            return
+        end
+        for _ = 1, repeatCount do
+            inputQueue[#inputQueue + 1] = { key = key, hold = hold, step = step }
+        end
+        description[#description + 1] = keyNames[key + 1] .. " x" .. repeatCount
+    end
+    
+    planId = id
+    planSteps = count
+    debugBuffer:print("AI plan " .. id .. ": " .. table.concat(description, ", ") .. "\n")
+end
+
+-- Stop the running plan if it is the one the controller wants stopped
+function abortPlan(payload)
+    local id = string.unpack(">I2", payload)
+    if planSteps > 0 and id == planId then
+        clearPlan()
+        emu:clearKeys(0x3FF)
+        currentKeyIndex = nil
+        debugBuffer:print("Plan " .. id .. " aborted by controller\n")
+    end
+end
+
+-- Handle one complete message from the controller
+function handleMessage(messageType, payload)
+    if messageType == MSG_BUTTON and #payload == 1 then
+        pressButton(string.byte(payload))
+    elseif messageType == MSG_PLAN and #payload >= 3 then
+        startPlan(payload)
+    elseif messageType == MSG_PLAN_ABORT and #payload == 2 then
+        abortPlan(payload)
+    elseif messageType == MSG_FRAME_REQUEST then
+        frameRequested = true
+    else
+        debugBuffer:print("Ignoring unexpected message type " .. messageType .. "\n")
     end
 end
 
@@ -65,28 +392,16 @@ function socketReceived()
     local data, err = statusSocket:receive(1024)
     
     if data then
-        -- Trim whitespace
-        data = data:gsub("^%s*(.-)%s*$", "%1")
-        debugBuffer:print("Received from AI controller: '" .. data .. "'\n")
-        
-        -- Convert to key index
-        local keyIndex = tonumber(data)
+        incomingBuffer = incomingBuffer .. data
         
-        if keyIndex and keyIndex >= 0 and keyIndex <= 9 then
-            local keyNames = { "A", "B", "SELECT", "START", "RIGHT", "LEFT", "UP", "DOWN", "R", "L" }
-            
-            -- Clear existing key presses
-            emu:clearKeys(0x3FF)
+        -- Parse every complete message; a partial message stays in the buffer
+        while #incomingBuffer >= 5 do
+            local messageType, length = string.unpack(">BI4", incomingBuffer)
+            if #incomingBuffer < 5 + length then break end
             
-            -- Set up the key press to be held
-            currentKeyIndex = keyIndex
-            keyPressStartFrame = emu:currentFrame()
-            
-            -- Press the key (it will be held by frame callback)
-            emu:addKey(keyIndex)
-            debugBuffer:print("AI pressing: " .. keyNames[keyIndex + 1] .. " (will hold for " .. keyPressFrames .. " frames)\n")
-        else
-            debugBuffer:print("Invalid key data received: '" .. data .. "'\n")
+            local payload = incomingBuffer:sub(6, 5 + length)
+            incomingBuffer = incomingBuffer:sub(6 + length)
+            handleMessage(messageType, payload)
         end
     elseif err ~= socket.ERRORS.AGAIN then
         debugBuffer:print("Socket error: " .. err .. "\n")
@@ -104,6 +419,11 @@ function stopSocket()
     debugBuffer:print("Closing socket connection\n")
     statusSocket:close()
     statusSocket = nil
+    outgoingBuffer = ""
+    incomingBuffer = ""
+    clearPlan()
+    lastFrameSentFrame = nil  -- Send a frame as soon as we reconnect
+    frameRequested = false
 end
 
 function startSocket()
@@ -122,6 +442,7 @@ function startSocket()
     -- Connect to the controller
     if statusSocket:connect("127.0.0.1", 8888) then
         debugBuffer:print("Successfully connected to controller\n")
+        sendMessage(MSG_HELLO, sessionName)
     else
         debugBuffer:print("Failed to connect to controller\n")
         stopSocket()
@@ -133,6 +454,7 @@ callbacks:add("start", setupBuffer)
 callbacks:add("start", startSocket)
 callbacks:add("frame", captureAndSendScreenshot)
 callbacks:add("frame", handleKeyPress)
+callbacks:add("frame", flushOutgoing)
 
 -- Initialize on script load
 if emu then
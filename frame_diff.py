@@ -0,0 +1,84 @@
+import PIL.Image
+import PIL.ImageChops
+
+
+def perceptual_hash(image, hash_size=8):
+    """Compute a difference hash (dHash) of a frame as a hex string"""
+    pixels = list(image.convert('L').resize((hash_size + 1, hash_size), PIL.Image.BOX).getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+
+class FrameDiffGate:
+    """Perceptual frame-diff gate that decides whether a frame needs a new LLM decision"""
+
+    def __init__(self, thumbnail_size=(60, 40), pixel_tolerance=8, changed_ratio=0.01,
+                 max_skips=3, mode='skip'):
+        """
+        Compare frames on a downsampled grayscale thumbnail.
+
+        A thumbnail pixel counts as changed when it differs by more than
+        pixel_tolerance (0-255); the frame counts as unchanged when at most
+        changed_ratio of the thumbnail pixels changed. After max_skips
+        consecutive unchanged frames a decision is forced so the game can
+        never stall on a frame we refuse to act on.
+        """
+        self.thumbnail_size = tuple(thumbnail_size)
+        self.pixel_tolerance = pixel_tolerance
+        self.changed_ratio = changed_ratio
+        self.max_skips = max_skips
+        self.mode = mode
+
+        # Thumbnail of the last frame we made a decision on
+        self.reference = None
+        self.consecutive_skips = 0
+
+        # Counters
+        self.frames_checked = 0
+        self.calls_avoided = 0
+        self.decisions_reused = 0
+
+    def thumbnail(self, image):
+        """Downsample a frame to the grayscale thumbnail used for comparisons"""
+        return image.convert('L').resize(self.thumbnail_size, PIL.Image.BOX)
+
+    def changed_fraction(self, image):
+        """Return the fraction of thumbnail pixels that changed since the reference frame"""
+        if self.reference is None:
+            return 1.0
+
+        diff = PIL.ImageChops.difference(self.thumbnail(image), self.reference)
+        histogram = diff.histogram()
+        changed = sum(histogram[self.pixel_tolerance + 1:])
+        return changed / float(self.thumbnail_size[0] * self.thumbnail_size[1])
+
+    def should_skip(self, image):
+        """Check a frame against the reference; returns (skip, changed_fraction)"""
+        self.frames_checked += 1
+        changed = self.changed_fraction(image)
+
+        if changed > self.changed_ratio or self.consecutive_skips >= self.max_skips:
+            self.consecutive_skips = 0
+            return False, changed
+
+        self.consecutive_skips += 1
+        self.calls_avoided += 1
+        if self.mode == 'reuse':
+            self.decisions_reused += 1
+        return True, changed
+
+    def remember(self, image):
+        """Make this frame the reference for future comparisons"""
+        self.reference = self.thumbnail(image)
+
+    def stats(self):
+        """Return the gate counters as a dict"""
+        return {
+            'frames_checked': self.frames_checked,
+            'calls_avoided': self.calls_avoided,
+            'decisions_reused': self.decisions_reused,
+        }
@@ -0,0 +1,62 @@
+import time
+import asyncio
+from collections import deque
+
+
+class LatestFrameMailbox:
+    """Single-slot mailbox: the reader overwrites the slot, the worker always takes the freshest frame"""
+
+    def __init__(self, staleness_window=100):
+        self.item = None
+        self.received_at = None
+        self.event = asyncio.Event()
+
+        # Counters
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.frames_decided = 0
+        self.recent_staleness = deque(maxlen=staleness_window)
+        self.max_staleness = 0.0
+
+    def put(self, item):
+        """Store a frame, replacing (and dropping) any frame the worker hasn't taken yet"""
+        if self.item is not None:
+            self.frames_dropped += 1
+        self.item = item
+        self.received_at = time.monotonic()
+        self.frames_received += 1
+        self.event.set()
+
+    async def get(self):
+        """Wait for a frame and take it; returns (item, age in seconds)"""
+        while self.item is None:
+            self.event.clear()
+            await self.event.wait()
+
+        item, age = self.item, time.monotonic() - self.received_at
+        self.item = None
+        self.received_at = None
+        self.event.clear()
+
+        self.frames_decided += 1
+        self.recent_staleness.append(age)
+        self.max_staleness = max(self.max_staleness, age)
+        return item, age
+
+    def clear(self):
+        """Discard any pending frame without counting it as dropped"""
+        self.item = None
+        self.received_at = None
+        self.event.clear()
+
+    def stats(self):
+        """Return the mailbox counters and staleness of recent dispatched frames as a dict"""
+        recent = sorted(self.recent_staleness)
+        return {
+            'frames_received': self.frames_received,
+            'frames_dropped': self.frames_dropped,
+            'frames_decided': self.frames_decided,
+            'staleness_avg': sum(recent) / len(recent) if recent else 0.0,
+            'staleness_p95': recent[int(0.95 * (len(recent) - 1))] if recent else 0.0,
+            'staleness_max': self.max_staleness,
+        }
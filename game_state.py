@@ -0,0 +1,135 @@
+"""
+Game state read from the emulator's RAM.
+
+emulator/script.lua reads a few Fire Red memory values (map, player
+position and facing, battle and field-control flags, party) and sends them
+as a MSG_GAME_STATE message before each frame. GameState turns the payload
+into a typed object and a short line of text for the prompt, so the model
+doesn't have to infer these from pixels.
+"""
+from protocol import decode_game_state
+
+FLAG_IN_BATTLE = 0x01
+FLAG_CONTROLS_LOCKED = 0x02  # Player frozen by a dialogue, menu or script
+
+FACING_NAMES = {1: "down", 2: "up", 3: "left", 4: "right"}
+
+# Fire Red species IDs match the National Dex for the first 251 Pokémon
+SPECIES_NAMES = (
+    "Bulbasaur", "Ivysaur", "Venusaur", "Charmander", "Charmeleon", "Charizard", "Squirtle", "Wartortle",
+    "Blastoise", "Caterpie", "Metapod", "Butterfree", "Weedle", "Kakuna", "Beedrill", "Pidgey", "Pidgeotto",
+    "Pidgeot", "Rattata", "Raticate", "Spearow", "Fearow", "Ekans", "Arbok", "Pikachu", "Raichu", "Sandshrew",
+    "Sandslash", "Nidoran F", "Nidorina", "Nidoqueen", "Nidoran M", "Nidorino", "Nidoking", "Clefairy",
+    "Clefable", "Vulpix", "Ninetales", "Jigglypuff", "Wigglytuff", "Zubat", "Golbat", "Oddish", "Gloom",
+    "Vileplume", "Paras", "Parasect", "Venonat", "Venomoth", "Diglett", "Dugtrio", "Meowth", "Persian",
+    "Psyduck", "Golduck", "Mankey", "Primeape", "Growlithe", "Arcanine", "Poliwag", "Poliwhirl", "Poliwrath",
+    "Abra", "Kadabra", "Alakazam", "Machop", "Machoke", "Machamp", "Bellsprout", "Weepinbell", "Victreebel",
+    "Tentacool", "Tentacruel", "Geodude", "Graveler", "Golem", "Ponyta", "Rapidash", "Slowpoke", "Slowbro",
+    "Magnemite", "Magneton", "Farfetch'd", "Doduo", "Dodrio", "Seel", "Dewgong", "Grimer", "Muk", "Shellder",
+    "Cloyster", "Gastly", "Haunter", "Gengar", "Onix", "Drowzee", "Hypno", "Krabby", "Kingler", "Voltorb",
+    "Electrode", "Exeggcute", "Exeggutor", "Cubone", "Marowak", "Hitmonlee", "Hitmonchan", "Lickitung",
+    "Koffing", "Weezing", "Rhyhorn", "Rhydon", "Chansey", "Tangela", "Kangaskhan", "Horsea", "Seadra",
+    "Goldeen", "Seaking", "Staryu", "Starmie", "Mr. Mime", "Scyther", "Jynx", "Electabuzz", "Magmar", "Pinsir",
+    "Tauros", "Magikarp", "Gyarados", "Lapras", "Ditto", "Eevee", "Vaporeon", "Jolteon", "Flareon", "Porygon",
+    "Omanyte", "Omastar", "Kabuto", "Kabutops", "Aerodactyl", "Snorlax", "Articuno", "Zapdos", "Moltres",
+    "Dratini", "Dragonair", "Dragonite", "Mewtwo", "Mew",
+)
+
+# Outdoor Kanto maps (map group 3); other maps are reported by number
+MAP_NAMES = {
+    (3, 0): "Pallet Town", (3, 1): "Viridian City", (3, 2): "Pewter City", (3, 3): "Cerulean City",
+    (3, 4): "Lavender Town", (3, 5): "Vermilion City", (3, 6): "Celadon City", (3, 7): "Fuchsia City",
+    (3, 8): "Cinnabar Island", (3, 9): "Indigo Plateau", (3, 10): "Saffron City",
+}
+MAP_NAMES.update({(3, 18 + route): f"Route {route}" for route in range(1, 26)})
+
+
+def species_name(species):
+    """Name of a species ID, or its number for species outside the table"""
+    if 1 <= species <= len(SPECIES_NAMES):
+        return SPECIES_NAMES[species - 1]
+    return f"Pokémon #{species}"
+
+
+class PartyMember:
+    """One Pokémon in the player's party"""
+
+    def __init__(self, species, level, hp, max_hp):
+        self.species = species
+        self.level = level
+        self.hp = hp
+        self.max_hp = max_hp
+
+    @property
+    def name(self):
+        return species_name(self.species)
+
+    def describe(self):
+        """e.g. 'Charmander Lv8 21/26 HP'"""
+        return f"{self.name} Lv{self.level} {self.hp}/{self.max_hp} HP"
+
+    def to_dict(self):
+        return {'species': self.species, 'name': self.name, 'level': self.level,
+                'hp': self.hp, 'max_hp': self.max_hp}
+
+
+class GameState:
+    """Typed view of a MSG_GAME_STATE payload"""
+
+    def __init__(self, map_group, map_num, x, y, facing, flags, party):
+        self.map_group = map_group
+        self.map_num = map_num
+        self.x = x
+        self.y = y
+        self.facing = facing
+        self.flags = flags
+        self.party = party
+
+    @classmethod
+    def from_payload(cls, payload):
+        """Parse a game state message payload"""
+        map_group, map_num, x, y, facing, flags, party = decode_game_state(payload)
+        return cls(map_group, map_num, x, y, facing, flags, [PartyMember(*member) for member in party])
+
+    @property
+    def map_name(self):
+        return MAP_NAMES.get((self.map_group, self.map_num), f"map {self.map_group}.{self.map_num}")
+
+    @property
+    def in_battle(self):
+        return bool(self.flags & FLAG_IN_BATTLE)
+
+    @property
+    def controls_locked(self):
+        return bool(self.flags & FLAG_CONTROLS_LOCKED)
+
+    @property
+    def position(self):
+        """(map_group, map_num, x, y)"""
+        return self.map_group, self.map_num, self.x, self.y
+
+    def describe(self):
+        """A few lines of prompt text summarizing the state"""
+        if self.in_battle:
+            situation = "in a battle"
+        elif self.controls_locked:
+            situation = "in a dialogue or menu (can't walk)"
+        else:
+            situation = "walking around"
+        party = ", ".join(member.describe() for member in self.party) or "no Pokémon yet"
+        return (f"- Location: {self.map_name}, tile ({self.x}, {self.y}), "
+                f"facing {FACING_NAMES.get(self.facing, 'unknown')}\n"
+                f"- Situation: {situation}\n"
+                f"- Party: {party}")
+
+    def to_dict(self):
+        return {
+            'map': [self.map_group, self.map_num],
+            'map_name': self.map_name,
+            'x': self.x,
+            'y': self.y,
+            'facing': FACING_NAMES.get(self.facing),
+            'in_battle': self.in_battle,
+            'controls_locked': self.controls_locked,
+            'party': [member.to_dict() for member in self.party],
+        }
@@ -0,0 +1,141 @@
+"""
+Preprocessing for the frames sent to the model.
+
+Each frame is cropped to the game area, rescaled, palette-quantized and
+re-encoded in whichever of the configured formats comes out smallest.
+Frames are processed in a worker pool so sessions don't serialize on
+CPU-bound encoding.
+"""
+import io
+import time
+import threading
+import PIL.Image
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+MIME_TYPES = {'PNG': 'image/png', 'WEBP': 'image/webp', 'JPEG': 'image/jpeg'}
+
+
+def encode_image(image, image_format):
+    """Encode an image in the given format, losslessly where the format allows it"""
+    buffer = io.BytesIO()
+    if image_format == 'WEBP':
+        image.save(buffer, format='WEBP', lossless=True, method=4)
+    elif image_format == 'JPEG':
+        image.convert('RGB').save(buffer, format='JPEG', quality=90)
+    else:
+        image.save(buffer, format=image_format, optimize=True)
+    return buffer.getvalue()
+
+
+def preprocess(image, options, measure_baseline=False):
+    """Run one frame through the pipeline
+
+    Returns (blob, bytes_before, bytes_after, seconds). The blob is a
+    {'mime_type', 'data'} dict the Gemini client accepts as a content part.
+    bytes_before is the size of the lossless WebP the client would have
+    sent for the unprocessed frame (0 when not measured).
+    """
+    start_time = time.time()
+    image = image.convert('RGB')
+
+    bytes_before = len(encode_image(image, 'WEBP')) if measure_baseline else 0
+
+    if options['crop']:
+        image = image.crop(tuple(options['crop']))
+
+    scale = options['scale']
+    if scale != 1.0:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        # Nearest neighbour keeps pixel art edges and the palette intact
+        image = image.resize(size, PIL.Image.NEAREST)
+
+    if options['quantize_colors']:
+        image = image.quantize(colors=options['quantize_colors'], method=PIL.Image.FASTOCTREE)
+
+    best_format, best_data = None, None
+    for image_format in options['formats']:
+        data = encode_image(image, image_format)
+        if best_data is None or len(data) < len(best_data):
+            best_format, best_data = image_format, data
+
+    blob = {'mime_type': MIME_TYPES[best_format], 'data': best_data}
+    return blob, bytes_before, len(best_data), time.time() - start_time
+
+
+class ImagePipeline:
+    """Configurable frame preprocessing running in a thread or process pool"""
+
+    def __init__(self, crop=None, scale=1.0, quantize_colors=256, formats=('PNG', 'WEBP'),
+                 measure_baseline=False, workers=2, use_processes=False, logger=None):
+        """
+        measure_baseline also encodes the unprocessed frame of one request in
+        every measure_baseline (True for every request, False or 0 for none)
+        to report the bytes saved; it roughly doubles the cost of a frame.
+        """
+        self.options = {
+            'crop': crop,
+            'scale': scale,
+            'quantize_colors': quantize_colors,
+            'formats': [image_format.upper() for image_format in formats],
+        }
+        self.measure_every = int(measure_baseline)
+        self.logger = logger
+        pool_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self.pool = pool_class(max_workers=workers)
+        self.lock = threading.Lock()
+
+        # Metrics
+        self.requests = 0
+        self.images = 0
+        self.measured = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+        self.measured_bytes_after = 0  # Of the measured requests, to compare with bytes_before
+        self.total_time = 0.0
+
+    def process(self, images):
+        """Preprocess the images for one request in parallel and return their blobs"""
+        with self.lock:
+            measure = bool(self.measure_every) and self.requests % self.measure_every == 0
+            self.requests += 1
+        futures = [self.pool.submit(preprocess, image, self.options, measure) for image in images]
+        results = [future.result() for future in futures]
+
+        bytes_before = sum(result[1] for result in results)
+        bytes_after = sum(result[2] for result in results)
+        with self.lock:
+            self.images += len(results)
+            self.bytes_after += bytes_after
+            if measure:
+                self.measured += 1
+                self.bytes_before += bytes_before
+                self.measured_bytes_after += bytes_after
+            self.total_time += sum(result[3] for result in results)
+
+        if self.logger:
+            if bytes_before:
+                self.logger.info("Images: %d processed, %.1f KB -> %.1f KB (%.0f%% smaller)", len(results),
+                                 bytes_before / 1024, bytes_after / 1024, (1 - bytes_after / bytes_before) * 100)
+            else:
+                self.logger.info("Images: %d processed, %.1f KB", len(results), bytes_after / 1024)
+
+        return [result[0] for result in results]
+
+    def shutdown(self):
+        """Stop the worker pool"""
+        self.pool.shutdown(wait=False)
+
+    def stats(self):
+        """Return byte and timing totals as a dict"""
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'images': self.images,
+                'measured_requests': self.measured,
+                'bytes_before': self.bytes_before,
+                'bytes_after': self.bytes_after,
+                'avg_bytes_before': self.bytes_before / self.measured if self.measured else 0.0,
+                'measured_saving': 1 - self.measured_bytes_after / self.bytes_before if self.bytes_before else 0.0,
+                'avg_bytes_after': self.bytes_after / self.requests if self.requests else 0.0,
+                'avg_time_per_image': self.total_time / self.images if self.images else 0.0,
+            }
@@ -0,0 +1,175 @@
+"""
+Per-stage latency histograms and counters, served in Prometheus text format.
+
+Timing hooks are cheap context managers; when metrics are disabled they
+return a shared no-op timer, so instrumented code pays only a method call.
+"""
+import time
+import bisect
+import asyncio
+import threading
+
+# Histogram bucket upper bounds in seconds (+Inf is implicit)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+COUNTERS = {
+    'frames_received': "Frames and screenshots received from emulators",
+    'decisions': "Decisions sent to emulators",
+    'frames_skipped': "Frames skipped by the frame-diff gate",
+    'cooldown_rejects': "Frames dropped because the decision cooldown had not passed",
+    'cache_hits': "Decisions served from the decision cache",
+    'model_calls': "Decision requests sent to the model",
+    'model_retries': "Model requests retried after a failure",
+    'model_timeouts': "Model calls abandoned at their deadline",
+    'model_circuit_rejects': "Model calls refused while the circuit breaker was open",
+    'model_rate_limited': "Model requests delayed by the rate limit",
+    'model_hedges': "Duplicate requests sent for slow model calls",
+    'model_hedge_wins': "Model calls answered by their hedged duplicate first",
+    'cascade_fast_calls': "Decision requests sent to the fast model tier",
+    'cascade_strong_calls': "Decision requests sent to the strong model tier",
+    'cascade_routed_strong': "Decisions sent straight to the strong model (battle, stuck)",
+    'cascade_escalations': "Fast model answers re-asked of the strong model (unparsable, low confidence, failed)",
+    'invalid_buttons': "Model replies with an invalid button",
+    'plans_aborted': "Plans stopped early because they went off track",
+    'navigation_goals': "Navigation goals set by the model",
+    'navigation_tiles': "Tiles walked by the local navigator instead of one decision per tile",
+    'navigation_replans': "Navigation paths replanned locally after leaving the planned path",
+    'fast_path_decisions': "Frames answered by a fixed screen policy instead of the model",
+    'errors': "Errors while processing a frame",
+}
+
+
+class NullTimer:
+    """Timer used when metrics are disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class StageTimer:
+    """Times a block and records it in the stage's histogram"""
+
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """Latency histograms per stage, counters and gauges for the controller"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.histograms = {}  # stage -> [bucket counts..., +Inf count, sum]
+        self.counters = {name: 0 for name in COUNTERS}
+        self.gauges = {}      # name -> (help, callable returning the value)
+
+    def stage(self, name):
+        """Context manager timing one stage"""
+        if not self.enabled:
+            return NULL_TIMER
+        return StageTimer(self, name)
+
+    def observe(self, stage, seconds):
+        """Record a duration for a stage"""
+        if not self.enabled:
+            return
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = [0] * (len(BUCKETS) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += seconds
+
+    def inc(self, name, amount=1):
+        """Increment a counter"""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name, help_text, read_value):
+        """Register a gauge whose value is read when metrics are rendered"""
+        self.gauges[name] = (help_text, read_value)
+
+    def stats(self):
+        """Return counters and the mean time per stage (ms) as a dict"""
+        with self.lock:
+            stages = {stage: {'count': sum(values[:-1]), 'mean_ms': values[-1] * 1000 / max(sum(values[:-1]), 1)}
+                      for stage, values in self.histograms.items()}
+            return {'counters': dict(self.counters), 'stages': stages}
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            histograms = {stage: list(values) for stage, values in self.histograms.items()}
+            counters = dict(self.counters)
+
+        lines.append("# HELP pokemon_stage_seconds Time spent in each stage of handling a frame")
+        lines.append("# TYPE pokemon_stage_seconds histogram")
+        for stage in sorted(histograms):
+            values = histograms[stage]
+            cumulative = 0
+            for bound, count in zip(BUCKETS, values):
+                cumulative += count
+                lines.append(f'pokemon_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            cumulative += values[len(BUCKETS)]
+            lines.append(f'pokemon_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {cumulative}')
+            lines.append(f'pokemon_stage_seconds_sum{{stage="{stage}"}} {values[-1]:.6f}')
+            lines.append(f'pokemon_stage_seconds_count{{stage="{stage}"}} {cumulative}')
+
+        for name in sorted(counters):
+            lines.append(f"# HELP pokemon_{name}_total {COUNTERS.get(name, name)}")
+            lines.append(f"# TYPE pokemon_{name}_total counter")
+            lines.append(f"pokemon_{name}_total {counters[name]}")
+
+        for name in sorted(self.gauges):
+            help_text, read_value = self.gauges[name]
+            try:
+                value = read_value()
+            except Exception:
+                continue
+            lines.append(f"# HELP pokemon_{name} {help_text}")
+            lines.append(f"# TYPE pokemon_{name} gauge")
+            lines.append(f"pokemon_{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    async def handle_http(self, reader, writer):
+        """Minimal HTTP handler: GET /metrics returns the metrics, anything else 404"""
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass  # Skip headers
+
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, content_type, body = "200 OK", "text/plain; version=0.0.4", self.render().encode('utf-8')
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b"Not found\n"
+
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
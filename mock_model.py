@@ -0,0 +1,132 @@
+"""
+Deterministic local stand-in for genai.GenerativeModel.
+
+Used by the benchmark harness (and anything else that needs the controller
+to run without a Gemini key): replies come from a response script and each
+call sleeps for a configurable, seeded latency.
+"""
+import json
+import time
+import random
+import threading
+from prompts import estimate_tokens, IMAGE_TOKENS
+
+DEFAULT_SCRIPT = [
+    "THINK: The path ahead looks clear, I should keep walking.\nBUTTON: UP\nNOTEPAD: no change",
+    "THINK: There is a wall above me, trying another direction.\nBUTTON: RIGHT\nNOTEPAD: Wall north of the start position",
+    "THINK: A sign or person may be in front of me.\nBUTTON: A\nNOTEPAD: no change",
+    "THINK: The corridor continues down, walking several tiles.\nBUTTON: DOWN\nPLAN: DOWN x3, LEFT\nNOTEPAD: no change",
+    "THINK: Closing the dialogue box.\nBUTTON: B\nNOTEPAD: no change",
+]
+
+# Replies of a cheaper model for the cascade: mostly sure, sometimes unsure or off-format
+FAST_SCRIPT = [
+    "THINK: Open path ahead.\nBUTTON: UP\nCONFIDENCE: 85\nNOTEPAD: no change",
+    "THINK: Wall above, going right.\nBUTTON: RIGHT\nCONFIDENCE: 70\nNOTEPAD: no change",
+    "THINK: Not sure what this is.\nBUTTON: A\nCONFIDENCE: 30\nNOTEPAD: no change",
+    "THINK: Corridor going down.\nBUTTON: DOWN\nPLAN: DOWN x3, LEFT\nCONFIDENCE: 90\nNOTEPAD: no change",
+    "THINK: I will wait for the text.\nBUTTON: WAIT\nNOTEPAD: no change",
+    "THINK: Closing the dialogue box.\nBUTTON: B\nCONFIDENCE: 80\nNOTEPAD: no change",
+]
+
+SUMMARY_RESPONSE = """# Pokémon Game AI Notepad
+
+## Current Status
+- Exploring (summarized by the mock model)
+
+## Game Progress
+- Beginning journey
+"""
+
+
+class MockUsage:
+    """Token counts in the shape of the Gemini usage_metadata"""
+
+    def __init__(self, prompt_token_count, candidates_token_count, cached_content_token_count=0):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.cached_content_token_count = cached_content_token_count
+
+
+class MockResponse:
+    """Model response with the attributes the controller reads"""
+
+    def __init__(self, text, usage_metadata):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class MockGenerativeModel:
+    """Scripted model with seeded latency
+
+    responses is a list of reply texts used in order (cycling), or a callable
+    taking (contents, call_index) and returning the reply text. Call i sleeps
+    for latency +/- jitter drawn from a generator seeded with seed + i, so a
+    run is reproducible regardless of how calls interleave across sessions.
+    A failure_rate fraction of calls raise instead of replying, and a
+    slow_rate fraction take slow_latency instead (the long tail of a real API).
+    """
+
+    def __init__(self, responses=None, latency=0.5, jitter=0.0, seed=0, failure_rate=0.0, slow_rate=0.0,
+                 slow_latency=5.0):
+        self.responses = responses or DEFAULT_SCRIPT
+        self.latency = latency
+        self.jitter = jitter
+        self.seed = seed
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.lock = threading.Lock()
+
+        # Counters
+        self.calls = 0
+        self.failures = 0
+        self.summaries = 0
+
+    @staticmethod
+    def load_script(path):
+        """Load replies from a JSON list, or a text file with replies separated by lines of ---"""
+        with open(path, 'r') as f:
+            content = f.read()
+        if path.endswith('.json'):
+            return json.loads(content)
+        return [reply.strip() for reply in content.split("\n---\n") if reply.strip()]
+
+    def generate_content(self, contents, **kwargs):
+        with self.lock:
+            index = self.calls
+            self.calls += 1
+
+        rng = random.Random(self.seed + index)
+        latency = self.latency + rng.uniform(-self.jitter, self.jitter)
+        if rng.random() < self.slow_rate:
+            latency = self.slow_latency
+        time.sleep(max(0.0, latency))
+
+        if rng.random() < self.failure_rate:
+            with self.lock:
+                self.failures += 1
+            raise RuntimeError(f"Mock model failure on call {index}")
+
+        # The notepad summarizer sends a bare prompt string
+        if isinstance(contents, str):
+            with self.lock:
+                self.summaries += 1
+            text = SUMMARY_RESPONSE
+        elif callable(self.responses):
+            text = self.responses(contents, index)
+        else:
+            text = self.responses[index % len(self.responses)]
+
+        parts = [contents] if isinstance(contents, str) else contents
+        prompt_tokens = sum(estimate_tokens(part) if isinstance(part, str) else IMAGE_TOKENS for part in parts)
+        return MockResponse(text, MockUsage(prompt_tokens, estimate_tokens(text)))
+
+    def stats(self):
+        """Return call counters as a dict"""
+        with self.lock:
+            return {
+                'calls': self.calls,
+                'failures': self.failures,
+                'summaries': self.summaries,
+            }
@@ -0,0 +1,137 @@
+"""
+Two-tier model cascade for decisions.
+
+Routine frames go to a fast, cheap model; the configured model_name is the
+strong tier. A frame goes straight to the strong model when it is one the
+fast model tends to get wrong: a battle, or the player being stuck after
+several actions in a row that didn't move it. A fast answer is escalated,
+i.e. the same prompt is sent to the strong model, when it can't be used (no
+valid BUTTON or PLAN, or the call failed) or when the model itself reports a
+CONFIDENCE below the threshold. Every routing decision is counted by tier
+and reason, along with the latency of each tier, so the cost/latency
+tradeoff can be tuned from the stats.
+"""
+import re
+import threading
+from session import BUTTON_NAMES
+from model_client import percentile
+
+TIERS = ('fast', 'strong')
+
+# Movement outcomes that mean the last action got the player nowhere
+NO_MOVEMENT = ('blocked', 'no effect')
+
+BUTTON_PATTERN = re.compile(r"BUTTON:\s*([A-Za-z]+)")
+PLAN_PATTERN = re.compile(r"PLAN:\s*([A-Za-z]+)")
+CONFIDENCE_PATTERN = re.compile(r"CONFIDENCE:\s*(\d*\.?\d+)\s*(%?)")
+
+
+def parse_confidence(text):
+    """Self-reported confidence as a number from 0 to 100, or None when there is none
+
+    Decimals up to 1 without a percent sign (e.g. "0.8") are read as a
+    fraction; whole numbers are on the prompt's 0-100 scale, so "1" is 1.
+    """
+    match = CONFIDENCE_PATTERN.search(text)
+    if not match:
+        return None
+    number, percent = match.groups()
+    value = float(number)
+    if '.' in number and value <= 1 and not percent:
+        value *= 100
+    return min(value, 100.0)
+
+
+class ModelCascade:
+    """Picks the model tier for a decision and checks fast answers for escalation"""
+
+    def __init__(self, min_confidence=60, stuck_repeats=2, escalate_battles=True, latency_window=200):
+        """
+        Fast answers reporting a confidence below min_confidence are escalated
+        (answers without one are not). After stuck_repeats actions in a row
+        that didn't move the player, and with escalate_battles during
+        battles, the strong model is asked directly.
+        """
+        self.min_confidence = min_confidence
+        self.stuck_repeats = stuck_repeats
+        self.escalate_battles = escalate_battles
+        self.buttons = set(BUTTON_NAMES.values())
+
+        # Counters and latencies (seconds) of the calls to each tier
+        self.lock = threading.Lock()
+        self.decisions = 0
+        self.routes = {}       # reason the strong model was asked directly -> count
+        self.escalations = {}  # reason a fast answer was escalated -> count
+        self.calls = {tier: 0 for tier in TIERS}
+        self.latencies = {tier: [] for tier in TIERS}
+        self.latency_window = latency_window
+
+    def observe(self, session, movement_kind):
+        """Update the session's run of actions that didn't move the player"""
+        if movement_kind in NO_MOVEMENT:
+            session.no_movement_streak += 1
+        elif movement_kind is not None:
+            session.no_movement_streak = 0
+
+    def route(self, session):
+        """Return (tier, reason) for a decision; reason says why the fast tier is skipped"""
+        with self.lock:
+            self.decisions += 1
+        reason = None
+        state = session.game_state
+        if self.escalate_battles and ((state is not None and state.in_battle) or session.screen == 'battle_menu'):
+            reason = 'battle'
+        elif self.stuck_repeats and session.no_movement_streak >= self.stuck_repeats:
+            reason = 'stuck'
+        if reason is None:
+            return 'fast', None
+        with self.lock:
+            self.routes[reason] = self.routes.get(reason, 0) + 1
+        return 'strong', reason
+
+    def review(self, text):
+        """Return the reason to escalate a fast answer, or None if it can be used
+
+        Returns (reason, confidence).
+        """
+        confidence = parse_confidence(text)
+        button = BUTTON_PATTERN.search(text)
+        plan = PLAN_PATTERN.search(text)
+        if not (button and button.group(1).upper() in self.buttons) and not (
+                plan and plan.group(1).upper() in self.buttons):
+            return 'parse_failure', confidence
+        if confidence is not None and confidence < self.min_confidence:
+            return 'low_confidence', confidence
+        return None, confidence
+
+    def escalated(self, reason):
+        """Count a fast answer that was sent on to the strong model"""
+        with self.lock:
+            self.escalations[reason] = self.escalations.get(reason, 0) + 1
+
+    def record(self, tier, latency):
+        """Count a call to a tier and how long it took"""
+        with self.lock:
+            self.calls[tier] += 1
+            latencies = self.latencies[tier]
+            latencies.append(latency)
+            if len(latencies) > self.latency_window:
+                del latencies[0]
+
+    def stats(self):
+        """Return routing counters and per-tier latency (ms) as a dict"""
+        with self.lock:
+            escalated = sum(self.escalations.values())
+            fast_answers = self.calls['fast']
+            tiers = {tier: {'calls': self.calls[tier],
+                            'p50_ms': percentile(self.latencies[tier], 0.50) * 1000,
+                            'p95_ms': percentile(self.latencies[tier], 0.95) * 1000}
+                     for tier in TIERS}
+            return {
+                'decisions': self.decisions,
+                'routed_strong': dict(self.routes),
+                'escalations': dict(self.escalations),
+                'escalation_rate': escalated / fast_answers if fast_answers else 0.0,
+                'fast_share': (fast_answers - escalated) / self.decisions if self.decisions else 0.0,
+                'tiers': tiers,
+            }
@@ -0,0 +1,405 @@
+"""
+Resilient layer for model calls.
+
+Every Gemini call (decisions and notepad summaries) goes through one
+ModelClient, which bounds how long a frame can wait for the model:
+
+- a token bucket limits the request rate across all sessions,
+- each call has a deadline; attempts that don't answer in time are abandoned,
+- failed attempts are retried with jittered exponential backoff, as long as
+  the deadline leaves room for them,
+- a circuit breaker stops calling the model for a while after a run of
+  failures, so frames fail fast instead of each waiting out its deadline,
+- optionally, a call still unanswered after the recent p95 latency gets a
+  hedged duplicate request, and whichever answers first wins.
+
+Attempts run in the client's own thread pool, so an abandoned call (which
+can't be cancelled) never holds up the caller.
+"""
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# HTTP status codes worth retrying; errors without a code (connection errors...) are retried too
+RETRYABLE_CODES = (408, 429, 500, 502, 503, 504)
+
+
+class ModelCallTimeout(Exception):
+    """The model didn't answer before the call's deadline"""
+
+
+class CircuitOpenError(Exception):
+    """The circuit breaker is open after repeated failures; the model isn't called"""
+
+
+def is_retryable(error):
+    """Whether a failed attempt is worth retrying (rate limits, overload, server and network errors)"""
+    code = getattr(error, 'code', None)
+    if callable(code):  # gRPC errors have a code() method
+        return True
+    return not isinstance(code, int) or code in RETRYABLE_CODES
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+class RateLimiter:
+    """Token bucket: rate requests per second on average, bursts of up to burst"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """Take a token if one is available right now"""
+        if not self.rate:
+            return True
+        with self.lock:
+            self.refill(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def acquire(self, deadline):
+        """Wait for a token until deadline (a time.monotonic() value); returns the seconds waited or None
+
+        Returns 0.0 when a token was available without waiting.
+        """
+        if not self.rate:
+            return 0.0
+        start = time.monotonic()
+        waited = False
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return now - start if waited else 0.0
+                wait_time = (1 - self.tokens) / self.rate
+            if now + wait_time > deadline:
+                return None
+            time.sleep(wait_time)
+            waited = True
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold failures in a row and lets one trial call through after reset_timeout"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False  # A half-open trial call is in flight
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return 'closed'
+            return 'half_open' if time.monotonic() - self.opened_at >= self.reset_timeout else 'open'
+
+    def allow(self):
+        """Whether a call may go to the model now"""
+        if not self.failure_threshold:
+            return True
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self.trial:
+                return False
+            self.trial = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        """Count a failed call; returns True if this opened the circuit"""
+        if not self.failure_threshold:
+            return False
+        with self.lock:
+            self.failures += 1
+            reopen = self.trial
+            self.trial = False
+            if reopen or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self.opened += 1
+                return True
+            return False
+
+
+class ModelHealth:
+    """Circuit breaker and recent request latencies of one model"""
+
+    def __init__(self, model, breaker, latency_window):
+        self.model = model  # Holds on to the model so its id, the key, isn't reused
+        self.breaker = breaker
+        self.latencies = deque(maxlen=latency_window)
+
+
+class ModelClient:
+    """Calls generate_content on a model with rate limiting, deadlines, retries, a circuit breaker and hedging"""
+
+    def __init__(self, max_concurrent=8, rate=10.0, burst=10, timeout=30.0, retries=2, backoff_base=0.5,
+                 backoff_max=8.0, breaker_failures=5, breaker_reset=30.0, hedge_enabled=False,
+                 hedge_percentile=0.95, hedge_min_delay=1.0, hedge_min_samples=20, latency_window=200,
+                 seed=None, logger=None, metrics=None):
+        """
+        timeout is the deadline of a whole call, retries and backoff included.
+        Retry i (from 0) waits a random time between half and all of
+        backoff_base * 2**i seconds, capped at backoff_max. With hedging, a
+        call unanswered after the hedge_percentile latency of the last
+        latency_window requests (but at least hedge_min_delay, and only once
+        hedge_min_samples were seen) sends one duplicate request. Requests
+        that lost the hedge race count with their own latency, and ones
+        abandoned at the deadline with the time they had taken by then.
+        breaker_failures=0 disables the circuit breaker and rate=0 the rate limit.
+
+        The rate and in-flight limits are shared by all models called through
+        the client; the circuit breaker and latency window are per model, so
+        e.g. a failing fast model doesn't pause calls to the strong one.
+        """
+        self.semaphore = threading.BoundedSemaphore(max_concurrent)
+        self.limiter = RateLimiter(rate, burst)
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        self.latency_window = latency_window
+        self.health = {}  # id(model) -> ModelHealth
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.rng = random.Random(seed)
+        self.logger = logger
+        self.metrics = metrics
+
+        # Abandoned attempts keep running until the model answers, so leave room for them
+        self.pool = ThreadPoolExecutor(max_workers=max_concurrent * 3, thread_name_prefix="model-call")
+
+        # Counters and latencies (seconds) of requests and of whole calls
+        self.lock = threading.Lock()
+        self.call_latencies = deque(maxlen=latency_window)
+        self.calls = 0
+        self.failures = 0
+        self.attempts = 0
+        self.retried = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.censored = 0  # Latencies of unanswered requests, recorded at their deadline
+        self.rate_wait = 0.0
+
+    def generate_content(self, model, contents, timeout=None):
+        """Return model.generate_content(contents), or raise once the call can't succeed before its deadline"""
+        start = time.monotonic()
+        deadline = start + (timeout or self.timeout)
+        health = self.health_of(model)
+        breaker = health.breaker
+        with self.lock:
+            self.calls += 1
+
+        if not breaker.allow():
+            with self.lock:
+                self.rejected += 1
+                self.failures += 1
+            self.inc('model_circuit_rejects')
+            raise CircuitOpenError("Model calls are paused after repeated failures")
+
+        attempt = 0
+        while True:
+            try:
+                response = self.attempt(health, contents, deadline)
+            except Exception as e:
+                retryable = is_retryable(e)
+                if retryable or isinstance(e, ModelCallTimeout):
+                    if breaker.record_failure():
+                        self.log('warning', "Model failed %d times in a row, pausing calls to it for %.0fs",
+                                 breaker.failure_threshold, breaker.reset_timeout)
+                else:
+                    # The request itself is bad (e.g. invalid argument); the model is fine
+                    breaker.record_success()
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * self.rng.uniform(0.5, 1.0)
+                if (not retryable or isinstance(e, ModelCallTimeout) or attempt >= self.retries
+                        or time.monotonic() + delay >= deadline or not breaker.allow()):
+                    with self.lock:
+                        self.failures += 1
+                    raise
+                attempt += 1
+                with self.lock:
+                    self.retried += 1
+                self.inc('model_retries')
+                self.log('warning', "Model call failed (%s), retry %d of %d in %.2fs", e, attempt, self.retries, delay)
+                time.sleep(delay)
+                continue
+
+            breaker.record_success()
+            with self.lock:
+                self.call_latencies.append(time.monotonic() - start)
+            return response
+
+    def health_of(self, model):
+        """Return the ModelHealth of a model, creating it on first use"""
+        with self.lock:
+            health = self.health.get(id(model))
+            if health is None:
+                health = self.health[id(model)] = ModelHealth(
+                    model, CircuitBreaker(self.breaker_failures, self.breaker_reset), self.latency_window)
+            return health
+
+    def attempt(self, health, contents, deadline):
+        """One attempt (plus its hedge), bounded by the deadline"""
+        waited = self.limiter.acquire(deadline)
+        if waited is None:
+            self.count_timeout()
+            raise ModelCallTimeout("Rate limit left no room before the deadline")
+        if waited:
+            with self.lock:
+                self.rate_wait += waited
+            self.inc('model_rate_limited')
+
+        # Every request records its own latency when it answers, also after losing the hedge
+        # race or being abandoned; ones still unanswered at the deadline record the time they took so far
+        model = health.model
+        samples = {}
+        first = self.pool.submit(self.call, model, contents,
+                                 samples.setdefault('first', {'window': health.latencies}))
+        pending = {first}
+        hedge = None
+        hedge_delay = self.hedge_delay(health)
+        error = None
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            wait_until = deadline
+            if hedge is None and hedge_delay is not None:
+                wait_until = min(deadline, now + hedge_delay)
+            done, pending = wait(pending, timeout=wait_until - now, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if future is hedge:
+                    with self.lock:
+                        self.hedge_wins += 1
+                    self.inc('model_hedge_wins')
+                return response
+
+            # Still no answer after the hedge delay: send a duplicate unless the rate limit is reached
+            if not done and hedge is None and hedge_delay is not None:
+                hedge_delay = None
+                if self.limiter.try_acquire():
+                    hedge = self.pool.submit(self.call, model, contents,
+                                             samples.setdefault('hedge', {'window': health.latencies}))
+                    pending.add(hedge)
+                    with self.lock:
+                        self.hedges += 1
+                    self.inc('model_hedges')
+
+        if pending or error is None:
+            for sample in samples.values():
+                self.record_latency(sample, censored=True)
+            self.count_timeout()
+            raise ModelCallTimeout("Model didn't answer before the deadline")
+        raise error
+
+    def call(self, model, contents, sample):
+        """Run one request, holding a slot of the in-flight limit, and record its latency in sample"""
+        with self.semaphore:
+            with self.lock:
+                self.attempts += 1
+                sample['start'] = time.monotonic()
+            response = model.generate_content(contents)
+            self.record_latency(sample)
+            return response
+
+    def record_latency(self, sample, censored=False):
+        """Add a request's latency to the window once: when it answers, or censored at the time abandoned"""
+        with self.lock:
+            if sample.get('recorded') or 'start' not in sample:
+                return  # Already recorded, or abandoned before it got an in-flight slot
+            sample['recorded'] = True
+            sample['window'].append(time.monotonic() - sample['start'])
+            if censored:
+                self.censored += 1
+
+    def hedge_delay(self, health):
+        """Seconds to wait before hedging a model's request, or None when hedging is off or there's no history yet"""
+        if not self.hedge_enabled:
+            return None
+        with self.lock:
+            if len(health.latencies) < self.hedge_min_samples:
+                return None
+            latencies = list(health.latencies)
+        return max(self.hedge_min_delay, percentile(latencies, self.hedge_percentile))
+
+    def count_timeout(self):
+        with self.lock:
+            self.timeouts += 1
+        self.inc('model_timeouts')
+
+    def inc(self, name):
+        if self.metrics:
+            self.metrics.inc(name)
+
+    def log(self, level, message, *args):
+        if self.logger:
+            getattr(self.logger, level)(message, *args)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+
+    def stats(self):
+        """Return call counters and latency percentiles (ms) as a dict"""
+        with self.lock:
+            calls = list(self.call_latencies)
+            models = list(self.health.values())
+            attempts = [latency for health in models for latency in health.latencies]
+            return {
+                'calls': self.calls,
+                'failures': self.failures,
+                'attempts': self.attempts,
+                'retries': self.retried,
+                'timeouts': self.timeouts,
+                'circuit_rejects': self.rejected,
+                'circuit_opened': sum(health.breaker.opened for health in models),
+                'open_circuits': sum(1 for health in models if health.breaker.state() != 'closed'),
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'censored_latencies': self.censored,
+                'rate_wait_s': round(self.rate_wait, 3),
+                'attempt_p50_ms': percentile(attempts, 0.50) * 1000,
+                'attempt_p95_ms': percentile(attempts, 0.95) * 1000,
+                'attempt_p99_ms': percentile(attempts, 0.99) * 1000,
+                'call_p50_ms': percentile(calls, 0.50) * 1000,
+                'call_p95_ms': percentile(calls, 0.95) * 1000,
+                'call_p99_ms': percentile(calls, 0.99) * 1000,
+            }
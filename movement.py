@@ -0,0 +1,152 @@
+"""
+Local movement and wall detection.
+
+Works out what the last action did by comparing the frame it was decided on
+with the current one, so the model gets a one-line fact ("RIGHT: blocked")
+instead of having to compare two screenshots itself. Positions from the RAM
+game state are used when both frames have one; otherwise the overworld
+camera follows the player, so walking shows up as the whole screen
+scrolling, which phase correlation measures in a couple of FFTs.
+"""
+import threading
+import numpy as np
+from action_plan import MOVEMENT_BUTTONS
+from game_state import FACING_NAMES
+
+
+def describe_steps(dx, dy):
+    """e.g. 'moved 2 tiles up and 1 tile right'"""
+    parts = []
+    for count, positive, negative in ((dy, "down", "up"), (dx, "right", "left")):
+        if count:
+            parts.append(f"{abs(count)} tile{'s' if abs(count) != 1 else ''} {positive if count > 0 else negative}")
+    return "moved " + " and ".join(parts)
+
+
+class MovementDetector:
+    """Classifies the effect of the last action from two frames (and game states, if available)"""
+
+    def __init__(self, scale=2, tile_pixels=16, pixel_tolerance=8, still_ratio=0.01,
+                 transition_stddev=6.0, min_peak=0.15, max_residual=0.2):
+        """
+        Frames are downscaled by scale before comparing. A frame is still when
+        at most still_ratio of its pixels differ by more than pixel_tolerance,
+        and a fade when its standard deviation is below transition_stddev. A
+        phase correlation peak of at least min_peak counts as a scroll if the
+        shifted frames then differ in at most max_residual of their overlap.
+        """
+        self.scale = scale
+        self.tile_pixels = tile_pixels
+        self.pixel_tolerance = pixel_tolerance
+        self.still_ratio = still_ratio
+        self.transition_stddev = transition_stddev
+        self.min_peak = min_peak
+        self.max_residual = max_residual
+
+        # Counters
+        self.lock = threading.Lock()
+        self.comparisons = 0
+        self.outcomes = {}
+
+    def prepare(self, image):
+        """Downscaled grayscale frame as a float32 array"""
+        gray = image.convert('L')
+        if self.scale > 1:
+            gray = gray.reduce(self.scale)
+        return np.asarray(gray, dtype=np.float32)
+
+    def estimate_shift(self, before, after):
+        """Phase correlation: returns (dx, dy, peak) such that after ~= before shifted by (dx, dy)"""
+        cross = np.fft.fft2(after) * np.conj(np.fft.fft2(before))
+        cross /= np.abs(cross) + 1e-6
+        correlation = np.fft.ifft2(cross).real
+        dy, dx = np.unravel_index(np.argmax(correlation), correlation.shape)
+        height, width = correlation.shape
+        if dy > height // 2:
+            dy -= height
+        if dx > width // 2:
+            dx -= width
+        return int(dx), int(dy), float(correlation.max())
+
+    def residual(self, before, after, dx, dy):
+        """Fraction of changed pixels in the overlap of before shifted by (dx, dy) and after"""
+        height, width = before.shape
+        if abs(dx) >= width or abs(dy) >= height:
+            return 1.0
+        shifted = before[max(0, -dy):height - max(0, dy), max(0, -dx):width - max(0, dx)]
+        overlap = after[max(0, dy):height - max(0, -dy), max(0, dx):width - max(0, -dx)]
+        return float(np.mean(np.abs(shifted - overlap) > self.pixel_tolerance))
+
+    def compare_frames(self, before_image, after_image):
+        """Compare two frames; returns ('still'|'fade'|'scrolled'|'changed', (dx_tiles, dy_tiles) or None)"""
+        before = self.prepare(before_image)
+        after = self.prepare(after_image)
+        if before.shape != after.shape:
+            return 'changed', None
+
+        if float(np.mean(np.abs(after - before) > self.pixel_tolerance)) <= self.still_ratio:
+            return 'still', None
+        if after.std() < self.transition_stddev:
+            return 'fade', None
+
+        dx, dy, peak = self.estimate_shift(before, after)
+        if (dx or dy) and peak >= self.min_peak and self.residual(before, after, dx, dy) <= self.max_residual:
+            tile = self.tile_pixels / self.scale
+            tiles = (-int(round(dx / tile)), -int(round(dy / tile)))  # The player moves against the scroll
+            if tiles != (0, 0):
+                return 'scrolled', tiles
+        return 'changed', None
+
+    def describe(self, button, before_image, after_image, before_state=None, after_state=None):
+        """One-line description of what the last action did, or None without a frame to compare"""
+        result = self.assess(button, before_image, after_image, before_state, after_state)
+        return result[1] if result else None
+
+    def assess(self, button, before_image, after_image, before_state=None, after_state=None):
+        """Return (kind, description) of what the last action did, or None without a frame to compare
+
+        kind is one of 'entered', 'moved', 'turned', 'blocked', 'no effect',
+        'fade' or 'changed'.
+        """
+        if before_image is None or after_image is None:
+            return None
+        with self.lock:
+            self.comparisons += 1
+        is_move = button in MOVEMENT_BUTTONS
+
+        if before_state is not None and after_state is not None and not after_state.in_battle:
+            if (before_state.map_group, before_state.map_num) != (after_state.map_group, after_state.map_num):
+                return self.outcome('entered', f"entered a new area ({after_state.map_name})")
+            dx, dy = after_state.x - before_state.x, after_state.y - before_state.y
+            if dx or dy:
+                return self.outcome('moved', describe_steps(dx, dy))
+            if is_move and after_state.facing != before_state.facing:
+                return self.outcome('turned', f"turned to face {FACING_NAMES.get(after_state.facing, 'another way')}, "
+                                              f"did not move (press again to walk)")
+            if is_move and not after_state.controls_locked:
+                return self.outcome('blocked', "blocked, did not move (wall or obstacle in the way)")
+
+        kind, tiles = self.compare_frames(before_image, after_image)
+        if kind == 'still':
+            if is_move:
+                return self.outcome('blocked', "blocked, the screen did not change (wall or obstacle in the way)")
+            return self.outcome('no effect', "no visible change")
+        if kind == 'fade':
+            return self.outcome('fade', "the screen faded (entering a new area or a battle starting)")
+        if kind == 'scrolled':
+            return self.outcome('moved', describe_steps(*tiles))
+        if is_move:
+            return self.outcome('changed', "the screen changed but did not scroll "
+                                           "(turned, a menu or dialogue, or a new area)")
+        return self.outcome('changed', "the screen changed")
+
+    def outcome(self, kind, text):
+        """Count an outcome and return it as (kind, text)"""
+        with self.lock:
+            self.outcomes[kind] = self.outcomes.get(kind, 0) + 1
+        return kind, text
+
+    def stats(self):
+        """Return comparison counters as a dict"""
+        with self.lock:
+            return {'comparisons': self.comparisons, 'outcomes': dict(self.outcomes)}
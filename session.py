@@ -0,0 +1,236 @@
+import os
+import time
+import io
+import asyncio
+import threading
+import PIL.Image
+from frame_diff import FrameDiffGate
+from frame_mailbox import LatestFrameMailbox
+from thinking_history import ThinkingHistory
+from action_plan import PlanTracker
+
+# Button index to name mapping used by the emulator
+BUTTON_NAMES = {0: "A", 1: "B", 2: "SELECT", 3: "START",
+                4: "RIGHT", 5: "LEFT", 6: "UP", 7: "DOWN",
+                8: "R", 9: "L"}
+
+DEFAULT_SESSION_ID = "default"
+
+
+class GameSession:
+    """Per-emulator game state: notepad, thinking history, previous frame and last action
+
+    All state lives in memory and is loaded once when the session is created.
+    Changes are persisted through the shared write-behind writer, so deciding
+    on a frame never waits on file I/O.
+    """
+
+    def __init__(self, session_id, config, logger, writer):
+        self.session_id = session_id
+        self.config = config
+        self.logger = logger
+        self.writer = writer
+
+        # The default session keeps the configured paths; other sessions get their own directory
+        if session_id == DEFAULT_SESSION_ID:
+            self.notepad_path = config['notepad_path']
+            comparison_folder = os.path.join(os.path.dirname(config['screenshot_path']), 'comparison')
+        else:
+            session_dir = os.path.join(config['sessions_dir'], session_id)
+            self.notepad_path = os.path.join(session_dir, 'notepad.txt')
+            comparison_folder = os.path.join(session_dir, 'comparison')
+        self.thinking_history_path = os.path.join(os.path.dirname(self.notepad_path), 'thinking_history.txt')
+        self.previous_screenshot_path = os.path.join(comparison_folder, 'previous_screenshot.png')
+        self.last_action_path = os.path.join(comparison_folder, 'last_action.txt')
+        os.makedirs(comparison_folder, exist_ok=True)
+
+        # Decision state
+        self.last_decision_time = 0
+        self.last_decision = None
+        self.last_frame_hash = None
+        self.last_action = self.load_last_action()
+
+        # Versioned notepad; every write bumps the version
+        self.notepad_lock = threading.Lock()
+        self.notepad_version = 0
+        self.notepad_content = self.load_notepad()
+
+        # Previous frame the last decision was made on
+        self.previous_image = self.load_previous_screenshot()
+        self.trace_frames = 0  # Frames recorded to trace_dir
+        self.processed_frame = None  # (image, blob) from the image pipeline, re-used as the previous frame
+
+        # Frame-diff gate to skip LLM calls on unchanged screens
+        self.frame_gate = FrameDiffGate(
+            pixel_tolerance=config['frame_diff_pixel_tolerance'],
+            changed_ratio=config['frame_diff_changed_ratio'],
+            max_skips=config['frame_diff_max_skips'],
+            mode=config['frame_diff_mode']
+        )
+
+        # Multi-step plan the emulator is executing
+        self.plan_tracker = PlanTracker()
+
+        # Latest GameState read from the emulator's RAM, if it sends one, and the one
+        # for the frame the last decision was made on
+        self.game_state = None
+        self.previous_game_state = None
+        self.observed_game_state = None  # Last state fed to the map memory
+
+        # NavigationTask being walked towards, if the model set a goal
+        self.navigation = None
+
+        # Screen type and text of the latest frame, and fixed answers given in a row
+        self.screen = None
+        self.screen_text = None
+        self.fast_path_streak = 0
+
+        # Actions in a row that didn't move the player, for the model cascade
+        self.no_movement_streak = 0
+
+        # Serializes decisions for this session; created lazily inside the event loop
+        self.lock = None
+        self.connected = False
+
+        # Latest-frame mailbox between the connection reader and the decision worker
+        self.mailbox = None
+
+        # Recent thinking kept in memory, recovered from its append-only log
+        self.thinking_history = ThinkingHistory(
+            self.thinking_history_path,
+            writer,
+            max_chars=config['thinking_history_max_chars'],
+            keep_entries=config['thinking_history_keep_entries'],
+            log_max_chars=config['thinking_history_log_max_chars']
+        )
+
+    def decision_lock(self):
+        """Return the asyncio lock that serializes this session's decisions"""
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        return self.lock
+
+    def frame_mailbox(self):
+        """Return the latest-frame mailbox for this session"""
+        if self.mailbox is None:
+            self.mailbox = LatestFrameMailbox()
+        return self.mailbox
+
+    def load_notepad(self):
+        """Load the notepad, creating it with a clearer structure if it doesn't exist"""
+        if os.path.exists(self.notepad_path):
+            try:
+                with open(self.notepad_path, 'r') as f:
+                    return f.read()
+            except Exception as e:
+                print(f"Error reading notepad: {e}")
+                return "Error reading notepad"
+
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        content = (
+            "# Pokémon Game AI Notepad\n\n"
+            f"Game started: {timestamp}\n\n"
+            "## Current Status\n"
+            "- Game just started\n\n"
+            "## Game Progress\n"
+            "- Beginning journey\n\n"
+        )
+        self.writer.write(self.notepad_path, content)
+        return content
+
+    def load_last_action(self):
+        """Load the name of the last button pressed in this session"""
+        last_action = "NONE (First action)"
+        if os.path.exists(self.last_action_path):
+            try:
+                with open(self.last_action_path, 'r') as f:
+                    last_action = f.read().strip()
+            except:
+                pass
+        return last_action
+
+    def load_previous_screenshot(self):
+        """Load the previous frame saved before a restart, if any"""
+        if not os.path.exists(self.previous_screenshot_path):
+            return None
+        try:
+            image = PIL.Image.open(self.previous_screenshot_path)
+            image.load()
+            return image
+        except Exception as e:
+            self.logger.error("Error loading previous screenshot: %s", e)
+            return None
+
+    def read_notepad(self):
+        """Return the current notepad content"""
+        return self.notepad_content
+
+    def read_thinking_history(self):
+        """Return the recent thinking history"""
+        return self.thinking_history.read()
+
+    def read_notepad_versioned(self):
+        """Return the notepad together with its version"""
+        with self.notepad_lock:
+            return self.notepad_content, self.notepad_version
+
+    def write_notepad(self, new_content):
+        """Replace the notepad, bump its version and persist it (caller holds notepad_lock)"""
+        self.notepad_content = new_content
+        self.notepad_version += 1
+        self.writer.write(self.notepad_path, new_content)
+
+    def update_notepad(self, new_content):
+        """Update the notepad with new content"""
+        with self.notepad_lock:
+            self.write_notepad(new_content)
+        self.logger.debug("Notepad updated")
+
+    def append_notepad(self, update):
+        """Append an update section to the notepad"""
+        with self.notepad_lock:
+            self.write_notepad(self.notepad_content + update)
+        self.logger.debug("Notepad updated")
+
+    def apply_notepad_summary(self, base_content, base_version, summary):
+        """Replace the summarized part of the notepad, keeping updates appended since the snapshot
+
+        Returns the new notepad content, or None if the notepad was rewritten in the meantime.
+        """
+        with self.notepad_lock:
+            if self.notepad_version == base_version:
+                merged = summary
+            else:
+                current = self.notepad_content
+                if not current.startswith(base_content):
+                    return None
+                merged = summary + current[len(base_content):]
+            self.write_notepad(merged)
+            return merged
+
+    def update_thinking_history(self, new_thinking):
+        """Add new thinking to the history"""
+        self.thinking_history.append(new_thinking)
+        self.logger.debug("Thinking history updated")
+
+    def read_last_action(self):
+        """Return the name of the last button pressed in this session"""
+        return self.last_action
+
+    def save_last_action(self, button_press, description=None):
+        """Remember the pressed button (or a description of the plan) for the next comparison"""
+        self.last_action = description or BUTTON_NAMES.get(button_press, "UNKNOWN")
+        self.writer.write(self.last_action_path, self.last_action)
+
+    def set_previous_frame(self, image):
+        """Remember the frame a decision was made on; it is encoded to PNG only when flushed"""
+        self.previous_image = image
+        self.previous_game_state = self.game_state
+        self.writer.write(self.previous_screenshot_path, lambda: encode_png(image))
+
+
+def encode_png(image):
+    """Encode a frame as PNG bytes"""
+    buffer = io.BytesIO()
+    image.convert('RGB').save(buffer, format='PNG')
+    return buffer.getvalue()
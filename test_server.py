@@ -4,9 +4,11 @@ Simple test server that mainly sends A button presses to help
 get through Pokémon Red's start menus
 """
 import socket
+import selectors
 import time
 import os
 import random
+from protocol import MessageDecoder, ProtocolError, MESSAGE_NAMES, MSG_FRAME, decode_frame, encode_button
 
 def main():
     # Make sure screenshots directory exists
@@ -36,8 +38,11 @@ def main():
         client, address = server.accept()
         print(f"Connected to {address}")
         
-        # Set non-blocking mode
+        # Set non-blocking mode and wait for data with a selector
         client.setblocking(0)
+        selector = selectors.DefaultSelector()
+        selector.register(client, selectors.EVENT_READ)
+        decoder = MessageDecoder()
         
         counter = 0
         last_key_time = 0
@@ -45,18 +50,24 @@ def main():
         
         while running:
             try:
-                # Check if there's incoming data
-                data = client.recv(1024)
-                if data:
-                    message = data.decode('utf-8').strip()
-                    print(f"Received: {message}")
+                # Check if there's incoming data, waiting at most 0.1s
+                if selector.select(timeout=0.1):
+                    data = client.recv(65536)
+                    if not data:
+                        print("Connection closed by emulator")
+                        break
+                    for message_type, payload in decoder.feed(data):
+                        if message_type == MSG_FRAME:
+                            width, height, _ = decode_frame(payload)
+                            print(f"Received: frame {width}x{height}")
+                        else:
+                            print(f"Received: {MESSAGE_NAMES[message_type]} {payload.decode('utf-8', 'replace')}")
+            except ProtocolError as e:
+                print(f"Protocol error: {e}")
+                break
             except socket.error as e:
-                # Handle non-blocking socket error
-                if e.args[0] in {10035, 35} or str(e) == 'Resource temporarily unavailable':
-                    pass  # Expected for non-blocking sockets
-                else:
-                    print(f"Socket error: {e}")
-                    break  # Exit the loop on socket error
+                print(f"Socket error: {e}")
+                break  # Exit the loop on socket error
 
             # Send a key press every few seconds
             current_time = time.time()
@@ -70,14 +81,12 @@ def main():
                 
                 print(f"Sending key press: {key_to_send}")
                 try:
-                    client.send(str(key_to_send).encode('utf-8') + b'\n')  # Add newline
+                    client.sendall(encode_button(key_to_send))
                     last_key_time = current_time
                     counter += 1
                 except:
                     print("Error sending key press")
                     break
-
-            time.sleep(0.1)  # Prevent CPU hogging
             
     except KeyboardInterrupt:
         print("\nReceived KeyboardInterrupt. Shutting down server...")
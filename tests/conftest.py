@@ -0,0 +1,37 @@
+import os
+import sys
+import json
+import pytest
+
+# The controller's modules live at the top level of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def controller_factory(tmp_path, monkeypatch):
+    """Build controllers on a throwaway config in tmp_path, cleaning them up afterwards"""
+    from controller import PokemonGameController
+    monkeypatch.chdir(tmp_path)
+    controllers = []
+
+    def build(settings=None, **kwargs):
+        config = {
+            'api_key': 'offline',
+            'model_name': 'mock',
+            'notepad_path': str(tmp_path / 'notepad.txt'),
+            'screenshot_path': str(tmp_path / 'data' / 'screenshots' / 'screenshot.png'),
+            'decision_cooldown': 0,
+            'decision_cache_path': str(tmp_path / 'data' / 'decision_cache.json'),
+            'sessions_dir': str(tmp_path / 'data' / 'sessions'),
+            'decision_log_path': None,
+        }
+        config.update(settings or {})
+        config_path = tmp_path / 'config.json'
+        config_path.write_text(json.dumps(config))
+        controller = PokemonGameController(str(config_path), **kwargs)
+        controllers.append(controller)
+        return controller
+
+    yield build
+    for controller in controllers:
+        controller.cleanup()
@@ -0,0 +1,25 @@
+import types
+import PIL.Image
+import PIL.ImageDraw
+from decision_cache import DecisionCache, frame_digest
+from frame_diff import perceptual_hash
+
+
+def dialogue_frame(text):
+    frame = PIL.Image.new('RGB', (240, 160), 'white')
+    PIL.ImageDraw.Draw(frame).text((10, 130), text, fill='black')
+    return frame
+
+
+def test_dialogue_pages_get_different_keys():
+    first, second = dialogue_frame("Hello there!"), dialogue_frame("Hello world!")
+    assert perceptual_hash(first) == perceptual_hash(second)  # Why the perceptual hash can't be the key
+    assert frame_digest(first) != frame_digest(second)
+    assert frame_digest(first) == frame_digest(first.copy())
+
+
+def test_key_includes_position():
+    state = types.SimpleNamespace(map_group=3, map_num=0, x=5, y=7, facing=1)
+    moved = types.SimpleNamespace(map_group=3, map_num=0, x=6, y=7, facing=1)
+    assert (DecisionCache.make_key("digest", "UP", "notes", game_state=state)
+            != DecisionCache.make_key("digest", "UP", "notes", game_state=moved))
@@ -0,0 +1,22 @@
+import pytest
+from model_cascade import ModelCascade, parse_confidence
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("CONFIDENCE: 0", 0.0),
+    ("CONFIDENCE: 1", 1.0),
+    ("CONFIDENCE: 75", 75.0),
+    ("CONFIDENCE: 0.8", 80.0),
+    ("CONFIDENCE: .5", 50.0),
+    ("CONFIDENCE: 1%", 1.0),
+    ("CONFIDENCE: 150", 100.0),
+    ("BUTTON: A", None),
+])
+def test_parse_confidence(text, expected):
+    assert parse_confidence(text) == expected
+
+
+@pytest.mark.parametrize("confidence", ["0", "1"])
+def test_near_zero_confidence_escalates(confidence):
+    cascade = ModelCascade(min_confidence=60)
+    assert cascade.review(f"BUTTON: UP\nCONFIDENCE: {confidence}\nNOTEPAD: no change")[0] == 'low_confidence'
@@ -0,0 +1,46 @@
+import pytest
+from metrics import Metrics
+from mock_model import MockGenerativeModel
+from model_client import ModelClient, CircuitOpenError
+
+
+def test_failing_model_does_not_open_the_circuit_of_another():
+    fast = MockGenerativeModel(latency=0.0, failure_rate=1.0)
+    strong = MockGenerativeModel(latency=0.0)
+    client = ModelClient(rate=0, retries=0, breaker_failures=2, breaker_reset=60)
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            client.generate_content(fast, ["prompt"])
+    with pytest.raises(CircuitOpenError):
+        client.generate_content(fast, ["prompt"])
+
+    assert client.generate_content(strong, ["prompt"]).text
+    assert client.stats()['open_circuits'] == 1
+
+
+def test_latency_windows_are_per_model():
+    fast = MockGenerativeModel(latency=0.0)
+    strong = MockGenerativeModel(latency=0.02)
+    client = ModelClient(rate=0, hedge_enabled=True, hedge_min_samples=3, hedge_min_delay=0.0)
+
+    for _ in range(5):
+        client.generate_content(fast, ["prompt"])
+    assert client.hedge_delay(client.health_of(strong)) is None
+
+    for _ in range(5):
+        client.generate_content(strong, ["prompt"])
+    assert client.hedge_delay(client.health_of(strong)) >= 0.015
+    assert client.hedge_delay(client.health_of(fast)) < 0.015
+
+
+def test_only_requests_that_waited_for_a_token_count_as_rate_limited():
+    metrics = Metrics(enabled=True)
+    model = MockGenerativeModel(latency=0.0)
+    client = ModelClient(rate=20, burst=2, metrics=metrics)
+
+    for _ in range(4):
+        client.generate_content(model, ["prompt"])
+
+    assert metrics.stats()['counters']['model_rate_limited'] == 2
+    assert client.stats()['rate_wait_s'] >= 0.05
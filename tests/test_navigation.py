@@ -0,0 +1,25 @@
+import PIL.Image
+from game_state import GameState
+from mock_model import MockGenerativeModel
+
+REPLY = "THINK: The forest is north of here.\nBUTTON: UP\nGOAL: Viridian Forest\nNOTEPAD: no change"
+
+
+def test_unplanned_goal_keeps_the_navigation_outcome(controller_factory):
+    controller = controller_factory(model=MockGenerativeModel([REPLY], latency=0),
+                                    settings={'screen_classifier_enabled': False})
+    session = controller.get_session('default')
+    image = PIL.Image.new('RGB', (240, 160), (120, 200, 120))
+
+    controller.process_screenshot(session, image=image, game_state=GameState(3, 0, 5, 5, 1, 0, []))
+
+    assert session.read_last_action() == "UP (GOAL Viridian Forest: no path known, walk there yourself)"
+
+
+def test_goal_without_game_state_says_why(controller_factory):
+    controller = controller_factory(model=MockGenerativeModel([REPLY], latency=0),
+                                    settings={'screen_classifier_enabled': False})
+    session = controller.get_session('default')
+
+    assert controller.start_navigation(session, ('place', "Viridian Forest"), None) == \
+        (None, "not planned, no game state")
@@ -0,0 +1,85 @@
+import json
+import pytest
+import PIL.Image
+import PIL.ImageDraw
+import PIL.ImageFont
+from benchmark import FIXTURE_CHARSET, render_text
+from ocr import GlyphTable, TextReader, new_lines
+
+
+def test_scrolled_line_is_not_repeated():
+    assert new_lines("Hello there!\nWelcome to the", "Welcome to the\nworld of POKéMON!") == ["world of POKéMON!"]
+
+
+def test_progressively_revealed_text():
+    frames = ["Hel", "Hello th", "Hello there!", "Hello there!"]
+    seen = []
+    previous = None
+    for text in frames:
+        seen.append(new_lines(previous, text))
+        previous = text
+    # Every step of the line being typed out is new; the settled line is reported once
+    assert seen == [["Hel"], ["Hello th"], ["Hello there!"], []]
+
+
+def test_line_being_typed_on_a_new_page_is_new():
+    # "Hel" is a prefix of the old line, but it is the start of a new one
+    assert new_lines("Hello there!", "Hel") == ["Hel"]
+
+
+def test_no_text():
+    assert new_lines("Hello there!", None) == []
+    assert new_lines(None, "Hi") == ["Hi"]
+
+
+@pytest.fixture(scope='module')
+def font():
+    return PIL.ImageFont.load_default_imagefont()
+
+
+@pytest.fixture
+def reader(font):
+    """A reader with a glyph table learned from the benchmark's charset frames"""
+    reader = TextReader(GlyphTable(line_height=12, baseline=9))
+    for first, second in zip(FIXTURE_CHARSET[::2], FIXTURE_CHARSET[1::2]):
+        reader.learn(text_frame((first, second), font), f"{first}|{second}")
+    return reader
+
+
+def text_frame(lines, font):
+    frame = PIL.Image.new('RGB', (240, 160), (120, 200, 120))
+    render_text(frame, lines, font)
+    return frame
+
+
+def test_learned_glyphs_are_read_back(reader, font):
+    assert len(reader.table) == sum(len(chars) for chars in FIXTURE_CHARSET)
+    frame = text_frame(("Hello there! Welcome to", "the world of POKeMON 151."), font)
+    assert reader.read(frame) == "Hello there! Welcome to\nthe world of POKeMON 151."
+    assert reader.stats()['unknown'] == 0
+
+
+def test_glyph_table_round_trips_through_json(reader, font):
+    copy = TextReader(GlyphTable.from_dict(json.loads(json.dumps(reader.table.to_dict()))))
+    assert copy.read(text_frame(("Wait, what's that?",), font)) == "Wait, what's that?"
+
+
+def test_unknown_glyph_is_read_as_question_mark(font):
+    reader = TextReader(GlyphTable(line_height=12, baseline=9))
+    reader.learn(text_frame(FIXTURE_CHARSET[:2], font), "|".join(FIXTURE_CHARSET[:2]))
+    assert reader.read(text_frame(("CAB%",), font)) == "CAB?"
+    assert reader.stats()['unknown'] == 1
+
+
+def test_box_without_text_reads_blank(reader):
+    blank = PIL.Image.new('RGB', (240, 160), (120, 200, 120))
+    PIL.ImageDraw.Draw(blank).rectangle((2, 112, 237, 157), fill=(255, 255, 255), outline=(96, 96, 112), width=3)
+    assert reader.read(blank) == ""
+    assert reader.read_screen(blank, 'dialogue') is None
+
+
+def test_learning_needs_the_text_to_line_up(font):
+    reader = TextReader(GlyphTable(line_height=12, baseline=9))
+    with pytest.raises(ValueError):
+        reader.learn(text_frame(("ABC",), font), "ABCD")
+    assert len(reader.table) == 0
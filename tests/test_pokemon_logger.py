@@ -0,0 +1,24 @@
+from pokemon_logger import PokemonLogger
+
+
+class Unprintable:
+    def __str__(self):
+        raise AssertionError("suppressed message was formatted")
+
+
+def test_arguments_are_formatted_only_when_written(tmp_path):
+    log_path = tmp_path / "pokemon_ai.log"
+    PokemonLogger.stop()  # The listener is shared by the process; start one writing to log_path
+    logger = PokemonLogger(debug_mode=False, log_path=str(log_path))
+    try:
+        logger.debug("Model: %s", Unprintable())
+        logger.info("Emulator at %s using session '%s'", "127.0.0.1", "default")
+        logger.section("Connected to emulator at %s", "127.0.0.1")
+    finally:
+        PokemonLogger.stop()
+
+    text = log_path.read_text(encoding='utf-8')
+    assert "Emulator at 127.0.0.1 using session 'default'" in text
+    assert "Connected to emulator at 127.0.0.1\n" in text
+    assert "-" * len("Connected to emulator at 127.0.0.1") in text
+    assert "Model:" not in text
@@ -0,0 +1,37 @@
+from mock_model import MockGenerativeModel
+from prompts import PromptCache, LocalCachedModel, STATIC_PREFIX
+
+
+def test_injected_model_is_used_with_default_config(controller_factory):
+    model = MockGenerativeModel()
+    controller = controller_factory(model=model)
+    assert controller.decision_model is model
+    assert controller.prompt_cache.mode == 'off'
+    assert controller.prompt_cache.prompt("dynamic").startswith(STATIC_PREFIX)
+
+
+def test_injected_fast_model_is_used_with_default_config(controller_factory):
+    model, fast_model = MockGenerativeModel(), MockGenerativeModel()
+    controller = controller_factory(model=model, fast_model=fast_model, settings={'cascade_model_name': 'mock-fast'})
+    assert controller.fast_decision_model is fast_model
+    assert controller.decision_model is model
+
+
+def test_remote_mode_with_stand_in_makes_no_network_call(monkeypatch):
+    from prompts import caching
+
+    def fail(*args, **kwargs):
+        raise AssertionError("CachedContent.create called for a stand-in model")
+
+    monkeypatch.setattr(caching.CachedContent, 'create', fail)
+    model = MockGenerativeModel()
+    cache = PromptCache('mock', mode='remote')
+    assert cache.build_model(model) is model
+    assert cache.mode == 'off'
+
+
+def test_local_mode_wraps_the_injected_model():
+    model = MockGenerativeModel()
+    decision_model = PromptCache('mock', mode='local').build_model(model)
+    assert isinstance(decision_model, LocalCachedModel)
+    assert decision_model.model is model
@@ -0,0 +1,21 @@
+import pytest
+from protocol import MessageDecoder, ProtocolError, HEADER, MSG_FRAME, decode_frame, encode_frame, encode_message
+
+
+def test_frame_round_trips():
+    pixels = bytes(range(4)) * 6
+    [(message_type, payload)] = MessageDecoder().feed(encode_frame(3, 2, pixels))
+    assert message_type == MSG_FRAME
+    assert decode_frame(payload) == (3, 2, pixels)
+
+
+@pytest.mark.parametrize("payload", [b"", b"\x00", b"\x00\xf0\x00"])
+def test_frame_shorter_than_its_header_is_a_protocol_error(payload):
+    [(_, payload)] = MessageDecoder().feed(encode_message(MSG_FRAME, payload))
+    with pytest.raises(ProtocolError):
+        decode_frame(payload)
+
+
+def test_frame_with_missing_pixels_is_a_protocol_error():
+    with pytest.raises(ProtocolError):
+        decode_frame(encode_frame(240, 160, b"\x00" * 100)[HEADER.size:])
@@ -0,0 +1,102 @@
+import os
+import re
+import time
+import threading
+from collections import deque
+
+ENTRY_HEADER = re.compile(r"\n## Thinking (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\n")
+
+
+class ThinkingHistory:
+    """Recent thinking entries kept in memory, persisted as an append-only log with periodic compaction"""
+
+    def __init__(self, path, writer, max_chars=20000, keep_entries=5, log_max_chars=100000):
+        """
+        Entries are trimmed the same way the file used to be: once the
+        history exceeds max_chars, only the last keep_entries are kept.
+        The log on disk is rewritten with just the kept entries once it
+        grows past log_max_chars. Log writes go through the write-behind writer.
+        """
+        self.path = path
+        self.writer = writer
+        self.max_chars = max_chars
+        self.keep_entries = keep_entries
+        self.log_max_chars = log_max_chars
+
+        self.header = ""
+        self.entries = deque()  # (timestamp, text) pairs, oldest first
+        self.total_chars = 0
+        self.log_chars = 0
+        self.lock = threading.Lock()
+
+        self.recover()
+
+    @staticmethod
+    def format_entry(timestamp, text):
+        """Format an entry the way it appears in the prompt and the log"""
+        return f"\n## Thinking {timestamp}\n{text}\n"
+
+    def recover(self):
+        """Rebuild the in-memory history from the log, creating the log if it doesn't exist"""
+        if not os.path.exists(self.path):
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+            self.header = f"# Pokémon Game AI Thinking History\n\nStarted: {timestamp}\n\n"
+            self.writer.write(self.path, self.header)
+            self.log_chars = len(self.header)
+            return
+
+        try:
+            with open(self.path, 'r') as f:
+                content = f.read()
+        except Exception as e:
+            print(f"Error reading thinking history: {e}")
+            return
+
+        # re.split returns [header, timestamp, text, timestamp, text, ...]
+        parts = ENTRY_HEADER.split(content)
+        self.header = parts[0]
+        for i in range(1, len(parts) - 1, 2):
+            text = parts[i + 1]
+            self.add_entry(parts[i], text[:-1] if text.endswith("\n") else text)
+        self.log_chars = len(content)
+
+        if self.log_chars > self.log_max_chars:
+            self.compact()
+
+    def add_entry(self, timestamp, text):
+        """Add an entry in memory, trimming to the most recent ones if the history gets too long"""
+        self.entries.append((timestamp, text))
+        self.total_chars += len(self.format_entry(timestamp, text))
+
+        if self.total_chars > self.max_chars and len(self.entries) > self.keep_entries:
+            while len(self.entries) > self.keep_entries:
+                old_timestamp, old_text = self.entries.popleft()
+                self.total_chars -= len(self.format_entry(old_timestamp, old_text))
+
+    def append(self, text):
+        """Record a new thinking entry in memory and append it to the log"""
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        entry = self.format_entry(timestamp, text)
+
+        with self.lock:
+            self.add_entry(timestamp, text)
+            self.writer.append(self.path, entry)
+            self.log_chars += len(entry)
+
+            if self.log_chars > self.log_max_chars:
+                self.compact()
+
+    def compact(self):
+        """Rewrite the log with only the entries kept in memory"""
+        content = self.render()
+        self.writer.write(self.path, content)
+        self.log_chars = len(content)
+
+    def read(self):
+        """Return the history text used in the prompt"""
+        with self.lock:
+            return self.render()
+
+    def render(self):
+        """Render the header and kept entries (caller holds the lock once running)"""
+        return self.header + "".join(self.format_entry(timestamp, text) for timestamp, text in self.entries)
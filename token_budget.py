@@ -0,0 +1,132 @@
+import re
+import threading
+from prompts import STATIC_PREFIX, IMAGE_TOKENS, estimate_tokens
+
+# Notepad and thinking history are markdown documents made of "## " sections
+SECTION_START = re.compile(r"\n(?=## )")
+
+OMITTED_MARKER = "\n[... older entries omitted ...]\n"
+
+
+def truncate_to_tokens(text, budget, keep_end=True):
+    """Cut text down to roughly budget tokens, keeping its end (newest content) by default"""
+    if estimate_tokens(text) <= budget:
+        return text
+    max_chars = max(0, budget * 4 - len(OMITTED_MARKER))
+    if keep_end:
+        return OMITTED_MARKER + text[len(text) - max_chars:]
+    return text[:max_chars] + OMITTED_MARKER
+
+
+def fit_sections(text, budget):
+    """Fit a sectioned document into budget tokens
+
+    The preamble (title and status before the first section) is kept if it
+    takes at most half the budget; the remainder is filled with the newest
+    sections, and older ones are replaced by a marker.
+    """
+    if estimate_tokens(text) <= budget:
+        return text
+
+    sections = SECTION_START.split(text)
+    preamble, sections = sections[0], sections[1:]
+    if not sections:
+        return truncate_to_tokens(text, budget)
+
+    remaining = budget - estimate_tokens(OMITTED_MARKER)
+    if estimate_tokens(preamble) <= remaining // 2:
+        remaining -= estimate_tokens(preamble)
+    else:
+        preamble = ""
+
+    kept = []
+    for section in reversed(sections):
+        cost = estimate_tokens(section) + 1
+        if cost > remaining:
+            if not kept:
+                # Even the newest section doesn't fit: keep its beginning
+                kept.append(truncate_to_tokens(section, remaining, keep_end=False))
+            break
+        kept.append(section)
+        remaining -= cost
+
+    return preamble + OMITTED_MARKER + "\n".join(reversed(kept))
+
+
+class TokenBudget:
+    """Per-component token budgets for the decision prompt
+
+    Budgets are in estimated tokens for the rules (static prompt prefix),
+    the notepad, the thinking history and the images. Text components are
+    trimmed to their newest sections; images are dropped from the end of
+    the list (the previous frame first) when they don't fit.
+    """
+
+    COMPONENTS = ('rules', 'notepad', 'thinking_history', 'images')
+
+    def __init__(self, budgets, logger=None):
+        self.budgets = budgets
+        self.logger = logger
+        self.rules_tokens = estimate_tokens(STATIC_PREFIX)
+        self.lock = threading.Lock()
+
+        # Metrics
+        self.decisions = 0
+        self.trimmed = {component: 0 for component in self.COMPONENTS}
+        self.total_tokens = {component: 0 for component in self.COMPONENTS}
+
+        if logger and self.rules_tokens > budgets['rules']:
+            logger.warning("Static prompt rules are ~%s tokens, over their %s token budget",
+                           self.rules_tokens, budgets['rules'])
+
+    def fit(self, notepad_content, thinking_history, images):
+        """Trim the prompt components to their budgets
+
+        Returns (notepad, thinking_history, images, usage) where usage maps each
+        component to its estimated token count after trimming.
+        """
+        notepad = fit_sections(notepad_content, self.budgets['notepad'])
+        thinking = fit_sections(thinking_history, self.budgets['thinking_history'])
+
+        # Always send the current frame; add the others while they fit
+        max_images = max(1, self.budgets['images'] // IMAGE_TOKENS)
+        kept_images = images[:max_images]
+
+        usage = {
+            'rules': self.rules_tokens,
+            'notepad': estimate_tokens(notepad),
+            'thinking_history': estimate_tokens(thinking),
+            'images': len(kept_images) * IMAGE_TOKENS,
+        }
+        trimmed = {
+            'rules': False,
+            'notepad': notepad is not notepad_content,
+            'thinking_history': thinking is not thinking_history,
+            'images': len(kept_images) < len(images),
+        }
+
+        with self.lock:
+            self.decisions += 1
+            for component in self.COMPONENTS:
+                self.total_tokens[component] += usage[component]
+                self.trimmed[component] += trimmed[component]
+
+        if self.logger:
+            breakdown = ", ".join(
+                f"{component} {usage[component]}/{self.budgets[component]}"
+                + (" (trimmed)" if trimmed[component] else "")
+                for component in self.COMPONENTS
+            )
+            self.logger.info("Prompt tokens: %s - total %d", breakdown, sum(usage.values()))
+
+        return notepad, thinking, kept_images, usage
+
+    def stats(self):
+        """Return average tokens and trim counts per component"""
+        with self.lock:
+            return {
+                'decisions': self.decisions,
+                'avg_tokens': {component: self.total_tokens[component] / self.decisions if self.decisions else 0.0
+                               for component in self.COMPONENTS},
+                'trimmed': dict(self.trimmed),
+            }
@@ -0,0 +1,149 @@
+import os
+import time
+import threading
+
+
+class WriteBehindWriter:
+    """Background writer that debounces file writes and applies them atomically
+
+    Callers record the latest content for a path (or text to append to it)
+    and return immediately; a writer thread flushes pending operations once
+    a path has been quiet for flush_delay seconds, or at most max_delay
+    seconds after its first pending change.
+    """
+
+    def __init__(self, flush_delay=1.0, max_delay=5.0):
+        self.flush_delay = flush_delay
+        self.max_delay = max_delay
+
+        # path -> list of ('write' | 'append', content); a write supersedes earlier operations
+        self.pending = {}
+        self.first_change = {}
+        self.last_change = {}
+        self.condition = threading.Condition()
+        self.io_lock = threading.Lock()  # Keeps batches for the same path in order
+        self.running = True
+
+        # Counters
+        self.writes_requested = 0
+        self.files_written = 0
+        self.errors = 0
+
+        self.thread = threading.Thread(target=self.run, name="write-behind", daemon=True)
+        self.thread.start()
+
+    def write(self, path, content):
+        """Replace the file's content; content may be str, bytes or a callable producing them at flush time"""
+        with self.condition:
+            self.pending[path] = [('write', content)]
+            self.touch(path)
+
+    def append(self, path, text):
+        """Append text to the file after any pending operations on it"""
+        with self.condition:
+            operations = self.pending.setdefault(path, [])
+            if operations and operations[-1][0] == 'append':
+                operations[-1] = ('append', operations[-1][1] + text)
+            else:
+                operations.append(('append', text))
+            self.touch(path)
+
+    def touch(self, path):
+        """Record a change to a path and wake the writer thread (caller holds the condition)"""
+        now = time.monotonic()
+        self.first_change.setdefault(path, now)
+        self.last_change[path] = now
+        self.writes_requested += 1
+        self.condition.notify()
+
+    def run(self):
+        """Writer thread: flush paths whose debounce delay has expired"""
+        while True:
+            with self.condition:
+                while self.running and not self.due_paths():
+                    self.condition.wait(self.next_timeout())
+                if not self.running and not self.pending:
+                    return
+
+            # Take and apply under io_lock so a concurrent flush() can't reorder writes to a path
+            with self.io_lock:
+                with self.condition:
+                    batch = self.take(self.due_paths() if self.running else list(self.pending))
+                self.apply_batch(batch)
+
+    def due_paths(self):
+        """Return the paths ready to be flushed (caller holds the condition)"""
+        now = time.monotonic()
+        return [path for path in self.pending
+                if now - self.last_change[path] >= self.flush_delay
+                or now - self.first_change[path] >= self.max_delay]
+
+    def next_timeout(self):
+        """Seconds until the next path becomes due (caller holds the condition)"""
+        if not self.pending:
+            return None
+        now = time.monotonic()
+        return max(0.0, min(min(self.last_change[path] + self.flush_delay,
+                                self.first_change[path] + self.max_delay) - now
+                            for path in self.pending))
+
+    def take(self, paths):
+        """Remove and return the pending operations for paths (caller holds the condition)"""
+        batch = []
+        for path in paths:
+            batch.append((path, self.pending.pop(path)))
+            del self.first_change[path]
+            del self.last_change[path]
+        return batch
+
+    def apply_batch(self, batch):
+        """Perform each path's operations in order (caller holds io_lock)"""
+        for path, operations in batch:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                for kind, content in operations:
+                    if callable(content):
+                        content = content()
+                    if kind == 'write':
+                        self.atomic_write(path, content)
+                    else:
+                        with open(path, 'a') as f:
+                            f.write(content)
+                self.files_written += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"Error writing {path}: {e}")
+
+    @staticmethod
+    def atomic_write(path, content):
+        """Write to a temporary file and rename it over the target"""
+        tmp_path = path + '.tmp'
+        mode = 'wb' if isinstance(content, bytes) else 'w'
+        with open(tmp_path, mode) as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def flush(self):
+        """Write all pending operations now, on the calling thread"""
+        with self.io_lock:
+            with self.condition:
+                batch = self.take(list(self.pending))
+            self.apply_batch(batch)
+
+    def close(self):
+        """Flush everything and stop the writer thread"""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join(timeout=10)
+        self.flush()
+
+    def stats(self):
+        """Return writer counters as a dict"""
+        return {
+            'writes_requested': self.writes_requested,
+            'files_written': self.files_written,
+            'errors': self.errors,
+        }